@@ -0,0 +1,42 @@
+CREATE TABLE user_account (
+    id INTEGER NOT NULL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date_of_birth DATE NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('staff', 'personal', 'student')),
+    version INTEGER NOT NULL DEFAULT 1 CHECK (version >= 1),
+    gym_id INTEGER NOT NULL DEFAULT 0 CHECK (gym_id >= 0)
+);
+
+CREATE INDEX user_account_gym_id ON user_account (gym_id);
+
+CREATE VIRTUAL TABLE user_account_fts USING fts5 (
+    username,
+    name,
+    content = 'user_account',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER user_account_fts_insert AFTER INSERT ON user_account
+BEGIN
+    INSERT INTO user_account_fts (rowid, username, name)
+    VALUES (new.id, new.username, new.name);
+END;
+
+CREATE TRIGGER user_account_fts_delete AFTER DELETE ON user_account
+BEGIN
+    INSERT INTO user_account_fts (user_account_fts, rowid, username, name)
+    VALUES ('delete', old.id, old.username, old.name);
+END;
+
+CREATE TRIGGER user_account_fts_update AFTER UPDATE OF username,
+name ON user_account
+BEGIN
+    INSERT INTO user_account_fts (user_account_fts, rowid, username, name)
+    VALUES ('delete', old.id, old.username, old.name);
+    INSERT INTO user_account_fts (rowid, username, name)
+    VALUES (new.id, new.username, new.name);
+END;
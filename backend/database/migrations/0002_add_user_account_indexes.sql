@@ -0,0 +1,8 @@
+-- Indexes of the user listing filters, see UserFilter
+CREATE INDEX user_account_role ON user_account (role);
+
+CREATE INDEX user_account_date_of_birth ON user_account (date_of_birth);
+
+CREATE INDEX user_account_name_lower ON user_account (LOWER(name));
+
+ANALYZE;
@@ -0,0 +1,6 @@
+-- Tombstones of soft deleted users, left out of every read
+ALTER TABLE user_account ADD COLUMN deleted_at TEXT;
+
+-- Only tombstones are indexed, for purges to find the oldest ones
+CREATE INDEX user_account_deleted_at ON user_account (deleted_at)
+WHERE deleted_at IS NOT NULL;
@@ -1,13 +1,15 @@
 import logging
-import sqlite3
-from collections.abc import Generator
-from contextlib import asynccontextmanager, contextmanager
+from contextlib import asynccontextmanager
 
 from starlette.applications import Starlette
+from starlette.middleware import Middleware
 from starlette.responses import PlainTextResponse
 from starlette.routing import Mount, Route
 
 from src.config import APP_NAME, DATABASE_URL
+from src.container import build_container
+from src.controllers import health_controller
+from src.middlewares import ContentNegotiationMiddleware, RequestIdMiddleware
 from src.routes import user_routes
 
 logger = logging.getLogger(APP_NAME)
@@ -17,29 +19,43 @@ async def health_check(_):
     return PlainTextResponse("Server is OK")
 
 
-@contextmanager
-def db_connection(url: str) -> Generator[sqlite3.Connection, None, None]:
-    conn = None
+@asynccontextmanager
+async def lifespan(app: Starlette):
     try:
-        conn = sqlite3.connect(url)
-        yield conn
+        container = build_container(DATABASE_URL)
     except Exception:
-        logger.exception("Couldn't connect to database on %s", url)
+        logger.exception("Couldn't open the users store on %s", DATABASE_URL)
+        raise
+    app.state.APP_NAME = APP_NAME
+    monitor = health_controller.build_monitor(container)
+    monitor.start()
+    # Checked again once warm, instead of at the next monitor run
+    container.start(warmed_up=monitor.run_checks)
+    try:
+        # Handlers get them from request.state
+        yield {"container": container, "monitor": monitor}
     finally:
-        if conn:
-            conn.close()
+        await monitor.stop()
+        await container.stop()
 
 
-@asynccontextmanager
-async def lifespan(app: Starlette):
-    with db_connection(DATABASE_URL) as conn:
-        app.state.APP_NAME = APP_NAME
-        yield {"conn": conn}
-
+# Users are also served as MessagePack, to clients asking for it
+user_middleware = [Middleware(ContentNegotiationMiddleware)]
 
 routes = [
     Route("/health-check", health_check),
-    Mount("/api/v1/users", routes=user_routes),
+    Route("/livez", health_controller.livez),
+    Route("/readyz", health_controller.readyz),
+    Mount("/api/v1/users", routes=user_routes, middleware=user_middleware),
+    Mount(
+        "/api/v1/gyms/{gym_id:int}/users",
+        routes=user_routes,
+        middleware=user_middleware,
+    ),
 ]
 
-app = Starlette(debug=True, routes=routes, lifespan=lifespan)
+middleware = [Middleware(RequestIdMiddleware)]
+
+app = Starlette(
+    debug=True, routes=routes, middleware=middleware, lifespan=lifespan
+)
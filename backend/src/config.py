@@ -3,29 +3,122 @@ import logging.config
 
 from starlette.config import Config
 
+from src.utils.compaction import OffPeakWindow
+from src.utils.dataclass import set_fail_fast
+from src.utils.log import QueuePolicy, start_queue_listener
+
 config = Config(".env")
 
 DATABASE_URL = config("DATABASE_URL")
+DATABASE_READERS = config("DATABASE_READERS", cast=int, default=4)
+DATABASE_POOL_TIMEOUT = config("DATABASE_POOL_TIMEOUT", cast=float, default=5.0)
+DATABASE_MIGRATE = config("DATABASE_MIGRATE", cast=bool, default=True)
+SHARED_USERS_CAPACITY = config(
+    "SHARED_USERS_CAPACITY", cast=int, default=100_000
+)
+SHARED_USERS_SLOT_SIZE = config("SHARED_USERS_SLOT_SIZE", cast=int, default=512)
+HOT_USERS = config("HOT_USERS", cast=int, default=0)
+HOT_USERS_BYTES = config("HOT_USERS_BYTES", cast=int, default=0)
 LOG_LEVEL = config("LOG_LEVEL", default="INFO")
 APP_NAME = config("APP_NAME", default="gym-management")
+BATCH_GET_MAX_IDS = config("BATCH_GET_MAX_IDS", cast=int, default=500)
+SEARCH_DEFAULT_LIMIT = config("SEARCH_DEFAULT_LIMIT", cast=int, default=20)
+SEARCH_MAX_LIMIT = config("SEARCH_MAX_LIMIT", cast=int, default=100)
+MAX_BODY_SIZE = config("MAX_BODY_SIZE", cast=int, default=64 * 1024)
+BULK_MAX_BODY_SIZE = config(
+    "BULK_MAX_BODY_SIZE", cast=int, default=4 * 1024 * 1024
+)
+BULK_MAX_ITEMS = config("BULK_MAX_ITEMS", cast=int, default=100)
+IDEMPOTENCY_MAX_KEYS = config("IDEMPOTENCY_MAX_KEYS", cast=int, default=10_000)
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", cast=float, default=24 * 60 * 60)
+CHANGES_BUFFER_SIZE = config("CHANGES_BUFFER_SIZE", cast=int, default=256)
+CHANGES_HISTORY_SIZE = config("CHANGES_HISTORY_SIZE", cast=int, default=1024)
+CHANGES_HEARTBEAT = config("CHANGES_HEARTBEAT", cast=float, default=15.0)
+CHANGES_MAX_SUBSCRIBERS = config(
+    "CHANGES_MAX_SUBSCRIBERS", cast=int, default=10_000
+)
+# Must be 0, turning the cache off, when several processes write to one
+# SQLite file, since each one only sees its own writes invalidate it
+LIST_CACHE_SIZE = config("LIST_CACHE_SIZE", cast=int, default=256)
+LIST_CACHE_GZIP_MIN_SIZE = config(
+    "LIST_CACHE_GZIP_MIN_SIZE", cast=int, default=1024
+)
+DELETED_USERS_RETENTION = config(
+    "DELETED_USERS_RETENTION", cast=float, default=30 * 24 * 60 * 60
+)
+COMPACTION_WINDOW = config(
+    "COMPACTION_WINDOW", cast=OffPeakWindow.parse, default="2-5"
+)
+COMPACTION_BATCH_SIZE = config("COMPACTION_BATCH_SIZE", cast=int, default=100)
+COMPACTION_PAUSE = config("COMPACTION_PAUSE", cast=float, default=0.5)
+COMPACTION_INTERVAL = config("COMPACTION_INTERVAL", cast=float, default=300.0)
+AUDIT_DIR = config("AUDIT_DIR", default="")
+AUDIT_SEGMENT_SIZE = config(
+    "AUDIT_SEGMENT_SIZE", cast=int, default=64 * 1024 * 1024
+)
+AUDIT_BATCH_SIZE = config("AUDIT_BATCH_SIZE", cast=int, default=256)
+AUDIT_QUEUE_SIZE = config("AUDIT_QUEUE_SIZE", cast=int, default=10_000)
+AUDIT_FSYNC = config("AUDIT_FSYNC", cast=bool, default=True)
+AUDIT_DEFAULT_LIMIT = config("AUDIT_DEFAULT_LIMIT", cast=int, default=50)
+AUDIT_MAX_LIMIT = config("AUDIT_MAX_LIMIT", cast=int, default=500)
+WARMUP_USERS = config("WARMUP_USERS", cast=int, default=10_000)
+HASHING_WORKERS = config("HASHING_WORKERS", cast=int, default=2)
+HEALTH_INTERVAL = config("HEALTH_INTERVAL", cast=float, default=5.0)
+HEALTH_TIMEOUT = config("HEALTH_TIMEOUT", cast=float, default=2.0)
+HEALTH_MAX_LOOP_LAG = config("HEALTH_MAX_LOOP_LAG", cast=float, default=0.5)
+HEALTH_MAX_HASHING_PENDING = config(
+    "HEALTH_MAX_HASHING_PENDING", cast=int, default=64
+)
+VALIDATION_FAIL_FAST = config("VALIDATION_FAIL_FAST", cast=bool, default=False)
+LOG_EXC_RATE = config("LOG_EXC_RATE", cast=float, default=1.0)
+LOG_EXC_BURST = config("LOG_EXC_BURST", cast=int, default=10)
+LOG_FORMAT = config("LOG_FORMAT", default="text")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", cast=int, default=10_000)
+LOG_QUEUE_POLICY = config(
+    "LOG_QUEUE_POLICY", cast=QueuePolicy, default=QueuePolicy.DROP
+)
+
+set_fail_fast(VALIDATION_FAIL_FAST)
 
 
 logging.config.dictConfig(
     {
         "version": 1,
         "formatters": {
-            "debugger": {
-                "format": "%(levelname)s::%(module)s::%(lineno)d::%(message)s",
-            }
+            "text": {
+                "format": "%(levelname)s::%(request_id)s::%(module)s"
+                "::%(lineno)d::%(message)s",
+            },
+            "json": {"()": "src.utils.log.JsonFormatter"},
+        },
+        "filters": {
+            "exc_rate_limit": {
+                "()": "src.utils.log.ExceptionRateLimitFilter",
+                "rate": LOG_EXC_RATE,
+                "burst": LOG_EXC_BURST,
+            },
+            "request_id": {"()": "src.utils.log.RequestIdFilter"},
         },
         "handlers": {
             "debugger": {
                 "class": "logging.StreamHandler",
-                "formatter": "debugger",
+                "formatter": LOG_FORMAT,
                 "level": LOG_LEVEL,
                 "stream": "ext://sys.stdout",
-            }
+                "filters": ["exc_rate_limit"],
+            },
+            "queue": {
+                "()": "src.utils.log.BoundedQueueHandler",
+                "maxsize": LOG_QUEUE_SIZE,
+                "policy": LOG_QUEUE_POLICY,
+                "filters": ["request_id"],
+            },
         },
-        "loggers": {APP_NAME: {"handlers": ["debugger"], "level": LOG_LEVEL}},
+        "loggers": {APP_NAME: {"handlers": ["queue"], "level": LOG_LEVEL}},
     }
 )
+
+# Records are written to stdout on the listener thread, off the event loop
+log_listener = start_queue_listener(
+    logging.getHandlerByName("queue"), logging.getHandlerByName("debugger")
+)
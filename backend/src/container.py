@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import timedelta
+
+from src.config import (
+    APP_NAME,
+    AUDIT_BATCH_SIZE,
+    AUDIT_DIR,
+    AUDIT_FSYNC,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_SEGMENT_SIZE,
+    CHANGES_BUFFER_SIZE,
+    CHANGES_HISTORY_SIZE,
+    COMPACTION_BATCH_SIZE,
+    COMPACTION_INTERVAL,
+    COMPACTION_PAUSE,
+    COMPACTION_WINDOW,
+    DATABASE_MIGRATE,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_READERS,
+    DELETED_USERS_RETENTION,
+    HASHING_WORKERS,
+    HOT_USERS,
+    HOT_USERS_BYTES,
+    IDEMPOTENCY_MAX_KEYS,
+    IDEMPOTENCY_TTL,
+    LIST_CACHE_GZIP_MIN_SIZE,
+    LIST_CACHE_SIZE,
+    SHARED_USERS_CAPACITY,
+    SHARED_USERS_SLOT_SIZE,
+    WARMUP_USERS,
+)
+from src.repositories.factory import UserStore, open_user_store
+from src.repositories.user import UserChange, UserRepository
+from src.services.user import UserService
+from src.utils.audit import AuditLog
+from src.utils.broker import Broker
+from src.utils.compaction import TombstoneCompactor
+from src.utils.encoding import dump_json
+from src.utils.hashing import PasswordHashingPool
+from src.utils.idempotency import IdempotencyStore
+from src.utils.response_cache import RenderedResponseCache
+from src.utils.warmup import WarmUp
+
+
+@dataclass(slots=True)
+class Container:
+    """Everything the user handlers use, built once per app by lifespan.
+
+    Handlers get it from request.state.container. It owns the store, pools,
+    caches and background tasks, started by start and released by stop.
+
+    Attributes:
+        store: Store of the users, opened from DATABASE_URL.
+        service: Service over the store.
+        idempotency: Responses of the creates with an Idempotency-Key.
+        broker: Feed of the user changes.
+        list_cache: Rendered user lists.
+        compactor: Purges the tombstones of deleted users.
+        audit: Log of the user changes, None if AUDIT_DIR is not set.
+        warm_up: Fills the caches and starts the pools before the app is
+            ready.
+    """
+
+    store: UserStore
+    service: UserService
+    idempotency: IdempotencyStore
+    broker: Broker
+    list_cache: RenderedResponseCache
+    compactor: TombstoneCompactor
+    audit: AuditLog | None
+    warm_up: WarmUp
+
+    @property
+    def repo(self) -> UserRepository:
+        return self.store.repo
+
+    def publish_change(self, change: UserChange) -> None:
+        # Serialized once here, then shared by every subscriber
+        self.broker.publish(
+            change.op,
+            dump_json({"user": change.user.to_dict(exclude=["password_hash"])}),
+            topic=str(change.user.gym_id),
+        )
+
+    def start(
+        self, warmed_up: Callable[[], Awaitable[object]] | None = None
+    ) -> None:
+        """Starts the warm-up and the background tasks, from the event loop.
+
+        Args:
+            warmed_up: Awaited once the warm-up finished.
+        """
+        self.warm_up.start(warmed_up)
+        self.compactor.start()
+
+    async def stop(self) -> None:
+        """Stops the background tasks, then closes the pools and store."""
+        await self.warm_up.stop()
+        await self.compactor.stop()
+        if self.audit is not None:
+            # Waits for the queued records, off the event loop
+            await asyncio.to_thread(self.audit.close)
+        self.service.hashing.close()
+        self.store.close()
+
+
+def build_container(url: str) -> Container:
+    """Builds the container with the store picked by the scheme of url.
+
+    Raises:
+        ValueError: If the scheme of the URL is unknown.
+    """
+    logger = logging.getLogger(APP_NAME)
+    store = open_user_store(
+        url,
+        DATABASE_READERS,
+        DATABASE_POOL_TIMEOUT,
+        DATABASE_MIGRATE,
+        SHARED_USERS_CAPACITY,
+        SHARED_USERS_SLOT_SIZE,
+        HOT_USERS,
+        HOT_USERS_BYTES or None,
+        logger,
+    )
+    audit = (
+        AuditLog(
+            AUDIT_DIR,
+            AUDIT_SEGMENT_SIZE,
+            AUDIT_BATCH_SIZE,
+            AUDIT_QUEUE_SIZE,
+            AUDIT_FSYNC,
+            logger,
+        )
+        if AUDIT_DIR
+        else None
+    )
+    container = Container(
+        store,
+        UserService(
+            store.repo, PasswordHashingPool(workers=HASHING_WORKERS), audit
+        ),
+        IdempotencyStore(IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_TTL),
+        Broker(CHANGES_BUFFER_SIZE, CHANGES_HISTORY_SIZE),
+        RenderedResponseCache(LIST_CACHE_SIZE, LIST_CACHE_GZIP_MIN_SIZE),
+        TombstoneCompactor(
+            store.repo.purge_deleted,
+            timedelta(seconds=DELETED_USERS_RETENTION),
+            COMPACTION_WINDOW,
+            COMPACTION_BATCH_SIZE,
+            COMPACTION_PAUSE,
+            COMPACTION_INTERVAL,
+            logger=logger,
+        ),
+        audit,
+        WarmUp(logger=logger),
+    )
+    store.repo.subscribe(container.publish_change)
+    # Kiosk reads are mostly of recent members, so those are loaded first
+    container.warm_up.add(
+        "users", lambda: asyncio.to_thread(store.repo.warm, WARMUP_USERS)
+    )
+    container.warm_up.add(
+        "codecs", lambda: asyncio.to_thread(container.service.warm)
+    )
+    container.warm_up.add("hashing_workers", container.service.hashing.warm)
+    return container
@@ -1,3 +1,4 @@
+from src.controllers import health as health_controller
 from src.controllers import user as user_controller
 
-__all__ = ["user_controller"]
+__all__ = ["health_controller", "user_controller"]
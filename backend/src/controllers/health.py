@@ -0,0 +1,98 @@
+import asyncio
+from http import HTTPStatus
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from src.config import (
+    HEALTH_INTERVAL,
+    HEALTH_MAX_HASHING_PENDING,
+    HEALTH_MAX_LOOP_LAG,
+    HEALTH_TIMEOUT,
+)
+from src.container import Container
+from src.repositories.connection import ConnectionRouter
+from src.repositories.tiered import TieredUserRepository
+from src.repositories.user import UserRepository
+from src.utils.hashing import PasswordHashingPool
+from src.utils.health import HealthCheck, HealthMonitor
+
+
+def repository_check(repo: UserRepository) -> HealthCheck:
+    async def check() -> None:
+        await asyncio.to_thread(repo.ping)
+
+    return check
+
+
+def hashing_check(hashing: PasswordHashingPool) -> HealthCheck:
+    async def check() -> str:
+        pending = hashing.pending
+        if pending > HEALTH_MAX_HASHING_PENDING:
+            raise RuntimeError(f"{pending} passwords waiting to be hashed")
+        return f"{pending} pending"
+
+    return check
+
+
+def tiers_check(repo: TieredUserRepository) -> HealthCheck:
+    """Check reporting the use of the tiers, it never fails."""
+
+    async def check() -> str:
+        stats = repo.stats
+        return (
+            f"hit ratio {stats.hit_ratio:.3f}, "
+            f"{stats.hot_users} hot users in {stats.hot_bytes} bytes, "
+            f"{stats.evictions} evictions, "
+            f"hot {stats.hot_latency * 1e6:.1f}us, "
+            f"cold {stats.cold_latency * 1e6:.1f}us"
+        )
+
+    return check
+
+
+def database_check(db: ConnectionRouter) -> HealthCheck:
+    async def check() -> None:
+        await asyncio.to_thread(db.ping)
+
+    return check
+
+
+def build_monitor(container: Container) -> HealthMonitor:
+    """Builds the monitor of the dependencies of the container."""
+    monitor = HealthMonitor(HEALTH_INTERVAL, HEALTH_TIMEOUT)
+    monitor.add("repository", repository_check(container.repo))
+    monitor.add("hashing", hashing_check(container.service.hashing))
+    if isinstance(container.repo, TieredUserRepository):
+        monitor.add("user_tiers", tiers_check(container.repo))
+    if container.store.db is not None:
+        monitor.add("database", database_check(container.store.db))
+    monitor.add("event_loop", monitor.loop_lag_check(HEALTH_MAX_LOOP_LAG))
+    # Not ready before the caches are warm, so no request takes the slow path
+    monitor.add("warm_up", container.warm_up.check)
+    return monitor
+
+
+async def livez(_: Request) -> JSONResponse:
+    """Tells the process is up, answering from the event loop."""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(req: Request) -> JSONResponse:
+    """Tells if the dependencies are healthy, from the last checks run.
+
+    Answers 503 until every check passed, so no traffic is routed before
+    the first checks ran.
+    """
+    monitor: HealthMonitor = req.state.monitor
+    ready = monitor.ready
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "unavailable",
+            "checks": {
+                name: {"ok": r.ok, "detail": r.detail}
+                for name, r in monitor.results.items()
+            },
+        },
+        HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+    )
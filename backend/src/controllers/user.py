@@ -1,67 +1,724 @@
+import asyncio
 import json
 import logging
+import re
+from collections.abc import AsyncIterator, Iterable, Iterator
 from http import HTTPStatus
 from typing import Any
+from urllib.parse import urlencode
 
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
-from src.config import APP_NAME
-from src.models.user import User
-from src.repositories.user import InMemoryUserRepository
-from src.services.user import UserService, UserServiceValidationError
-
-repo = InMemoryUserRepository()
-service = UserService(repo)
+from src.config import (
+    APP_NAME,
+    AUDIT_DEFAULT_LIMIT,
+    AUDIT_MAX_LIMIT,
+    BATCH_GET_MAX_IDS,
+    BULK_MAX_BODY_SIZE,
+    BULK_MAX_ITEMS,
+    CHANGES_HEARTBEAT,
+    CHANGES_MAX_SUBSCRIBERS,
+    MAX_BODY_SIZE,
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+)
+from src.container import Container
+from src.models.user import User, UserCreateBody, UserInDB
+from src.services.user import (
+    UserService,
+    UserServiceConflictError,
+    UserServiceValidationError,
+)
+from src.utils.broker import Broker, Subscription
+from src.utils.encoding import dump_json, join_json_array
+from src.utils.export import iter_csv
+from src.utils.idempotency import (
+    IdempotencyKeyReusedError,
+    fingerprint,
+)
+from src.utils.media import (
+    JSON,
+    MSGPACK,
+    UnsupportedMediaTypeError,
+    body_media_type,
+    dump_msgpack,
+    load_msgpack,
+    response_media_type,
+)
+from src.utils.request import (
+    BodyTooLargeError,
+    InvalidJsonArrayError,
+    iter_json_array,
+    iter_msgpack_array,
+    read_body,
+)
 
 logger = logging.getLogger(APP_NAME)
 
+_IF_MATCH_RE = re.compile(r'(?:W/)?"(\d+)"')
+_IDEMPOTENCY_KEY_RE = re.compile(r"[\x21-\x7e]{1,255}")
+_USER_FIELDS = User.model_fields()
+_EXPORT_COLUMNS = (
+    "id",
+    "username",
+    "name",
+    "date_of_birth",
+    "role",
+    "gym_id",
+    "version",
+)
+
 
 class MyJsonResponse(JSONResponse):
+    """Renders as JSON, or as MessagePack if the request negotiated it, see
+    ContentNegotiationMiddleware."""
+
     def render(self, content: Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            default=str,
-        ).encode("utf-8")
+        if response_media_type.get() == MSGPACK:
+            self.media_type = MSGPACK
+            return dump_msgpack(content)
+        return dump_json(content).encode("utf-8")
+
+
+def get_container(req: Request) -> Container:
+    """Returns the container built by the app lifespan."""
+    return req.state.container
+
+
+def path_gym_id(req: Request) -> int | None:
+    """Returns the gym of the request path, None if it is not gym scoped."""
+    return req.path_params.get("gym_id")
+
+
+def request_actor(req: Request) -> str | None:
+    """Returns who makes the request, from the X-Actor header."""
+    return req.headers.get("x-actor")
+
+
+def user_etag(user: UserInDB) -> str:
+    return f'"{user.version}"'
+
+
+def parse_if_match(req: Request) -> int | None:
+    """Returns the user version required by the If-Match header.
+
+    Returns:
+        The expected version or None if there is no precondition.
+
+    Raises:
+        HTTPException: If the header is not "*" or a single version ETag.
+    """
+    if_match = req.headers.get("if-match")
+    if if_match is None or if_match.strip() == "*":
+        return None
+    match = _IF_MATCH_RE.fullmatch(if_match.strip())
+    if match is None:
+        raise HTTPException(
+            status_code=HTTPStatus.PRECONDITION_FAILED,
+            detail="If-Match must be a single user version ETag",
+        )
+    return int(match.group(1))
+
+
+def precondition_failed(
+    user_id: int, e: UserServiceConflictError
+) -> JSONResponse:
+    return MyJsonResponse(
+        {
+            "error": f"User with id {user_id} was modified",
+            "version": e.current_version,
+        },
+        HTTPStatus.PRECONDITION_FAILED,
+        headers={"ETag": f'"{e.current_version}"'},
+    )
+
+
+def validation_errors(e: UserServiceValidationError) -> list[Any]:
+    if e.validation_error:
+        return e.validation_error.to_dict()["errors"]  # type: ignore
+    return [{"name": "body", "value": "missing keys", "reason": e.body_err}]
+
+
+def unsupported_media_type(e: UnsupportedMediaTypeError) -> JSONResponse:
+    return MyJsonResponse(
+        {
+            "errors": [
+                {
+                    "name": "Content-Type",
+                    "value": e.media_type,
+                    "reason": str(e),
+                }
+            ]
+        },
+        HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+    )
+
+
+def decode_request_body(req: Request, body: bytes) -> Any:
+    """Decodes a MessagePack body, JSON ones are left to the service.
+
+    Returns:
+        The decoded object, or body as is if it is JSON.
 
+    Raises:
+        UnsupportedMediaTypeError: If the Content-Type can't be decoded.
+        ValueError: If the body is not valid MessagePack.
+    """
+    if body_media_type(req.headers.get("content-type")) == MSGPACK:
+        return load_msgpack(body)
+    return body
 
-async def create_user(req: Request) -> JSONResponse:
+
+def body_too_large(e: BodyTooLargeError) -> JSONResponse:
+    return MyJsonResponse(
+        {
+            "errors": [
+                {
+                    "name": "body",
+                    "value": e.limit,
+                    "reason": f"body must be at most {e.limit} bytes",
+                }
+            ]
+        },
+        HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+    )
+
+
+async def create_user_response(
+    service: UserService, body: bytes, gym_id: int, actor: str | None = None
+) -> JSONResponse:
     try:
-        body = await req.json()
-        new_user = service.create_user(body)
+        new_user = await service.acreate_user(body, gym_id, actor)
         return_user = User(**new_user.to_dict(exclude=["password_hash"]))
         return MyJsonResponse(
-            {"user": return_user.to_dict()}, HTTPStatus.CREATED
+            {"user": return_user.to_dict()},
+            HTTPStatus.CREATED,
+            headers={"ETag": user_etag(new_user)},
         )
     except UserServiceValidationError as e:
-        error_body = {
+        return MyJsonResponse(
+            {"errors": validation_errors(e)}, HTTPStatus.BAD_REQUEST
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail="Error creating user",
+        ) from e
+
+
+def as_negotiated(response: Response) -> Response:
+    """Re-encodes a stored response in the format the request negotiated.
+
+    A stored response keeps the format of the request that ran it. Both
+    formats carry the same values, so a retry in the other format gets the
+    same response, without running again.
+    """
+    media_type = response_media_type.get()
+    stored_type = response.headers.get("content-type", "").partition(";")[0]
+    if stored_type == media_type or stored_type not in (JSON, MSGPACK):
+        return response
+    if stored_type == MSGPACK:
+        content = load_msgpack(bytes(response.body))
+    else:
+        content = json.loads(response.body)
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    return MyJsonResponse(content, response.status_code, headers=headers)
+
+
+def invalid_idempotency_key(key: str, reason: str, status: int) -> JSONResponse:
+    return MyJsonResponse(
+        {
             "errors": [
-                {"name": "body", "value": "missing keys", "reason": e.body_err}
+                {"name": "Idempotency-Key", "value": key, "reason": reason}
             ]
+        },
+        status,
+    )
+
+
+async def create_user(req: Request) -> Response:
+    """Creates a user, once per Idempotency-Key header if there is one."""
+    try:
+        raw_body = await read_body(req, MAX_BODY_SIZE)
+        body = decode_request_body(req, raw_body)
+    except BodyTooLargeError as e:
+        return body_too_large(e)
+    except UnsupportedMediaTypeError as e:
+        return unsupported_media_type(e)
+    except ValueError as e:
+        return invalid_body_response(None, str(e))
+    container = get_container(req)
+    gym_id = path_gym_id(req) or 0
+    actor = request_actor(req)
+    key = req.headers.get("idempotency-key")
+    if key is None:
+        return await create_user_response(
+            container.service, body, gym_id, actor
+        )
+    if not _IDEMPOTENCY_KEY_RE.fullmatch(key):
+        return invalid_idempotency_key(
+            key,
+            "Idempotency-Key must have 1 to 255 visible ASCII characters",
+            HTTPStatus.BAD_REQUEST,
+        )
+
+    async def handler() -> Response:
+        return await create_user_response(
+            container.service, body, gym_id, actor
+        )
+
+    request_fingerprint = fingerprint(str(gym_id).encode(), raw_body)
+    try:
+        return as_negotiated(
+            await container.idempotency.run(key, request_fingerprint, handler)
+        )
+    except IdempotencyKeyReusedError:
+        return invalid_idempotency_key(
+            key,
+            "Idempotency-Key was already used with another body",
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+        )
+
+
+def invalid_body_response(value: Any, reason: str) -> JSONResponse:
+    return MyJsonResponse(
+        {"errors": [{"name": "body", "value": value, "reason": reason}]},
+        HTTPStatus.BAD_REQUEST,
+    )
+
+
+async def parse_bulk_body(
+    req: Request, service: UserService
+) -> list[UserCreateBody | UserServiceValidationError]:
+    """Validates the users of a bulk create one by one as they stream in.
+
+    Raises:
+        BodyTooLargeError: If the body is larger than BULK_MAX_BODY_SIZE.
+        InvalidJsonArrayError: If the body is not a JSON or MessagePack
+            array of at most BULK_MAX_ITEMS items.
+        UnsupportedMediaTypeError: If the Content-Type can't be decoded.
+    """
+    items: list[UserCreateBody | UserServiceValidationError] = []
+    if body_media_type(req.headers.get("content-type")) == MSGPACK:
+        bodies = iter_msgpack_array(req, BULK_MAX_BODY_SIZE, MAX_BODY_SIZE)
+    else:
+        bodies = iter_json_array(req, BULK_MAX_BODY_SIZE, MAX_BODY_SIZE)
+    async for body in bodies:
+        if len(items) == BULK_MAX_ITEMS:
+            raise InvalidJsonArrayError(
+                len(items), f"at most {BULK_MAX_ITEMS} users can be created"
+            )
+        try:
+            items.append(service.parse_create_body(body))
+        except UserServiceValidationError as e:
+            items.append(e)
+    return items
+
+
+async def bulk_create_result(
+    service: UserService,
+    index: int,
+    item: UserCreateBody | UserServiceValidationError,
+    gym_id: int,
+    actor: str | None = None,
+) -> dict[str, Any]:
+    if isinstance(item, UserServiceValidationError):
+        return {
+            "index": index,
+            "status": HTTPStatus.BAD_REQUEST,
+            "errors": validation_errors(item),
+        }
+    try:
+        user = await service.acreate_user(item, gym_id, actor)
+    except UserServiceValidationError as e:
+        return await bulk_create_result(service, index, e, gym_id)
+    except Exception as e:
+        logger.exception(e)
+        return {
+            "index": index,
+            "status": HTTPStatus.INTERNAL_SERVER_ERROR,
+            "errors": [
+                {
+                    "name": "body",
+                    "value": index,
+                    "reason": "Error creating user",
+                }
+            ],
         }
-        if e.validation_error:
-            error_body["errors"] = e.validation_error.to_dict()["errors"]  # type: ignore
-        return MyJsonResponse(error_body, HTTPStatus.BAD_REQUEST)
+    return {
+        "index": index,
+        "status": HTTPStatus.CREATED,
+        "user": User.from_db_model(user).to_dict(),
+    }
+
+
+async def bulk_create_users(req: Request) -> JSONResponse:
+    """Creates the users of a JSON or MessagePack array body.
+
+    Nothing is created unless the whole array is well formed. Then each
+    valid item is created and the response tells the outcome of each one,
+    with status 201 if all were created, 400 if none was and 207 otherwise.
+    """
+    service = get_container(req).service
+    try:
+        items = await parse_bulk_body(req, service)
+    except BodyTooLargeError as e:
+        return body_too_large(e)
+    except InvalidJsonArrayError as e:
+        return invalid_body_response(e.index, e.reason)
+    except UnsupportedMediaTypeError as e:
+        return unsupported_media_type(e)
+    if not items:
+        return invalid_body_response([], "at least one user is required")
+    gym_id = path_gym_id(req) or 0
+    actor = request_actor(req)
+    results = [
+        await bulk_create_result(service, i, item, gym_id, actor)
+        for i, item in enumerate(items)
+    ]
+    created = sum(r["status"] == HTTPStatus.CREATED for r in results)
+    if created == len(results):
+        status = HTTPStatus.CREATED
+    elif created:
+        status = HTTPStatus.MULTI_STATUS
+    else:
+        status = HTTPStatus.BAD_REQUEST
+    return MyJsonResponse({"results": results}, status)
+
+
+class InvalidUserIdsError(ValueError):
+    value: Any
+    reason: str
+
+    def __init__(self, value: Any, reason: str) -> None:
+        super().__init__(reason)
+        self.value = value
+        self.reason = reason
+
+
+def parse_user_ids(values: Iterable[Any]) -> list[int]:
+    """Parses the ids of a batch get, dropping duplicates but keeping order.
+
+    Query values may hold several comma separated ids.
+
+    Raises:
+        InvalidUserIdsError: If an id is not an integer or there are more
+            than BATCH_GET_MAX_IDS ids.
+    """
+    ids: dict[int, None] = {}
+    for value in values:
+        parts = value.split(",") if isinstance(value, str) else (value,)
+        for part in parts:
+            if isinstance(part, str):
+                try:
+                    part = int(part)
+                except ValueError:
+                    raise InvalidUserIdsError(
+                        part, "ids must be integers"
+                    ) from None
+            elif isinstance(part, bool) or not isinstance(part, int):
+                raise InvalidUserIdsError(part, "ids must be integers")
+            ids[part] = None
+    if not ids:
+        raise InvalidUserIdsError([], "at least one id is required")
+    if len(ids) > BATCH_GET_MAX_IDS:
+        raise InvalidUserIdsError(
+            len(ids), f"at most {BATCH_GET_MAX_IDS} ids can be requested"
+        )
+    return list(ids)
+
+
+def users_response(
+    service: UserService, users: Iterable[UserInDB], **extra: Any
+) -> Response:
+    """Renders users into a {"users": [...]} response.
+
+    JSON responses join the fragments kept by the store, so only stale ones
+    are encoded, while MessagePack ones encode every user.
+
+    Args:
+        service: Service of the users, to encode them.
+        users: The users, in order.
+        **extra: Other members of the response object, encoded after users.
+    """
+    if response_media_type.get() == MSGPACK:
+        return MyJsonResponse(
+            {
+                "users": [u.to_dict(exclude=["password_hash"]) for u in users],
+                **extra,
+            }
+        )
+    body = b'{"users":' + join_json_array(service.encode_users(users))
+    for name, value in extra.items():
+        body += f",{dump_json(name)}:{dump_json(value)}".encode()
+    return Response(body + b"}", media_type="application/json")
+
+
+def batch_get_response(
+    service: UserService,
+    user_ids: list[int],
+    gym_id: int | None,
+    fields: list[str] | None = None,
+) -> Response:
+    users = service.find_users_by_ids(user_ids, gym_id)
+    if fields is not None:
+        return MyJsonResponse(
+            {
+                "users": [
+                    {f: getattr(users[i], f) for f in fields}
+                    for i in user_ids
+                    if i in users
+                ],
+                "missing": [i for i in user_ids if i not in users],
+            }
+        )
+    return users_response(
+        service,
+        (users[i] for i in user_ids if i in users),
+        missing=[i for i in user_ids if i not in users],
+    )
+
+
+def invalid_ids_response(e: InvalidUserIdsError) -> JSONResponse:
+    return MyJsonResponse(
+        {"errors": [{"name": "ids", "value": e.value, "reason": e.reason}]},
+        HTTPStatus.BAD_REQUEST,
+    )
+
+
+class InvalidFieldsError(ValueError):
+    value: Any
+
+    def __init__(self, value: Any) -> None:
+        super().__init__(f"fields must be some of {', '.join(_USER_FIELDS)}")
+        self.value = value
+
+
+def parse_fields(req: Request) -> list[str] | None:
+    """Parses the comma separated fields param of a sparse fieldset.
+
+    Returns:
+        The distinct fields in order, None to return all of them.
+
+    Raises:
+        InvalidFieldsError: If a field is not a User field or there is none.
+    """
+    raw_fields = req.query_params.get("fields")
+    if raw_fields is None:
+        return None
+    names = [f.strip() for f in raw_fields.split(",")]
+    fields = list(dict.fromkeys(f for f in names if f))
+    if not fields or not set(fields).issubset(_USER_FIELDS):
+        raise InvalidFieldsError(raw_fields)
+    return fields
+
+
+def invalid_fields_response(e: InvalidFieldsError) -> JSONResponse:
+    return MyJsonResponse(
+        {"errors": [{"name": "fields", "value": e.value, "reason": str(e)}]},
+        HTTPStatus.BAD_REQUEST,
+    )
+
+
+def render_users(req: Request, service: UserService) -> Response:
+    if "ids" in req.query_params:
+        try:
+            user_ids = parse_user_ids(req.query_params.getlist("ids"))
+            fields = parse_fields(req)
+        except InvalidUserIdsError as e:
+            return invalid_ids_response(e)
+        except InvalidFieldsError as e:
+            return invalid_fields_response(e)
+        try:
+            return batch_get_response(
+                service, user_ids, path_gym_id(req), fields
+            )
+        except Exception as e:
+            logger.exception(e)
+            raise HTTPException(
+                status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+                detail="Error getting users by ids",
+            ) from e
+    try:
+        where = service.parse_filter(req.query_params)
+        fields = parse_fields(req)
+    except UserServiceValidationError as e:
+        return MyJsonResponse(
+            {"errors": validation_errors(e)}, HTTPStatus.BAD_REQUEST
+        )
+    except InvalidFieldsError as e:
+        return invalid_fields_response(e)
+    try:
+        if fields is not None:
+            # Only the requested columns are read and serialized
+            users = service.find_all_users_fields(
+                fields, path_gym_id(req), where
+            )
+            return MyJsonResponse({"users": users})
+        return users_response(
+            service, service.find_all_users(path_gym_id(req), where)
+        )
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-            detail="Error creating user",
+            detail="Error listing user",
+        ) from e
+
+
+async def list_users(req: Request) -> Response:
+    """Lists the users, rendered once per repository generation.
+
+    Until a mutation changes the generation, the same query is served from
+    the cached body, or with 304 to clients sending its ETag.
+    """
+    # Got before rendering, so a body is never older than its generation
+    container = get_container(req)
+    generation = container.repo.generation
+    query = urlencode(sorted(req.query_params.multi_items()))
+    # Each format is its own representation, with its own ETag
+    key = f"{response_media_type.get()} {req.url.path}?{query}"
+    return container.list_cache.respond(
+        generation,
+        key,
+        req.headers,
+        lambda: render_users(req, container.service),
+    )
+
+
+def export_rows(
+    users: Iterable[UserInDB], columns: list[str]
+) -> Iterator[list[Any]]:
+    try:
+        for user in users:
+            yield [getattr(user, c) for c in columns]
+    except Exception:
+        # The response already started, so the stream is just cut
+        logger.exception("Error exporting users")
+        raise
+
+
+async def export_users(req: Request) -> Response:
+    """Streams the users as CSV, by id.
+
+    Takes the filters of list_users and a comma separated list of columns,
+    all the user fields by default. Users are fetched in batches while
+    the response is sent, so memory use does not grow with their number.
+    """
+    service = get_container(req).service
+    try:
+        where = service.parse_filter(req.query_params)
+    except UserServiceValidationError as e:
+        return MyJsonResponse(
+            {"errors": validation_errors(e)}, HTTPStatus.BAD_REQUEST
+        )
+    raw_columns = req.query_params.get("columns")
+    columns = (
+        list(_EXPORT_COLUMNS)
+        if raw_columns is None
+        else [c.strip() for c in raw_columns.split(",")]
+    )
+    distinct = set(columns)
+    if not distinct.issubset(_EXPORT_COLUMNS) or len(distinct) < len(columns):
+        return MyJsonResponse(
+            {
+                "errors": [
+                    {
+                        "name": "columns",
+                        "value": raw_columns,
+                        "reason": "columns must be distinct, out of "
+                        + ", ".join(_EXPORT_COLUMNS),
+                    }
+                ]
+            },
+            HTTPStatus.BAD_REQUEST,
+        )
+    users = service.iter_users(path_gym_id(req), where)
+    return StreamingResponse(
+        iter_csv(columns, export_rows(users, columns)),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="users.csv"'},
+    )
+
+
+async def batch_get_users(req: Request) -> Response:
+    try:
+        body = decode_request_body(req, await read_body(req, MAX_BODY_SIZE))
+        if isinstance(body, bytes):
+            body = json.loads(body)
+    except BodyTooLargeError as e:
+        return body_too_large(e)
+    except UnsupportedMediaTypeError as e:
+        return unsupported_media_type(e)
+    except ValueError:
+        body = None
+    ids = body.get("ids") if isinstance(body, dict) else None
+    if not isinstance(ids, list):
+        return MyJsonResponse(
+            {
+                "errors": [
+                    {
+                        "name": "body",
+                        "value": "ids",
+                        "reason": 'body must be an object like {"ids": [...]}',
+                    }
+                ]
+            },
+            HTTPStatus.BAD_REQUEST,
+        )
+    try:
+        user_ids = parse_user_ids(ids)
+    except InvalidUserIdsError as e:
+        return invalid_ids_response(e)
+    try:
+        return batch_get_response(
+            get_container(req).service, user_ids, path_gym_id(req)
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail="Error getting users by ids",
         ) from e
 
 
-async def list_users(_: Request) -> JSONResponse:
+async def search_users(req: Request) -> JSONResponse:
+    query = req.query_params.get("q", "").strip()
+    if not query:
+        return MyJsonResponse(
+            {
+                "errors": [
+                    {"name": "q", "value": query, "reason": "q is required"}
+                ]
+            },
+            HTTPStatus.BAD_REQUEST,
+        )
+    raw_limit = req.query_params.get("limit", str(SEARCH_DEFAULT_LIMIT))
+    try:
+        limit = int(raw_limit)
+        if not 1 <= limit <= SEARCH_MAX_LIMIT:
+            raise ValueError(raw_limit)
+    except ValueError:
+        return invalid_query_param(
+            "limit",
+            raw_limit,
+            f"limit must be an integer between 1 and {SEARCH_MAX_LIMIT}",
+        )
     try:
         return MyJsonResponse(
             {
                 "users": [
                     u.to_dict(exclude=["password_hash"])
-                    for u in service.find_all_users()
+                    for u in get_container(req).service.search_users(
+                        query, limit, path_gym_id(req)
+                    )
                 ]
             }
         )
@@ -69,8 +726,99 @@ async def list_users(_: Request) -> JSONResponse:
         logger.exception(e)
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
-            detail="Error listing user",
+            detail="Error searching users",
+        ) from e
+
+
+async def change_stream(
+    broker: Broker, last_event_id: int | None, gym_id: int | None = None
+) -> AsyncIterator[bytes]:
+    """Streams the user changes as Server-Sent Events.
+
+    The events waiting are sent together, and a comment is sent when there
+    were no events for CHANGES_HEARTBEAT seconds, so dead connections are
+    noticed. The stream ends when the subscriber is evicted for being too
+    slow, and the client resumes from its Last-Event-ID.
+
+    Only the changes of the users of gym_id are sent, if given.
+    """
+    subscription: Subscription | None = None
+    try:
+        topic = None if gym_id is None else str(gym_id)
+        subscription = broker.subscribe(last_event_id, topic)
+        yield b"retry: 1000\n\n"
+        while True:
+            try:
+                async with asyncio.timeout(CHANGES_HEARTBEAT):
+                    events = await subscription.get()
+            except TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if not events:
+                break
+            yield b"".join(e.frame for e in events)
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+
+async def user_changes(req: Request) -> Response:
+    raw_last_event_id = req.headers.get("last-event-id")
+    last_event_id = None
+    if raw_last_event_id is not None:
+        if not raw_last_event_id.isdigit():
+            return MyJsonResponse(
+                {
+                    "errors": [
+                        {
+                            "name": "Last-Event-ID",
+                            "value": raw_last_event_id,
+                            "reason": "Last-Event-ID must be an event id",
+                        }
+                    ]
+                },
+                HTTPStatus.BAD_REQUEST,
+            )
+        last_event_id = int(raw_last_event_id)
+    broker = get_container(req).broker
+    if len(broker) >= CHANGES_MAX_SUBSCRIBERS:
+        return MyJsonResponse(
+            {"error": "Too many change feed subscribers"},
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "5"},
+        )
+    return StreamingResponse(
+        change_stream(broker, last_event_id, path_gym_id(req)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def get_user_fields(
+    req: Request, user_id: int, fields: list[str]
+) -> JSONResponse:
+    # The version is always read, for the ETag
+    read = fields if "version" in fields else [*fields, "version"]
+    try:
+        user = await get_container(req).service.afind_user_fields_by_id(
+            user_id, read, path_gym_id(req)
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail=f"Error getting user with id {user_id}",
         ) from e
+    if user is None:
+        return MyJsonResponse(
+            {"error": f"User with id {user_id} Not found"},
+            HTTPStatus.NOT_FOUND,
+        )
+    etag = f'"{user["version"]}"'
+    # Shared with concurrent requests, so it is copied instead of mutated
+    return MyJsonResponse(
+        {"user": {f: user[f] for f in fields}}, headers={"ETag": etag}
+    )
 
 
 async def get_user(req: Request) -> JSONResponse:
@@ -81,14 +829,25 @@ async def get_user(req: Request) -> JSONResponse:
             detail="path param user_id is required to get user",
         )
     try:
-        user = service.find_user_by_id(int(user_id))
+        fields = parse_fields(req)
+    except InvalidFieldsError as e:
+        return invalid_fields_response(e)
+    if fields is not None:
+        return await get_user_fields(req, int(user_id), fields)
+    try:
+        user = await get_container(req).service.afind_user_by_id(
+            int(user_id), path_gym_id(req)
+        )
         if user is None:
             return MyJsonResponse(
                 {"error": f"User with id {user_id} Not found"},
                 HTTPStatus.NOT_FOUND,
             )
         response_user = User(**user.to_dict(exclude=["password_hash"]))
-        return MyJsonResponse({"user": response_user.to_dict()})
+        return MyJsonResponse(
+            {"user": response_user.to_dict()},
+            headers={"ETag": user_etag(user)},
+        )
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
@@ -104,14 +863,19 @@ async def delete_user(req: Request) -> Response:
             status_code=HTTPStatus.BAD_REQUEST,
             detail="path param user_id is required to delete user",
         )
+    expected_version = parse_if_match(req)
     try:
-        user = service.delete_user_by_id(int(user_id))
+        user = get_container(req).service.delete_user_by_id(
+            int(user_id), expected_version, path_gym_id(req), request_actor(req)
+        )
         if user is None:
             return MyJsonResponse(
                 {"error": f"User with id {user_id} Not found"},
                 HTTPStatus.NOT_FOUND,
             )
         return Response(status_code=HTTPStatus.NO_CONTENT)
+    except UserServiceConflictError as e:
+        return precondition_failed(user_id, e)
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
@@ -120,6 +884,85 @@ async def delete_user(req: Request) -> Response:
         ) from e
 
 
+async def restore_user(req: Request) -> JSONResponse:
+    """Restores a deleted user, an admin operation."""
+    user_id = int(req.path_params["user_id"])
+    try:
+        user = get_container(req).service.restore_user_by_id(
+            user_id, path_gym_id(req), request_actor(req)
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail=f"Error restoring user with id {user_id}",
+        ) from e
+    if user is None:
+        return MyJsonResponse(
+            {"error": f"Deleted user with id {user_id} Not found"},
+            HTTPStatus.NOT_FOUND,
+        )
+    return MyJsonResponse(
+        {"user": User.from_db_model(user).to_dict()},
+        headers={"ETag": user_etag(user)},
+    )
+
+
+def invalid_query_param(name: str, value: str, reason: str) -> JSONResponse:
+    return MyJsonResponse(
+        {"errors": [{"name": name, "value": value, "reason": reason}]},
+        HTTPStatus.BAD_REQUEST,
+    )
+
+
+async def user_audit(req: Request) -> JSONResponse:
+    """Lists the audit records of a user, newest first.
+
+    Pages are limit records long, the next one is read passing the next
+    cursor of the response as before, until it is null.
+    """
+    user_id = int(req.path_params["user_id"])
+    raw_limit = req.query_params.get("limit", str(AUDIT_DEFAULT_LIMIT))
+    try:
+        limit = int(raw_limit)
+        if not 1 <= limit <= AUDIT_MAX_LIMIT:
+            raise ValueError(raw_limit)
+    except ValueError:
+        return invalid_query_param(
+            "limit",
+            raw_limit,
+            f"limit must be an integer between 1 and {AUDIT_MAX_LIMIT}",
+        )
+    raw_before = req.query_params.get("before")
+    if raw_before is not None and not raw_before.isdigit():
+        return invalid_query_param(
+            "before", raw_before, "before must be a next cursor"
+        )
+    before = None if raw_before is None else int(raw_before)
+    try:
+        # One more record than returned tells if there is a next page
+        records = await asyncio.to_thread(
+            get_container(req).service.user_audit_records,
+            user_id,
+            limit + 1,
+            before,
+            path_gym_id(req),
+        )
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+            detail=f"Error getting audit records of user with id {user_id}",
+        ) from e
+    page = records[:limit]
+    return MyJsonResponse(
+        {
+            "records": [r.to_dict() for r in page],
+            "next": page[-1].seq if len(records) > limit else None,
+        }
+    )
+
+
 async def update_user(req: Request) -> JSONResponse:
     user_id = req.path_params.get("user_id", None)
     if user_id is None:
@@ -127,25 +970,39 @@ async def update_user(req: Request) -> JSONResponse:
             status_code=HTTPStatus.BAD_REQUEST,
             detail="path param user_id is required to update user",
         )
+    expected_version = parse_if_match(req)
+    try:
+        body = decode_request_body(req, await read_body(req, MAX_BODY_SIZE))
+    except BodyTooLargeError as e:
+        return body_too_large(e)
+    except UnsupportedMediaTypeError as e:
+        return unsupported_media_type(e)
+    except ValueError as e:
+        return invalid_body_response(None, str(e))
     try:
-        body = await req.json()
-        updated_user = service.update_user(user_id, body)
+        updated_user = get_container(req).service.update_user(
+            user_id,
+            body,
+            expected_version,
+            path_gym_id(req),
+            request_actor(req),
+        )
         if updated_user is None:
             return MyJsonResponse(
                 {"error": f"User with id {user_id} Not found"},
                 HTTPStatus.NOT_FOUND,
             )
         return_user = User(**updated_user.to_dict(exclude=["password_hash"]))
-        return MyJsonResponse({"user": return_user.to_dict()})
+        return MyJsonResponse(
+            {"user": return_user.to_dict()},
+            headers={"ETag": user_etag(updated_user)},
+        )
+    except UserServiceConflictError as e:
+        return precondition_failed(user_id, e)
     except UserServiceValidationError as e:
-        error_body = {
-            "errors": [
-                {"name": "body", "value": "missing keys", "reason": e.body_err}
-            ]
-        }
-        if e.validation_error:
-            error_body["errors"] = e.validation_error.to_dict()["errors"]  # type: ignore
-        return MyJsonResponse(error_body, HTTPStatus.BAD_REQUEST)
+        return MyJsonResponse(
+            {"errors": validation_errors(e)}, HTTPStatus.BAD_REQUEST
+        )
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
@@ -0,0 +1,4 @@
+from src.middlewares.content_negotiation import ContentNegotiationMiddleware
+from src.middlewares.request_id import RequestIdMiddleware
+
+__all__ = ["ContentNegotiationMiddleware", "RequestIdMiddleware"]
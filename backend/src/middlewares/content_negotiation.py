@@ -0,0 +1,39 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.media import negotiate, response_media_type
+
+
+class ContentNegotiationMiddleware:
+    """Picks the format of the responses to a request from its Accept header.
+
+    The format is set in response_media_type while the request is handled,
+    for the responses to render in, and Accept is added to the Vary header
+    of the response, so caches keep the formats apart.
+    """
+
+    app: ASGIApp
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        media_type = negotiate(Headers(scope=scope).get("accept"))
+
+        async def send_with_vary(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                MutableHeaders(scope=message).add_vary_header("Accept")
+            await send(message)
+
+        token = response_media_type.set(media_type)
+        try:
+            await self.app(scope, receive, send_with_vary)
+        finally:
+            response_media_type.reset(token)
@@ -0,0 +1,47 @@
+import re
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils.log import request_id
+
+_REQUEST_ID_RE = re.compile(r"[\w.:-]{1,128}", re.ASCII)
+
+
+class RequestIdMiddleware:
+    """Gives every request a correlation id for its log records.
+
+    The id is taken from the request header when it is a safe value, or
+    generated otherwise, and is sent back in the same response header.
+    """
+
+    app: ASGIApp
+    header: str
+
+    def __init__(self, app: ASGIApp, header: str = "X-Request-ID") -> None:
+        self.app = app
+        self.header = header
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = Headers(scope=scope).get(self.header)
+        if value is None or not _REQUEST_ID_RE.fullmatch(value):
+            value = uuid.uuid4().hex
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                MutableHeaders(scope=message)[self.header] = value
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
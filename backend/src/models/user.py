@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import string
+from dataclasses import dataclass, field
 from datetime import UTC, date, datetime
 from typing import Any, ClassVar, Literal
 
@@ -105,7 +106,22 @@ class UserBase(SerializeDataclass):
 
 @validate_dataclass
 @dataclass
-class UserCreate(UserBase):
+class UserInGym(UserBase):
+    """Properties of users bound to a gym branch."""
+
+    gym_id: int = field(default=0, kw_only=True)
+
+    def __validate_gym_id__(self, name: str, value: Any) -> bool:
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise FieldError(
+                name, value, "gym_id must be a non-negative integer"
+            )
+        return True
+
+
+@validate_dataclass
+@dataclass
+class UserCreate(UserInGym):
     """Properties to receive on User creation."""
 
     password_hash: str
@@ -138,10 +154,16 @@ class UserUpdate(UserBase):
 
 @validate_dataclass
 @dataclass
-class UserInDBBase(UserBase):
+class UserInDBBase(UserInGym):
     """Properties shared by models stored in Database"""
 
     id: int
+    version: int = field(default=1, kw_only=True)
+
+    def __validate_version__(self, name: str, value: Any) -> bool:
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise FieldError(name, value, "version must be a positive integer")
+        return True
 
 
 @validate_dataclass
@@ -166,3 +188,74 @@ class UserInDB(UserInDBBase):
         cls, user_id: int, user_create: UserCreate
     ) -> UserInDB:
         return cls(id=user_id, **user_create.to_dict())
+
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def ascii_lower(text: str) -> str:
+    """Lower cases ASCII letters only, as the SQLite lower() function."""
+    return text.translate(_ASCII_LOWER)
+
+
+@validate_dataclass
+@dataclass
+class UserFilter(SerializeDataclass):
+    """Conditions users must meet to be listed, all optional.
+
+    Attributes:
+        role: Role of the users.
+        name: Prefix of the names, ignoring the case of ASCII letters.
+        born_from: First date of birth, inclusive.
+        born_to: Last date of birth, inclusive.
+    """
+
+    role: UserRole | None = None
+    name: str | None = None
+    born_from: date | None = None
+    born_to: date | None = None
+
+    def __validate_role__(self, name: str, value: Any) -> bool:
+        if value is None:
+            return True
+        if isinstance(value, str) and value.lower() in UserBase.VALID_ROLES:
+            self.role = value.lower()  # type: ignore[assignment]
+            return True
+        raise FieldError(
+            name,
+            value,
+            f"User role must be one of the: {', '.join(UserBase.VALID_ROLES)}",
+        )
+
+    def __validate_name__(self, name: str, value: Any) -> bool:
+        if value is None or (isinstance(value, str) and value):
+            return True
+        raise FieldError(name, value, "name must be a non empty string")
+
+    def _validate_date(self, name: str, value: Any) -> bool:
+        if value is None or isinstance(value, date):
+            return True
+        if isinstance(value, str):
+            try:
+                setattr(self, name, date.fromisoformat(value))
+                return True
+            except ValueError:
+                pass
+        raise FieldError(name, value, f"{name} must be an ISO 8601 date")
+
+    def __validate_born_from__(self, name: str, value: Any) -> bool:
+        return self._validate_date(name, value)
+
+    def __validate_born_to__(self, name: str, value: Any) -> bool:
+        return self._validate_date(name, value)
+
+    def matches(self, user: UserBase) -> bool:
+        return (
+            (self.role is None or user.role == self.role)
+            and (
+                self.name is None
+                or ascii_lower(user.name).startswith(ascii_lower(self.name))
+            )
+            and (self.born_from is None or user.date_of_birth >= self.born_from)
+            and (self.born_to is None or user.date_of_birth <= self.born_to)
+        )
@@ -0,0 +1,237 @@
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+MEMORY_URL = ":memory:"
+
+
+class PoolTimeoutError(TimeoutError):
+    timeout: float
+
+    def __init__(self, timeout: float) -> None:
+        super().__init__(f"No database connection free after {timeout}s")
+        self.timeout = timeout
+
+
+@dataclass(frozen=True, slots=True)
+class PoolStats:
+    """Snapshot of the use of a connection pool.
+
+    Attributes:
+        size: Connections in the pool.
+        acquired: Times a connection was taken.
+        waited: Times a connection was taken after waiting for one.
+        timeouts: Times no connection got free in time.
+        wait_time: Total seconds spent waiting for connections.
+        max_wait_time: Longest wait for a connection, in seconds.
+    """
+
+    size: int
+    acquired: int
+    waited: int
+    timeouts: int
+    wait_time: float
+    max_wait_time: float
+
+
+class ConnectionPool:
+    """Fixed set of connections, each used by one thread at a time.
+
+    Attributes:
+        timeout: Max seconds to wait for a free connection.
+    """
+
+    timeout: float
+    _connections: tuple[sqlite3.Connection, ...]
+    _free: queue.SimpleQueue[sqlite3.Connection]
+    _lock: threading.Lock
+    _acquired: int
+    _waited: int
+    _timeouts: int
+    _wait_time: float
+    _max_wait_time: float
+
+    def __init__(
+        self, connections: Iterable[sqlite3.Connection], timeout: float = 5.0
+    ) -> None:
+        self.timeout = timeout
+        self._connections = tuple(connections)
+        if not self._connections:
+            raise ValueError("a pool needs at least one connection")
+        self._free = queue.SimpleQueue()
+        for conn in self._connections:
+            self._free.put(conn)
+        self._lock = threading.Lock()
+        self._acquired = self._waited = self._timeouts = 0
+        self._wait_time = self._max_wait_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    @property
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                len(self._connections),
+                self._acquired,
+                self._waited,
+                self._timeouts,
+                self._wait_time,
+                self._max_wait_time,
+            )
+
+    def _take(self) -> sqlite3.Connection:
+        try:
+            conn = self._free.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            with self._lock:
+                self._acquired += 1
+            return conn
+        start = time.perf_counter()
+        try:
+            conn = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(self.timeout) from None
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._acquired += 1
+            self._waited += 1
+            self._wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+        return conn
+
+    @contextmanager
+    def acquire(self) -> Iterator[sqlite3.Connection]:
+        """Takes a free connection, waiting up to timeout for one.
+
+        Raises:
+            PoolTimeoutError: If no connection got free in time.
+        """
+        conn = self._take()
+        try:
+            yield conn
+        finally:
+            self._free.put(conn)
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+
+
+def database_path(url: str) -> str:
+    """Returns the SQLite path of a database URL.
+
+    sqlite:///name.db is the relative path name.db, sqlite:////data/name.db
+    the absolute /data/name.db, and sqlite:// an in-memory database. Paths,
+    "file:" URIs and ":memory:" are returned as they are.
+
+    Raises:
+        ValueError: If the URL has a scheme other than sqlite.
+    """
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return url
+    if scheme != "sqlite":
+        raise ValueError(f"{url} is not a SQLite database URL")
+    if rest in ("", "/"):
+        return MEMORY_URL
+    if not rest.startswith("/"):
+        raise ValueError(f"Invalid SQLite URL {url}, expected sqlite:///path")
+    return rest[1:]
+
+
+def _read_only_uri(url: str) -> str:
+    uri = url if url.startswith("file:") else Path(url).absolute().as_uri()
+    return f"{uri}{'&' if '?' in uri else '?'}mode=ro"
+
+
+def _is_memory(url: str) -> bool:
+    return url in ("", MEMORY_URL) or "mode=memory" in url
+
+
+class ConnectionRouter:
+    """Routes the queries of a SQLite database to a writer or a reader.
+
+    Mutations are serialized on a single writer connection, while reads
+    are spread over a pool of read-only connections. In WAL mode readers
+    see the last committed data and never wait on the writer.
+
+    An in-memory database can't be shared by connections, so it is read
+    and written on the same connection.
+
+    Attributes:
+        writer: Pool with the only read-write connection.
+        readers: Pool of read-only connections, the writer if there are no
+            readers.
+    """
+
+    writer: ConnectionPool
+    readers: ConnectionPool
+
+    def __init__(
+        self, writer: ConnectionPool, readers: ConnectionPool | None = None
+    ) -> None:
+        self.writer = writer
+        self.readers = writer if readers is None else readers
+
+    @classmethod
+    def of(cls, conn: sqlite3.Connection) -> "ConnectionRouter":
+        """Routes every query to a single connection."""
+        return cls(ConnectionPool([conn]))
+
+    @classmethod
+    def connect(
+        cls, url: str, readers: int = 4, timeout: float = 5.0
+    ) -> "ConnectionRouter":
+        """Opens the writer and reader connections of a database.
+
+        Args:
+            url: Path or "file:" URI of the database, or ":memory:".
+            readers: Read-only connections to open.
+            timeout: Max seconds to wait for a free connection.
+        """
+        conn = sqlite3.connect(
+            url, uri=url.startswith("file:"), check_same_thread=False
+        )
+        writer = ConnectionPool([conn], timeout)
+        if readers < 1 or _is_memory(url):
+            return cls(writer)
+        conn.execute("PRAGMA journal_mode = WAL")
+        uri = _read_only_uri(url)
+        connections: list[sqlite3.Connection] = []
+        for _ in range(readers):
+            reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            reader.execute("PRAGMA query_only = ON")
+            connections.append(reader)
+        return cls(writer, ConnectionPool(connections, timeout))
+
+    def read(self) -> AbstractContextManager[sqlite3.Connection]:
+        """Takes a connection to read with, see ConnectionPool.acquire."""
+        return self.readers.acquire()
+
+    def write(self) -> AbstractContextManager[sqlite3.Connection]:
+        """Takes the writer connection, see ConnectionPool.acquire."""
+        return self.writer.acquire()
+
+    def ping(self) -> None:
+        """Runs a trivial query on a reader.
+
+        Raises:
+            sqlite3.Error: If the database can't be queried.
+        """
+        with self.read() as conn:
+            conn.execute("SELECT 1").fetchone()
+
+    def close(self) -> None:
+        self.writer.close()
+        if self.readers is not self.writer:
+            self.readers.close()
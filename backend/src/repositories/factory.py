@@ -0,0 +1,105 @@
+import logging
+from dataclasses import dataclass
+
+from src.repositories.connection import ConnectionRouter, database_path
+from src.repositories.migrations import migrate
+from src.repositories.sharded import ShardedUserRepository
+from src.repositories.shared import SharedMemoryUserRepository
+from src.repositories.sqlite import SQLiteUserRepository
+from src.repositories.tiered import TieredUserRepository
+from src.repositories.user import InMemoryUserRepository, UserRepository
+
+MEMORY_SCHEME = "memory"
+SHARED_SCHEME = "shared"
+SQLITE_SCHEME = "sqlite"
+
+
+@dataclass(frozen=True, slots=True)
+class UserStore:
+    """Store of the users opened from a database URL.
+
+    Attributes:
+        repo: The users.
+        db: Connections of the database, None if the store is not SQLite.
+    """
+
+    repo: UserRepository
+    db: ConnectionRouter | None = None
+
+    def close(self) -> None:
+        self.repo.close()
+        if self.db is not None:
+            self.db.close()
+
+
+def open_user_store(
+    url: str,
+    readers: int = 4,
+    pool_timeout: float = 5.0,
+    run_migrations: bool = True,
+    shared_capacity: int = 100_000,
+    shared_slot_size: int = 512,
+    hot_users: int = 0,
+    hot_bytes: int | None = None,
+    logger: logging.Logger | None = None,
+) -> UserStore:
+    """Opens the store of the users picked by the scheme of a URL.
+
+    memory:// keeps the users in process, sharded by gym. shared:///path
+    keeps them in a file mapped by every worker process, see
+    SharedMemoryUserRepository. sqlite:///path, or a URL without scheme,
+    keeps them in a SQLite database, see database_path.
+
+    Args:
+        url: URL of the store.
+        readers: Read-only SQLite connections to open.
+        pool_timeout: Max seconds to wait for a free SQLite connection.
+        run_migrations: If pending migrations are applied to the database.
+        shared_capacity: Users a new shared file can hold.
+        shared_slot_size: Bytes of each user in a new shared file.
+        hot_users: If positive, the SQLite store is the cold tier of a
+            TieredUserRepository keeping up to this many users in memory.
+        hot_bytes: Max bytes of the users kept in memory, None for no
+            bound.
+        logger: Logs the migrations applied.
+
+    Raises:
+        ValueError: If the scheme of the URL is unknown.
+    """
+    scheme, sep, rest = url.partition("://")
+    if sep and scheme == MEMORY_SCHEME:
+        return UserStore(
+            ShardedUserRepository(
+                lambda gym_id, next_id: InMemoryUserRepository(next_id)
+            )
+        )
+    if sep and scheme == SHARED_SCHEME:
+        if not rest.startswith("/") or rest == "/":
+            raise ValueError(f"Invalid URL {url}, expected shared:///path")
+        return UserStore(
+            SharedMemoryUserRepository(
+                rest[1:], shared_capacity, shared_slot_size
+            )
+        )
+    if sep and scheme != SQLITE_SCHEME:
+        raise ValueError(f"Unknown scheme {scheme} of database URL {url}")
+    db = ConnectionRouter.connect(database_path(url), readers, pool_timeout)
+    try:
+        if run_migrations:
+            with db.write() as conn:
+                for m in migrate(conn):
+                    if logger is not None:
+                        logger.info(
+                            "Applied migration %04d %s", m.version, m.name
+                        )
+    except BaseException:
+        db.close()
+        raise
+    # The hot tier keeps the fragments of the users it holds, so the cold
+    # tier keeps none, else it would end up holding every user
+    repo: UserRepository = SQLiteUserRepository(
+        db, keep_fragments=hot_users <= 0
+    )
+    if hot_users > 0:
+        repo = TieredUserRepository(repo, hot_users, hot_bytes)
+    return UserStore(repo, db)
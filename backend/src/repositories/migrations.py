@@ -0,0 +1,167 @@
+import argparse
+import re
+import sqlite3
+import sys
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).parents[2] / "database" / "migrations"
+
+_FILE_RE = re.compile(r"(\d{4})_(\w+)\.sql")
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migration (
+    version INTEGER NOT NULL PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class MigrationError(Exception):
+    """Exception raised when migrations can't be loaded or applied"""
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+    """Forward schema change, from a NNNN_name.sql file.
+
+    Attributes:
+        version: Number of the migration, applied in increasing order.
+        name: Name of the migration.
+        sql: Statements of the migration.
+    """
+
+    version: int
+    name: str
+    sql: str
+
+    def statements(self) -> Iterator[str]:
+        """Splits the SQL in statements, keeping trigger bodies whole."""
+        statement = ""
+        for part in self.sql.split(";"):
+            statement += f"{part};"
+            if sqlite3.complete_statement(statement):
+                yield statement.strip()
+                statement = ""
+        if statement.rstrip(";").strip():
+            yield statement.rstrip(";").strip()
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    """Reads the migrations of a directory, by version.
+
+    Raises:
+        MigrationError: If two migrations have the same version.
+    """
+    migrations: dict[int, Migration] = {}
+    for path in sorted(directory.glob("*.sql")):
+        match = _FILE_RE.fullmatch(path.name)
+        if match is None:
+            raise MigrationError(f"Invalid migration file name {path.name}")
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicated migration version {version}")
+        migrations[version] = Migration(
+            version, match.group(2), path.read_text()
+        )
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def applied_versions(conn: sqlite3.Connection) -> list[int]:
+    """Returns the versions of the migrations applied to the database."""
+    conn.execute(_CREATE_TABLE)
+    cur = conn.execute("SELECT version FROM schema_migration ORDER BY version")
+    return [row[0] for row in cur]
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    migrations: Sequence[Migration] | None = None,
+    target: int | None = None,
+) -> list[Migration]:
+    """Applies the pending migrations, each one in its own transaction.
+
+    Each transaction takes the database write lock before checking which
+    migrations are pending, so concurrent runners never apply a migration
+    twice. A failed migration is rolled back, with the ones before it kept.
+
+    Args:
+        conn: Read-write connection to the database.
+        migrations: Migrations to apply, by default those of MIGRATIONS_DIR.
+        target: Last version to apply, by default the latest.
+
+    Returns:
+        The migrations applied.
+
+    Raises:
+        MigrationError: If a migration failed.
+    """
+    if migrations is None:
+        migrations = load_migrations()
+    applied: list[Migration] = []
+    for migration in migrations:
+        if target is not None and migration.version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if migration.version not in applied_versions(conn):
+                for statement in migration.statements():
+                    conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_migration (version, name)"
+                    " VALUES (?, ?)",
+                    (migration.version, migration.name),
+                )
+                applied.append(migration)
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            raise MigrationError(
+                f"Migration {migration.version} {migration.name} failed: {e}"
+            ) from e
+    return applied
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.repositories.migrations",
+        description="Applies the pending database migrations.",
+    )
+    parser.add_argument(
+        "database", nargs="?", help="database path, default DATABASE_URL"
+    )
+    parser.add_argument("--target", type=int, help="last version to apply")
+    parser.add_argument(
+        "--list", action="store_true", help="list migrations and exit"
+    )
+    args = parser.parse_args(argv)
+    if args.database is None:
+        from src.config import DATABASE_URL
+        from src.repositories.connection import database_path
+
+        try:
+            args.database = database_path(DATABASE_URL)
+        except ValueError as e:
+            print(f"{e}, only SQLite databases are migrated", file=sys.stderr)
+            return 1
+    conn = sqlite3.connect(args.database, uri=args.database.startswith("file:"))
+    try:
+        if args.list:
+            applied = set(applied_versions(conn))
+            for m in load_migrations():
+                status = "applied" if m.version in applied else "pending"
+                print(f"{m.version:04d} {m.name} {status}")
+            return 0
+        for m in migrate(conn, target=args.target):
+            print(f"Applied {m.version:04d} {m.name}")
+    except MigrationError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import bisect
+import heapq
+import itertools
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import ClassVar
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize(text: str) -> str:
+    """Case folds the text and strips its accents."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits the normalized text in alphanumeric tokens."""
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token: str) -> set[str]:
+    """Returns the trigrams of a token padded like pg_trgm does."""
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True, slots=True)
+class _Document:
+    username: tuple[str, ...]
+    name: tuple[str, ...]
+    trigrams: frozenset[str]
+
+
+@dataclass(slots=True)
+class _Posting:
+    # Ids of the users holding a token, in insertion order
+    username: dict[int, None]
+    name: dict[int, None]
+
+    def __len__(self) -> int:
+        return len(self.username) + len(self.name)
+
+
+class UserSearchIndex:
+    """Prefix and fuzzy search index over the username and name of users.
+
+    Prefix matches are answered from a sorted list of the distinct tokens,
+    so the tokens starting with the query are found by binary search and
+    each one points to the users holding it. When there are not enough
+    prefix matches, users holding enough of the query trigrams are added,
+    which tolerates typos. Both structures are updated incrementally on
+    every add and remove.
+
+    Prefix matches always rank above fuzzy matches. Among prefix matches
+    exact tokens rank above partial ones, shorter tokens above longer ones
+    and username tokens above name tokens.
+    """
+
+    USERNAME_WEIGHT: ClassVar[float] = 1.1
+    FUZZY_THRESHOLD: ClassVar[float] = 0.5
+
+    _docs: dict[int, _Document]
+    _tokens: list[str]
+    _postings: dict[str, _Posting]
+    _trigrams: dict[str, set[int]]
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self._docs = {}
+        self._tokens = []
+        self._postings = {}
+        self._trigrams = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, user_id: int, username: str, name: str) -> None:
+        """Indexes a user, replacing its previous entry if any."""
+        doc = self._document(username, name)
+        with self._lock:
+            self._remove(user_id)
+            for token in self._insert(user_id, doc):
+                bisect.insort(self._tokens, token)
+
+    def add_many(self, users: Iterable[tuple[int, str, str]]) -> None:
+        """Indexes many (user id, username, name) at once.
+
+        Faster than calling add for each user when loading a store, since
+        the token list is sorted once at the end.
+        """
+        docs = [(i, self._document(u, n)) for i, u, n in users]
+        with self._lock:
+            for user_id, _ in docs:
+                self._remove(user_id)
+            new_tokens = [
+                token
+                for user_id, doc in docs
+                for token in self._insert(user_id, doc)
+            ]
+            self._tokens = sorted(itertools.chain(self._tokens, new_tokens))
+
+    def remove(self, user_id: int) -> None:
+        """Removes a user from the index, if it was indexed."""
+        with self._lock:
+            self._remove(user_id)
+
+    def _document(self, username: str, name: str) -> _Document:
+        username_tokens = tuple(tokenize(username))
+        name_tokens = tuple(tokenize(name))
+        doc_trigrams = frozenset(
+            tg for t in username_tokens + name_tokens for tg in trigrams(t)
+        )
+        return _Document(username_tokens, name_tokens, doc_trigrams)
+
+    def _insert(self, user_id: int, doc: _Document) -> list[str]:
+        # Returns the tokens not indexed yet, to be added to self._tokens
+        self._docs[user_id] = doc
+        new_tokens: list[str] = []
+        for tokens, is_username in ((doc.username, True), (doc.name, False)):
+            for token in tokens:
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = _Posting({}, {})
+                    new_tokens.append(token)
+                ids = posting.username if is_username else posting.name
+                ids[user_id] = None
+        for tg in doc.trigrams:
+            self._trigrams.setdefault(tg, set()).add(user_id)
+        return new_tokens
+
+    def _remove(self, user_id: int) -> None:
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return
+        for token in set(doc.username + doc.name):
+            posting = self._postings[token]
+            posting.username.pop(user_id, None)
+            posting.name.pop(user_id, None)
+            if not posting:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+        for tg in doc.trigrams:
+            posting = self._trigrams[tg]
+            posting.discard(user_id)
+            if not posting:
+                del self._trigrams[tg]
+
+    def search(self, query: str, limit: int) -> list[int]:
+        """Finds the users best matching the query.
+
+        Args:
+            query: Free text matched against usernames and names.
+            limit: Max number of user ids to return.
+
+        Returns:
+            The ids of the matching users, best match first.
+        """
+        q_tokens = tokenize(query)
+        if not q_tokens or limit < 1:
+            return []
+        with self._lock:
+            if len(q_tokens) == 1:
+                ranked = self._token_matches(q_tokens[0], limit)
+            else:
+                ranked = self._prefix_matches(q_tokens, limit)
+            if len(ranked) < limit:
+                found = {user_id for _, user_id in ranked}
+                ranked += self._fuzzy_matches(
+                    q_tokens, limit - len(ranked), found
+                )
+        return [user_id for _, user_id in ranked]
+
+    @staticmethod
+    def _quality(q_length: int, token_length: int) -> float:
+        if q_length == token_length:
+            return 1.0
+        return 0.5 + 0.4 * q_length / token_length
+
+    def _prefix_range(self, q: str) -> list[str]:
+        lo = bisect.bisect_left(self._tokens, q)
+        hi = bisect.bisect_left(self._tokens, q + _MAX_CHAR, lo)
+        return self._tokens[lo:hi]
+
+    def _token_matches(self, q: str, limit: int) -> list[tuple[float, int]]:
+        # The match quality only depends on the token length, so tokens are
+        # visited shortest first, username holders before name holders, and
+        # the scan stops as soon as no other user can get into the top
+        # results.
+        scores: dict[int, float] = {}
+        by_length = itertools.groupby(
+            sorted(self._prefix_range(q), key=len), key=len
+        )
+        for length, group in by_length:
+            quality = self._quality(len(q), length)
+            if len(scores) >= limit:
+                kth = heapq.nlargest(limit, scores.values())[-1]
+                if kth >= quality * self.USERNAME_WEIGHT:
+                    break
+            self._score_group(
+                [self._postings[t] for t in group], quality, scores, limit
+            )
+        # Shift prefix matches above any fuzzy similarity, which is <= 1.01
+        return _top(((1.0 + s, i) for i, s in scores.items()), limit)
+
+    def _score_group(
+        self,
+        postings: list[_Posting],
+        quality: float,
+        scores: dict[int, float],
+        limit: int,
+    ) -> None:
+        score = quality * self.USERNAME_WEIGHT
+        for posting in postings:
+            for user_id in posting.username:
+                if score > scores.get(user_id, 0.0):
+                    scores[user_id] = score
+        # Every score so far is at least the quality, so once there are
+        # enough users the remaining name holders could only tie
+        for user_id in itertools.chain.from_iterable(p.name for p in postings):
+            if len(scores) >= limit:
+                return
+            scores.setdefault(user_id, quality)
+
+    def _prefix_matches(
+        self, q_tokens: list[str], limit: int
+    ) -> list[tuple[float, int]]:
+        # Candidates come from the most selective token and are then checked
+        # against the others
+        tokens = min(
+            (self._prefix_range(q) for q in q_tokens),
+            key=lambda r: sum(len(self._postings[t]) for t in r),
+        )
+        candidates = {
+            i
+            for t in tokens
+            for ids in (self._postings[t].username, self._postings[t].name)
+            for i in ids
+        }
+        scored = (
+            (score, user_id)
+            for user_id in candidates
+            if (score := self._prefix_score(q_tokens, self._docs[user_id]))
+        )
+        return _top(scored, limit)
+
+    def _prefix_score(self, q_tokens: list[str], doc: _Document) -> float:
+        total = 0.0
+        for q in q_tokens:
+            best = 0.0
+            for tokens, weight in (
+                (doc.username, self.USERNAME_WEIGHT),
+                (doc.name, 1.0),
+            ):
+                for token in tokens:
+                    if token.startswith(q):
+                        quality = self._quality(len(q), len(token))
+                        best = max(best, weight * quality)
+            if not best:
+                return 0.0
+            total += best
+        return 1.0 + total / len(q_tokens)
+
+    def _fuzzy_matches(
+        self, q_tokens: list[str], limit: int, exclude: set[int]
+    ) -> list[tuple[float, int]]:
+        q_trigrams = {tg for t in q_tokens for tg in trigrams(t)}
+        postings = sorted(
+            (self._trigrams.get(tg, set()) for tg in q_trigrams), key=len
+        )
+        # A user holding the required share of the query trigrams must be in
+        # at least one of the rarest postings, so only those are scanned to
+        # find candidates
+        required = math.ceil(len(q_trigrams) * self.FUZZY_THRESHOLD)
+        rarest = len(postings) - required + 1
+        shared: Counter[int] = Counter()
+        for posting in postings[:rarest]:
+            shared.update(posting)
+        shared.update(
+            itertools.chain.from_iterable(
+                shared.keys() & posting for posting in postings[rarest:]
+            )
+        )
+        scored = (
+            (self._similarity(len(q_trigrams), count, user_id), user_id)
+            for user_id, count in shared.items()
+            if count >= required and user_id not in exclude
+        )
+        return _top(scored, limit)
+
+    def _similarity(self, q_count: int, shared: int, user_id: int) -> float:
+        # Share of the query trigrams found in the user, ties broken in
+        # favor of users with fewer extra trigrams
+        doc_count = len(self._docs[user_id].trigrams)
+        jaccard = shared / (q_count + doc_count - shared)
+        return shared / q_count + jaccard / 100
+
+
+def _top(
+    scored: Iterable[tuple[float, int]], limit: int
+) -> list[tuple[float, int]]:
+    # Highest score first, lowest id first on ties
+    return heapq.nsmallest(limit, scored, key=lambda s: (-s[0], s[1]))
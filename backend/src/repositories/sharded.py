@@ -0,0 +1,271 @@
+import heapq
+import itertools
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import datetime
+from typing import Any, override
+
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.user import UserChange, UserRepository
+
+type ShardFactory = Callable[[int, Callable[[], int]], UserRepository]
+"""Creates the store of a gym, given the gym id and the id allocator."""
+
+
+class ShardedUserRepository(UserRepository):
+    """User store partitioned by gym, with one store (shard) per gym.
+
+    Queries of a gym and mutations of its users only touch its shard, with
+    its own data and locks. Shards are created on the first user of a gym.
+
+    User ids are unique across gyms: shards allocate them from a shared
+    counter, and a directory maps each id to its gym, so users can still
+    be found by id alone.
+    """
+
+    _factory: ShardFactory
+    _shards: dict[int, UserRepository]
+    _directory: dict[int, int]
+    _ids: Iterator[int]
+    _lock: threading.Lock
+
+    def __init__(
+        self, factory: ShardFactory, gym_ids: Iterable[int] = ()
+    ) -> None:
+        """
+        Args:
+            factory: Creates the store of each gym.
+            gym_ids: Gyms whose stores already hold users, opened now to
+                load the directory.
+        """
+        self._factory = factory
+        self._shards = {}
+        self._directory = {}
+        self._lock = threading.Lock()
+        # Deleted users are loaded too, so they can be restored and their
+        # ids are never handed out again
+        for gym_id in gym_ids:
+            for user_id in self._open_shard(gym_id).stored_ids():
+                self._directory[user_id] = gym_id
+        self._ids = itertools.count(max(self._directory, default=-1) + 1)
+
+    def _next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def _shard(self, gym_id: int) -> UserRepository | None:
+        return self._shards.get(gym_id)
+
+    def _open_shard(self, gym_id: int) -> UserRepository:
+        shard = self._shards.get(gym_id)
+        if shard is not None:
+            return shard
+        with self._lock:
+            shard = self._shards.get(gym_id)
+            if shard is None:
+                shard = self._factory(gym_id, self._next_id)
+                shard.subscribe(self._on_change)
+                self._shards[gym_id] = shard
+        return shard
+
+    def _shard_of(self, user_id: int) -> UserRepository | None:
+        gym_id = self._directory.get(user_id)
+        return None if gym_id is None else self._shards[gym_id]
+
+    def _on_change(self, change: UserChange) -> None:
+        # Deleted users stay in the directory, to be restored, until purged
+        if change.op == "create":
+            self._directory[change.user.id] = change.user.gym_id
+        self._publish(change.op, change.user)
+
+    @property
+    def gym_ids(self) -> list[int]:
+        """Ids of the gyms with a shard."""
+        return sorted(self._shards)
+
+    @override
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        if gym_id is not None:
+            shard = self._shard(gym_id)
+            return [] if shard is None else shard.find_all(where=where)
+        users = [
+            u
+            for s in list(self._shards.values())
+            for u in s.find_all(where=where)
+        ]
+        users.sort(key=lambda u: u.id)
+        return users
+
+    @override
+    def find_all_fields(
+        self,
+        fields: Sequence[str],
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+    ) -> list[dict[str, Any]]:
+        if gym_id is not None:
+            shard = self._shard(gym_id)
+            if shard is None:
+                return []
+            return shard.find_all_fields(fields, where=where)
+        # Users of every gym are sorted by id, so it is always read
+        read = fields if "id" in fields else [*fields, "id"]
+        users = [
+            u
+            for s in list(self._shards.values())
+            for u in s.find_all_fields(read, where=where)
+        ]
+        users.sort(key=lambda u: u["id"])
+        if read is not fields:
+            for u in users:
+                del u["id"]
+        return users
+
+    @override
+    def find_fields_by_id(
+        self, user_id: int, fields: Sequence[str]
+    ) -> dict[str, Any] | None:
+        shard = self._shard_of(user_id)
+        return (
+            None if shard is None else shard.find_fields_by_id(user_id, fields)
+        )
+
+    @override
+    def encode(self, user: UserInDB) -> bytes:
+        # Fragments are kept by the shard holding the user
+        shard = self._shard(user.gym_id)
+        return super().encode(user) if shard is None else shard.encode(user)
+
+    @override
+    def ping(self) -> None:
+        for shard in list(self._shards.values()):
+            shard.ping()
+
+    @override
+    def warm(self, limit: int) -> int:
+        warmed = 0
+        for shard in list(self._shards.values()):
+            warmed += shard.warm(limit - warmed)
+        return warmed
+
+    @override
+    def close(self) -> None:
+        for shard in list(self._shards.values()):
+            shard.close()
+
+    @override
+    def iter_all(
+        self,
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+        batch_size: int = 500,
+    ) -> Iterator[UserInDB]:
+        if gym_id is not None:
+            shard = self._shard(gym_id)
+            if shard is not None:
+                yield from shard.iter_all(where=where, batch_size=batch_size)
+            return
+        yield from heapq.merge(
+            *(
+                s.iter_all(where=where, batch_size=batch_size)
+                for s in list(self._shards.values())
+            ),
+            key=lambda u: u.id,
+        )
+
+    @override
+    def find_by_id(self, user_id: int) -> UserInDB | None:
+        shard = self._shard_of(user_id)
+        return None if shard is None else shard.find_by_id(user_id)
+
+    @override
+    def find_many(self, user_ids: Iterable[int]) -> dict[int, UserInDB]:
+        by_gym: defaultdict[int, list[int]] = defaultdict(list)
+        for user_id in user_ids:
+            gym_id = self._directory.get(user_id)
+            if gym_id is not None:
+                by_gym[gym_id].append(user_id)
+        users: dict[int, UserInDB] = {}
+        for gym_id, ids in by_gym.items():
+            users.update(self._shards[gym_id].find_many(ids))
+        return users
+
+    @override
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        if gym_id is not None:
+            shard = self._shard(gym_id)
+            return [] if shard is None else shard.search(query, limit)
+        # Scores are not comparable across shards, so the results are
+        # merged by rank: the best of each shard first, and so on
+        results = [s.search(query, limit) for s in list(self._shards.values())]
+        merged = itertools.chain.from_iterable(itertools.zip_longest(*results))
+        return [u for u in merged if u is not None][:limit]
+
+    @override
+    def create(self, user: UserCreate) -> UserInDB:
+        return self._open_shard(user.gym_id).create(user)
+
+    @override
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        shard = self._shard_of(user_id)
+        if shard is None:
+            return None
+        return shard.delete(user_id, expected_version)
+
+    @override
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        shard = self._shard_of(user_id)
+        if shard is None:
+            return None
+        return shard.update(user_id, user, expected_version)
+
+    @override
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        shard = self._shard_of(user_id)
+        if shard is None:
+            return None
+        return shard.update_with_previous(user_id, user, expected_version)
+
+    @override
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        shard = (
+            self._shard_of(user_id) if gym_id is None else self._shard(gym_id)
+        )
+        if shard is None:
+            return None
+        return shard.restore(user_id, gym_id)
+
+    @override
+    def stored_ids(self) -> list[int]:
+        return sorted(self._directory)
+
+    @override
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        """Purges the tombstones of each gym in turn, oldest first."""
+        purged: list[int] = []
+        for shard in list(self._shards.values()):
+            if len(purged) >= limit:
+                break
+            purged.extend(shard.purge_deleted(before, limit - len(purged)))
+        for user_id in purged:
+            self._directory.pop(user_id, None)
+        return purged
@@ -0,0 +1,505 @@
+import fcntl
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from typing import override
+
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.search import UserSearchIndex
+from src.repositories.user import (
+    UserFragments,
+    UserRepository,
+    UserRepositoryConflictError,
+    UserRepositoryError,
+)
+from src.utils.encoding import dump_json
+from src.utils.try_except import LazyMessage, try_except
+
+_MAGIC = b"GYMUSERS"
+_LAYOUT = 2
+# magic, layout, slot size, then the counters below, 8 bytes each
+_HEADER = struct.Struct("<8sII")
+_HEADER_SIZE = 64
+_COUNTER = struct.Struct("<Q")
+_NEXT_ID_AT = 16
+_HIGH_WATER_AT = 24
+_GENERATION_AT = 32
+# seqlock sequence number, state, record length, checksum, then the record
+_SLOT = struct.Struct("<IBxHI")
+_SEQ = struct.Struct("<I")
+_EMPTY = 0
+_LIVE = 1
+# Soft deleted, the record ends with the time of the delete
+_DELETED = 2
+_RECORD = (
+    "username",
+    "name",
+    "date_of_birth",
+    "role",
+    "gym_id",
+    "version",
+    "password_hash",
+)
+# Reads retried while a slot is written, before checking for a dead writer
+_READ_SPINS = 1000
+
+
+def _encode_record(user: UserInDB, deleted_at: float | None = None) -> bytes:
+    values = [getattr(user, f) for f in _RECORD]
+    if deleted_at is not None:
+        values.append(deleted_at)
+    return dump_json(values).encode()
+
+
+def _decode_record(
+    user_id: int, record: bytes
+) -> tuple[UserInDB, float | None]:
+    values = json.loads(record)
+    deleted_at = values.pop() if len(values) > len(_RECORD) else None
+    user = UserInDB(id=user_id, **dict(zip(_RECORD, values, strict=True)))
+    return user, deleted_at
+
+
+def _checksum(state: int, record: bytes) -> int:
+    return zlib.crc32(record, state)
+
+
+class SharedMemoryUserRepository(UserRepository):
+    """User store in a memory-mapped file, shared by every worker process.
+
+    The file holds a header, with the id counter and the generation, then
+    a fixed-width slot per user id. Each slot starts with a sequence number
+    (a seqlock): writers make it odd while they change the slot and even
+    again after, and readers copy the slot without any lock, retrying if
+    the number was odd or changed meanwhile. The slot also holds a checksum
+    of its record, which readers verify too, since nothing orders the
+    stores of the writer as seen from other cores. So reads scale across
+    processes and cores, while writes are serialized by an flock on the
+    file.
+
+    Deleted users stay in their slot as tombstones, with the time of the
+    delete, until they are restored or purged.
+
+    Each process caches the users it decoded by slot sequence number, so
+    reading an unchanged user only reads its slot header, and a search
+    index, rebuilt when the generation changed since. Mutations are
+    published to the listeners of the process that made them, while the
+    generation lives in the file, so every process sees it change.
+
+    Attributes:
+        path: Path of the file.
+        slot_size: Bytes per user, records longer than that are rejected.
+        capacity: Max number of user ids, from the size of the file.
+    """
+
+    path: str
+    slot_size: int
+    capacity: int
+    _fd: int
+    _mm: mmap.mmap
+    _next_id: Callable[[], int] | None
+    _lock: threading.Lock
+    _cache: dict[int, tuple[int, UserInDB | None]]
+    _fragments: UserFragments
+    _search: tuple[int, UserSearchIndex, dict[int, UserInDB]] | None
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 100_000,
+        slot_size: int = 512,
+        next_id: Callable[[], int] | None = None,
+    ) -> None:
+        """
+        Args:
+            path: File of the store, created if it does not exist.
+            capacity: Max number of user ids of a new file.
+            slot_size: Bytes per user of a new file, a multiple of 8.
+            next_id: Allocates the ids of new users, for stores sharing an
+                id space. By default ids are counted in the file from 0.
+
+        Raises:
+            ValueError: If slot_size is not a multiple of 8 or too small.
+            UserRepositoryError: If the file is not a user store.
+        """
+        if slot_size % 8 or slot_size <= _SLOT.size:
+            raise ValueError(f"Invalid slot size {slot_size}")
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Workers opening a new file at once only initialize it once
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size == 0:
+                    os.ftruncate(self._fd, _HEADER_SIZE + capacity * slot_size)
+                    os.pwrite(
+                        self._fd, _HEADER.pack(_MAGIC, _LAYOUT, slot_size), 0
+                    )
+                magic, layout, slot_size = _HEADER.unpack(
+                    os.pread(self._fd, _HEADER.size, 0)
+                )
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            if magic != _MAGIC or layout != _LAYOUT:
+                raise UserRepositoryError(f"{path} is not a user store")
+            self._mm = mmap.mmap(self._fd, 0)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self.slot_size = slot_size
+        self.capacity = (len(self._mm) - _HEADER_SIZE) // slot_size
+        self._next_id = next_id
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._fragments = UserFragments()
+        self._search = None
+
+    @override
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        # flock only excludes other processes, the lock other threads
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _counter(self, at: int) -> int:
+        return _COUNTER.unpack_from(self._mm, at)[0]
+
+    def _set_counter(self, at: int, value: int) -> None:
+        _COUNTER.pack_into(self._mm, at, value)
+
+    def _offset(self, user_id: int) -> int:
+        return _HEADER_SIZE + user_id * self.slot_size
+
+    def _decode_slot(
+        self, user_id: int, seq: int, state: int, record: bytes
+    ) -> UserInDB | None:
+        user = _decode_record(user_id, record)[0] if state == _LIVE else None
+        self._cache[user_id] = (seq, user)
+        return user
+
+    def _read_locked(self, user_id: int) -> UserInDB | None:
+        # No writer can run, so an odd number means one died mid write
+        offset = self._offset(user_id)
+        seq, state, length, _ = _SLOT.unpack_from(self._mm, offset)
+        if seq & 1:
+            seq = (seq + 1) & 0xFFFFFFFF
+            _SEQ.pack_into(self._mm, offset, seq)
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        start = offset + _SLOT.size
+        return self._decode_slot(
+            user_id, seq, state, self._mm[start : start + length]
+        )
+
+    def _read(self, user_id: int) -> UserInDB | None:
+        if not 0 <= user_id < self.capacity:
+            return None
+        offset = self._offset(user_id)
+        start = offset + _SLOT.size
+        max_length = self.slot_size - _SLOT.size
+        for _ in range(_READ_SPINS):
+            seq, state, length, checksum = _SLOT.unpack_from(self._mm, offset)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] == seq:
+                return cached[1]
+            record = self._mm[start : start + min(length, max_length)]
+            if (
+                _SEQ.unpack_from(self._mm, offset)[0] == seq
+                and _checksum(state, record) == checksum
+            ):
+                return self._decode_slot(user_id, seq, state, record)
+        with self._locked():
+            return self._read_locked(user_id)
+
+    def _tombstone(self, user_id: int) -> tuple[UserInDB, float] | None:
+        # Must hold the lock, so the slot can't change while it is read
+        offset = self._offset(user_id)
+        _, state, length, _ = _SLOT.unpack_from(self._mm, offset)
+        if state != _DELETED:
+            return None
+        start = offset + _SLOT.size
+        user, deleted_at = _decode_record(
+            user_id, self._mm[start : start + length]
+        )
+        return user, deleted_at or 0.0
+
+    def _write(
+        self,
+        user_id: int,
+        user: UserInDB | None,
+        deleted_at: float | None = None,
+    ) -> None:
+        # Must hold the lock. Readers may see these stores in any order, so
+        # they also check the checksum of the record.
+        if user is None:
+            state, record = _EMPTY, b""
+        else:
+            state = _LIVE if deleted_at is None else _DELETED
+            record = _encode_record(user, deleted_at)
+        if len(record) > self.slot_size - _SLOT.size:
+            raise UserRepositoryError(
+                f"User {user_id} takes {len(record)} bytes, "
+                f"more than slots of {self.slot_size} bytes hold"
+            )
+        offset = self._offset(user_id)
+        odd = (_SEQ.unpack_from(self._mm, offset)[0] + 1) | 1
+        _SEQ.pack_into(self._mm, offset, odd & 0xFFFFFFFF)
+        start = offset + _SLOT.size
+        self._mm[start : start + len(record)] = record
+        _SLOT.pack_into(
+            self._mm,
+            offset,
+            odd & 0xFFFFFFFF,
+            state,
+            len(record),
+            _checksum(state, record),
+        )
+        _SEQ.pack_into(self._mm, offset, (odd + 1) & 0xFFFFFFFF)
+        self._set_counter(_GENERATION_AT, self._counter(_GENERATION_AT) + 1)
+
+    @property
+    @override
+    def generation(self) -> int:
+        return self._counter(_GENERATION_AT)
+
+    @override
+    @try_except(UserRepositoryError, "Error finding all users")
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        high_water = min(self._counter(_HIGH_WATER_AT), self.capacity)
+        return [
+            u
+            for u in map(self._read, range(high_water))
+            if u is not None
+            and (gym_id is None or u.gym_id == gym_id)
+            and (where is None or where.matches(u))
+        ]
+
+    @override
+    @try_except(UserRepositoryError, "Error finding user by id")
+    def find_by_id(self, user_id: int) -> UserInDB | None:
+        return self._read(user_id)
+
+    def _search_index(self) -> tuple[UserSearchIndex, dict[int, UserInDB]]:
+        # Got before reading the users, so an index is never newer than its
+        # generation
+        generation = self.generation
+        search = self._search
+        if search is None or search[0] != generation:
+            users = {u.id: u for u in self.find_all()}
+            index = UserSearchIndex()
+            index.add_many((u.id, u.username, u.name) for u in users.values())
+            search = self._search = (generation, index, users)
+        return search[1], search[2]
+
+    @override
+    @try_except(UserRepositoryError, "Error searching users")
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        index, users = self._search_index()
+        if gym_id is None:
+            return [users[i] for i in index.search(query, limit)]
+        # The index spans every gym, so all the matches are filtered
+        return [
+            u
+            for i in index.search(query, len(users))
+            if (u := users[i]).gym_id == gym_id
+        ][:limit]
+
+    @override
+    def encode(self, user: UserInDB) -> bytes:
+        return self._fragments.get(user)
+
+    @override
+    @try_except(UserRepositoryError, "Error warming the user store")
+    def warm(self, limit: int) -> int:
+        # Reading a user caches it decoded, then its fragment is encoded
+        warmed = 0
+        user_id = min(self._counter(_HIGH_WATER_AT), self.capacity)
+        while warmed < limit and user_id > 0:
+            user_id -= 1
+            user = self._read(user_id)
+            if user is not None:
+                self._fragments.get(user)
+                warmed += 1
+        return warmed
+
+    @override
+    @try_except(UserRepositoryError, "Error reaching the user store")
+    def ping(self) -> None:
+        if self._mm[: len(_MAGIC)] != _MAGIC:
+            raise UserRepositoryError(f"{self.path} is not a user store")
+
+    @override
+    @try_except(UserRepositoryError, "Error creating user")
+    def create(self, user: UserCreate) -> UserInDB:
+        with self._locked():
+            if self._next_id is not None:
+                user_id = self._next_id()
+            else:
+                user_id = self._counter(_NEXT_ID_AT)
+            if not 0 <= user_id < self.capacity:
+                raise UserRepositoryError(
+                    f"User store is full, it holds {self.capacity} ids"
+                )
+            new_user = UserInDB.from_user_create(user_id, user)
+            self._write(user_id, new_user)
+            if self._next_id is None:
+                self._set_counter(_NEXT_ID_AT, user_id + 1)
+            if user_id >= self._counter(_HIGH_WATER_AT):
+                self._set_counter(_HIGH_WATER_AT, user_id + 1)
+        self._fragments.put(new_user)
+        self._publish("create", new_user)
+        return new_user
+
+    def _current(
+        self, user_id: int, expected_version: int | None
+    ) -> UserInDB | None:
+        if not 0 <= user_id < self.capacity:
+            return None
+        current = self._read_locked(user_id)
+        if (
+            current is not None
+            and expected_version is not None
+            and current.version != expected_version
+        ):
+            raise UserRepositoryConflictError(
+                user_id, expected_version, current.version
+            )
+        return current
+
+    @override
+    @try_except(
+        UserRepositoryError, LazyMessage("Error deleting user {user_id}")
+    )
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        with self._locked():
+            deleted_user = self._current(user_id, expected_version)
+            if deleted_user is None:
+                return None
+            self._write(user_id, deleted_user, datetime.now(UTC).timestamp())
+        self._fragments.discard(user_id)
+        self._publish("delete", deleted_user)
+        return deleted_user
+
+    @override
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        updated = self.update_with_previous(user_id, user, expected_version)
+        return None if updated is None else updated[1]
+
+    @override
+    @try_except(
+        UserRepositoryError, LazyMessage("Error updating user {user_id}")
+    )
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        with self._locked():
+            current = self._current(user_id, expected_version)
+            if current is None:
+                return None
+            updated_user = UserInDB(
+                **{
+                    **current.to_dict(),
+                    **user.to_dict(),
+                    "version": current.version + 1,
+                }
+            )
+            self._write(user_id, updated_user)
+        self._fragments.put(updated_user)
+        self._publish("update", updated_user)
+        return current, updated_user
+
+    @override
+    @try_except(
+        UserRepositoryError, LazyMessage("Error restoring user {user_id}")
+    )
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        if not 0 <= user_id < self.capacity:
+            return None
+        with self._locked():
+            tombstone = self._tombstone(user_id)
+            if tombstone is None or (
+                gym_id is not None and tombstone[0].gym_id != gym_id
+            ):
+                return None
+            restored_user = UserInDB(
+                **{
+                    **tombstone[0].to_dict(),
+                    "version": tombstone[0].version + 1,
+                }
+            )
+            self._write(user_id, restored_user)
+        self._fragments.put(restored_user)
+        self._publish("restore", restored_user)
+        return restored_user
+
+    @override
+    @try_except(UserRepositoryError, "Error listing the stored user ids")
+    def stored_ids(self) -> list[int]:
+        high_water = min(self._counter(_HIGH_WATER_AT), self.capacity)
+        return [
+            i
+            for i in range(high_water)
+            if _SLOT.unpack_from(self._mm, self._offset(i))[1] != _EMPTY
+        ]
+
+    @override
+    @try_except(UserRepositoryError, "Error purging deleted users")
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        # Slot states are scanned without the lock, only tombstones are
+        # read again under it
+        high_water = min(self._counter(_HIGH_WATER_AT), self.capacity)
+        candidates = [
+            i
+            for i in range(high_water)
+            if _SLOT.unpack_from(self._mm, self._offset(i))[1] == _DELETED
+        ]
+        before_ts = before.timestamp()
+        with self._locked():
+            expired = heapq.nsmallest(
+                limit,
+                (
+                    (tombstone[1], i)
+                    for i in candidates
+                    if (tombstone := self._tombstone(i)) is not None
+                    and tombstone[1] < before_ts
+                ),
+            )
+            for _, user_id in expired:
+                self._write(user_id, None)
+        return [i for _, i in expired]
@@ -0,0 +1,483 @@
+import sqlite3
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import UTC, date, datetime
+from typing import Any, override
+
+from src.models.user import (
+    UserCreate,
+    UserFilter,
+    UserInDB,
+    UserUpdate,
+    ascii_lower,
+)
+from src.repositories.connection import ConnectionRouter
+from src.repositories.search import tokenize
+from src.repositories.user import (
+    UserFragments,
+    UserRepository,
+    UserRepositoryConflictError,
+    UserRepositoryError,
+)
+from src.utils.try_except import try_except
+
+_COLUMNS = (
+    "id",
+    "username",
+    "password_hash",
+    "name",
+    "date_of_birth",
+    "role",
+    "version",
+    "gym_id",
+)
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM user_account"  # noqa: S608
+_RETURNING = f"RETURNING {', '.join(_COLUMNS)}"
+
+# Sorts after every name prefix, to bound prefix ranges
+_MAX_CHAR = "\U0010ffff"
+
+# Stay below the oldest SQLITE_MAX_VARIABLE_NUMBER default (999)
+_MAX_PARAMS = 500
+
+
+def _to_user(row: Sequence[Any]) -> UserInDB:
+    return UserInDB(**dict(zip(_COLUMNS, row, strict=True)))
+
+
+def _select_fields(fields: Sequence[str]) -> str:
+    unknown = set(fields).difference(_COLUMNS)
+    if unknown or not fields:
+        raise ValueError(f"Invalid user fields: {', '.join(sorted(unknown))}")
+    # Fields are checked against the columns, so they are safe to inline
+    return f"SELECT {', '.join(fields)} FROM user_account"  # noqa: S608
+
+
+def _to_fields(fields: Sequence[str], row: Sequence[Any]) -> dict[str, Any]:
+    values = dict(zip(fields, row, strict=True))
+    if "date_of_birth" in values:
+        values["date_of_birth"] = date.fromisoformat(values["date_of_birth"])
+    return values
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def _fetch_one(cur: sqlite3.Cursor) -> Any:
+    # Step statements with RETURNING to completion so the transaction can
+    # be committed right after
+    rows = cur.fetchall()
+    return rows[0] if rows else None
+
+
+def _where(
+    gym_id: int | None, where: UserFilter | None, after_id: int | None = None
+) -> tuple[str, list[Any]]:
+    # Only the given conditions are added, so each one can use its index
+    conditions = ["deleted_at IS NULL"]
+    params: list[Any] = []
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(after_id)
+    if gym_id is not None:
+        conditions.append("gym_id = ?")
+        params.append(gym_id)
+    if where is not None:
+        if where.role is not None:
+            conditions.append("role = ?")
+            params.append(where.role)
+        if where.name is not None:
+            prefix = ascii_lower(where.name)
+            conditions.append("lower(name) >= ? AND lower(name) < ?")
+            params.extend((prefix, prefix + _MAX_CHAR))
+        if where.born_from is not None:
+            conditions.append("date_of_birth >= ?")
+            params.append(where.born_from.isoformat())
+        if where.born_to is not None:
+            conditions.append("date_of_birth <= ?")
+            params.append(where.born_to.isoformat())
+    return f"WHERE {' AND '.join(conditions)}", params
+
+
+def fts_query(query: str) -> str | None:
+    """Builds a FTS5 query matching every token of the query as a prefix.
+
+    Returns:
+        The FTS5 query or None if the query has no searchable token.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    escaped = (t.replace('"', '""') for t in tokens)
+    return " ".join(f'"{t}"*' for t in escaped)
+
+
+class SQLiteUserRepository(UserRepository):
+    """User store backed by the user_account table of database/migrations.
+
+    Search uses the user_account_fts table, kept in sync with user_account
+    by triggers. Reads and writes are routed to the reader and writer
+    connections of a ConnectionRouter. The encoded fragments of the users
+    are kept in memory, refreshed by the writes of this store and encoded
+    again when a read finds them stale.
+    """
+
+    _db: ConnectionRouter
+    _next_id: Callable[[], int] | None
+    _fragments: UserFragments
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection | ConnectionRouter,
+        next_id: Callable[[], int] | None = None,
+        keep_fragments: bool = True,
+    ) -> None:
+        """
+        Args:
+            conn: Connections to a migrated database, or
+                a single connection for both reads and writes.
+            next_id: Allocates the ids of new users, for stores sharing an
+                id space. By default SQLite picks the ids.
+            keep_fragments: If the encoded users are kept in memory, see
+                UserFragments.
+        """
+        self._db = (
+            conn
+            if isinstance(conn, ConnectionRouter)
+            else ConnectionRouter.of(conn)
+        )
+        self._next_id = next_id
+        self._fragments = UserFragments(keep_fragments)
+
+    @override
+    @try_except(UserRepositoryError, "Error finding all users")
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        clause, params = _where(gym_id, where)
+        with self._db.read() as conn:
+            cur = conn.execute(f"{_SELECT} {clause} ORDER BY id", params)
+            return [_to_user(row) for row in cur]
+
+    @override
+    @try_except(UserRepositoryError, "Error finding fields of all users")
+    def find_all_fields(
+        self,
+        fields: Sequence[str],
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+    ) -> list[dict[str, Any]]:
+        select = _select_fields(fields)
+        clause, params = _where(gym_id, where)
+        with self._db.read() as conn:
+            cur = conn.execute(f"{select} {clause} ORDER BY id", params)
+            return [_to_fields(fields, row) for row in cur]
+
+    @override
+    @try_except(UserRepositoryError, "Error finding fields of user by id")
+    def find_fields_by_id(
+        self, user_id: int, fields: Sequence[str]
+    ) -> dict[str, Any] | None:
+        select = _select_fields(fields)
+        with self._db.read() as conn:
+            row = conn.execute(
+                f"{select} WHERE id = ? AND deleted_at IS NULL", (user_id,)
+            ).fetchone()
+        return None if row is None else _to_fields(fields, row)
+
+    @override
+    def encode(self, user: UserInDB) -> bytes:
+        return self._fragments.get(user)
+
+    @override
+    @try_except(UserRepositoryError, "Error reaching the database")
+    def ping(self) -> None:
+        self._db.ping()
+
+    @override
+    @try_except(UserRepositoryError, "Error warming the user store")
+    def warm(self, limit: int) -> int:
+        clause, params = _where(None, None)
+        with self._db.read() as conn:
+            cur = conn.execute(
+                f"{_SELECT} {clause} ORDER BY id DESC LIMIT ?", [*params, limit]
+            )
+            users = [_to_user(row) for row in cur]
+            # Reads the pages of the search index into the page cache
+            conn.execute(
+                "SELECT sum(length(block)) FROM user_account_fts_data"
+            ).fetchone()
+        for user in users:
+            self._fragments.get(user)
+        return len(users)
+
+    @try_except(UserRepositoryError, "Error iterating over users")
+    def _page(
+        self,
+        gym_id: int | None,
+        where: UserFilter | None,
+        after_id: int | None,
+        size: int,
+    ) -> list[UserInDB]:
+        clause, params = _where(gym_id, where, after_id)
+        with self._db.read() as conn:
+            cur = conn.execute(
+                f"{_SELECT} {clause} ORDER BY id LIMIT ?", (*params, size)
+            )
+            return [_to_user(row) for row in cur]
+
+    @override
+    def iter_all(
+        self,
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+        batch_size: int = 500,
+    ) -> Iterator[UserInDB]:
+        # Pages are read by keyset, each with a reader taken just for it,
+        # so a slow consumer never holds a connection
+        after_id = None
+        while True:
+            page = self._page(gym_id, where, after_id, batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = page[-1].id
+
+    @override
+    @try_except(UserRepositoryError, "Error finding user by id")
+    def find_by_id(self, user_id: int) -> UserInDB | None:
+        with self._db.read() as conn:
+            row = conn.execute(
+                f"{_SELECT} WHERE id = ? AND deleted_at IS NULL", (user_id,)
+            ).fetchone()
+        return None if row is None else _to_user(row)
+
+    @override
+    @try_except(UserRepositoryError, "Error finding users by ids")
+    def find_many(self, user_ids: Iterable[int]) -> dict[int, UserInDB]:
+        ids = list(dict.fromkeys(user_ids))
+        users: dict[int, UserInDB] = {}
+        with self._db.read() as conn:
+            for i in range(0, len(ids), _MAX_PARAMS):
+                chunk = ids[i : i + _MAX_PARAMS]
+                placeholders = ", ".join("?" * len(chunk))
+                cur = conn.execute(
+                    f"{_SELECT} WHERE id IN ({placeholders})"
+                    " AND deleted_at IS NULL",
+                    chunk,
+                )
+                for row in cur:
+                    user = _to_user(row)
+                    users[user.id] = user
+        return users
+
+    @override
+    @try_except(UserRepositoryError, "Error searching users")
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        match = fts_query(query)
+        if match is None or limit < 1:
+            return []
+        columns = ", ".join(f"u.{c}" for c in _COLUMNS)
+        with self._db.read() as conn:
+            cur = conn.execute(
+                f"""
+                SELECT {columns}
+                FROM user_account_fts AS f
+                INNER JOIN user_account AS u ON u.id = f.rowid
+                WHERE user_account_fts MATCH ? AND u.deleted_at IS NULL
+                    AND (? IS NULL OR u.gym_id = ?)
+                ORDER BY bm25(user_account_fts, 2.0, 1.0), u.id
+                LIMIT ?
+                """,  # noqa: S608
+                (match, gym_id, gym_id, limit),
+            )
+            return [_to_user(row) for row in cur]
+
+    @override
+    @try_except(UserRepositoryError, "Error creating user")
+    def create(self, user: UserCreate) -> UserInDB:
+        with self._db.write() as conn, conn:
+            cur = conn.execute(
+                f"""
+                INSERT INTO user_account
+                    (id, username, password_hash, name, date_of_birth, role,
+                     gym_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                {_RETURNING}
+                """,  # noqa: S608
+                (
+                    None if self._next_id is None else self._next_id(),
+                    user.username,
+                    user.password_hash,
+                    user.name,
+                    user.date_of_birth.isoformat(),
+                    user.role,
+                    user.gym_id,
+                ),
+            )
+            row = _fetch_one(cur)
+        new_user = _to_user(row)
+        self._fragments.put(new_user)
+        self._publish("create", new_user)
+        return new_user
+
+    def _raise_if_conflict(
+        self, user_id: int, expected_version: int | None
+    ) -> None:
+        current = self.find_by_id(user_id)
+        if current is not None and expected_version is not None:
+            raise UserRepositoryConflictError(
+                user_id, expected_version, current.version
+            )
+
+    @override
+    @try_except(UserRepositoryError, "Error deleting user")
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        with self._db.write() as conn, conn:
+            cur = conn.execute(
+                f"""
+                UPDATE user_account SET deleted_at = ?
+                WHERE id = ? AND deleted_at IS NULL
+                    AND (? IS NULL OR version = ?)
+                {_RETURNING}
+                """,  # noqa: S608
+                (_now(), user_id, expected_version, expected_version),
+            )
+            row = _fetch_one(cur)
+        if row is None:
+            self._raise_if_conflict(user_id, expected_version)
+            return None
+        deleted_user = _to_user(row)
+        self._fragments.discard(user_id)
+        self._publish("delete", deleted_user)
+        return deleted_user
+
+    def _update_row(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None,
+    ) -> Any:
+        cur = conn.execute(
+            f"""
+            UPDATE user_account
+            SET username = ?, name = ?, date_of_birth = ?, role = ?,
+                version = version + 1
+            WHERE id = ? AND deleted_at IS NULL
+                AND (? IS NULL OR version = ?)
+            {_RETURNING}
+            """,  # noqa: S608
+            (
+                user.username,
+                user.name,
+                user.date_of_birth.isoformat(),
+                user.role,
+                user_id,
+                expected_version,
+                expected_version,
+            ),
+        )
+        return _fetch_one(cur)
+
+    def _updated(
+        self, user_id: int, row: Any, expected_version: int | None
+    ) -> UserInDB | None:
+        if row is None:
+            self._raise_if_conflict(user_id, expected_version)
+            return None
+        updated_user = _to_user(row)
+        self._fragments.put(updated_user)
+        self._publish("update", updated_user)
+        return updated_user
+
+    @override
+    @try_except(UserRepositoryError, "Error updating user")
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        with self._db.write() as conn, conn:
+            row = self._update_row(conn, user_id, user, expected_version)
+        return self._updated(user_id, row, expected_version)
+
+    @override
+    @try_except(UserRepositoryError, "Error updating user")
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        with self._db.write() as conn, conn:
+            # Taken before the read, so no other process writes in between
+            conn.execute("BEGIN IMMEDIATE")
+            previous = _fetch_one(
+                conn.execute(
+                    f"{_SELECT} WHERE id = ? AND deleted_at IS NULL",
+                    (user_id,),
+                )
+            )
+            row = self._update_row(conn, user_id, user, expected_version)
+        updated_user = self._updated(user_id, row, expected_version)
+        if updated_user is None or previous is None:
+            return None
+        return _to_user(previous), updated_user
+
+    @override
+    @try_except(UserRepositoryError, "Error restoring user")
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        with self._db.write() as conn, conn:
+            cur = conn.execute(
+                f"""
+                UPDATE user_account
+                SET deleted_at = NULL, version = version + 1
+                WHERE id = ? AND deleted_at IS NOT NULL
+                    AND (? IS NULL OR gym_id = ?)
+                {_RETURNING}
+                """,  # noqa: S608
+                (user_id, gym_id, gym_id),
+            )
+            row = _fetch_one(cur)
+        if row is None:
+            return None
+        restored_user = _to_user(row)
+        self._fragments.put(restored_user)
+        self._publish("restore", restored_user)
+        return restored_user
+
+    @override
+    @try_except(UserRepositoryError, "Error listing the stored user ids")
+    def stored_ids(self) -> list[int]:
+        with self._db.read() as conn:
+            cur = conn.execute("SELECT id FROM user_account ORDER BY id")
+            return [row[0] for row in cur]
+
+    @override
+    @try_except(UserRepositoryError, "Error purging deleted users")
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        # Bounded batches keep each write transaction short, FTS triggers
+        # included, so writes queued behind it barely wait
+        with self._db.write() as conn, conn:
+            cur = conn.execute(
+                """
+                DELETE FROM user_account
+                WHERE id IN (
+                    SELECT id FROM user_account
+                    WHERE deleted_at IS NOT NULL AND deleted_at < ?
+                    ORDER BY deleted_at
+                    LIMIT ?
+                )
+                RETURNING id
+                """,
+                (before.astimezone(UTC).isoformat(), limit),
+            )
+            return [row[0] for row in cur.fetchall()]
@@ -0,0 +1,320 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, override
+
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.user import UserChange, UserRepository, encode_user
+
+
+@dataclass(frozen=True, slots=True)
+class TierStats:
+    """Snapshot of the use of the tiers of a TieredUserRepository.
+
+    Attributes:
+        hits: Point reads answered by the hot tier.
+        misses: Point reads that went to the cold tier.
+        evictions: Users evicted from the hot tier.
+        hot_users: Users in the hot tier.
+        hot_bytes: Bytes of the users in the hot tier.
+        hot_seconds: Total seconds spent reading the hot tier.
+        cold_seconds: Total seconds spent reading the cold tier.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    hot_users: int
+    hot_bytes: int
+    hot_seconds: float
+    cold_seconds: float
+
+    @property
+    def hit_ratio(self) -> float:
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else 0.0
+
+    @property
+    def hot_latency(self) -> float:
+        """Mean seconds of a point read answered by the hot tier."""
+        return self.hot_seconds / self.hits if self.hits else 0.0
+
+    @property
+    def cold_latency(self) -> float:
+        """Mean seconds of a point read that went to the cold tier."""
+        return self.cold_seconds / self.misses if self.misses else 0.0
+
+
+class TieredUserRepository(UserRepository):
+    """Bounded in-memory hot tier over a store of every user, the cold tier.
+
+    Reads by id are answered by the hot tier, and misses are read from the
+    cold tier and promoted. The hot tier holds up to `max_users` users and
+    `max_bytes` bytes, measured as the size of their encoded fragments,
+    evicting the least recently read first. Scans, filters and searches
+    always go to the cold tier, so they don't flush the working set.
+
+    Writes go through to the cold tier, which notifies this store to update
+    the hot tier. The cold tier must not be written by other stores or
+    processes, or the hot tier goes stale. Fragments are encoded by this
+    store, so the cold tier should not keep its own, see UserFragments.
+
+    Attributes:
+        cold: Store holding every user.
+        max_users: Max users in the hot tier.
+        max_bytes: Max bytes of the users in the hot tier, None for no
+            bound.
+    """
+
+    cold: UserRepository
+    max_users: int
+    max_bytes: int | None
+    # Users and their fragments, least recently read first
+    _hot: OrderedDict[int, tuple[UserInDB, bytes]]
+    _hot_bytes: int
+    # Changed by every write, so reads that raced one are not promoted
+    _writes: int
+    _lock: threading.Lock
+    _clock: Callable[[], float]
+    _hits: int
+    _misses: int
+    _evictions: int
+    _hot_seconds: float
+    _cold_seconds: float
+
+    def __init__(
+        self,
+        cold: UserRepository,
+        max_users: int = 10_000,
+        max_bytes: int | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        self.cold = cold
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._hits = self._misses = self._evictions = 0
+        self._hot_seconds = self._cold_seconds = 0.0
+        cold.subscribe(self._on_change)
+
+    @property
+    def stats(self) -> TierStats:
+        with self._lock:
+            return TierStats(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._hot),
+                self._hot_bytes,
+                self._hot_seconds,
+                self._cold_seconds,
+            )
+
+    def _discard(self, user_id: int) -> None:
+        entry = self._hot.pop(user_id, None)
+        if entry is not None:
+            self._hot_bytes -= len(entry[1])
+
+    def _put(self, user: UserInDB, fragment: bytes) -> None:
+        # Called with the lock held
+        self._discard(user.id)
+        self._hot[user.id] = (user, fragment)
+        self._hot_bytes += len(fragment)
+        while self._hot and (
+            len(self._hot) > self.max_users
+            or (self.max_bytes is not None and self._hot_bytes > self.max_bytes)
+        ):
+            _, (_, evicted) = self._hot.popitem(last=False)
+            self._hot_bytes -= len(evicted)
+            self._evictions += 1
+
+    def _promote(self, users: Iterable[UserInDB], writes: int) -> None:
+        # Encoded outside the lock
+        entries = [(u, encode_user(u)) for u in users]
+        with self._lock:
+            if self._writes != writes:
+                return
+            for user, fragment in entries:
+                self._put(user, fragment)
+
+    def _on_change(self, change: UserChange) -> None:
+        user = change.user
+        fragment = None if change.op == "delete" else encode_user(user)
+        with self._lock:
+            self._writes += 1
+            if fragment is None:
+                self._discard(user.id)
+            elif user.id in self._hot or change.op != "update":
+                # New and restored users are likely read next
+                self._put(user, fragment)
+        self._publish(change.op, user)
+
+    def _hot_get(self, user_id: int) -> UserInDB | None:
+        # Called with the lock held
+        entry = self._hot.get(user_id)
+        if entry is None:
+            return None
+        self._hot.move_to_end(user_id)
+        return entry[0]
+
+    @override
+    def find_by_id(self, user_id: int) -> UserInDB | None:
+        start = self._clock()
+        with self._lock:
+            user = self._hot_get(user_id)
+            if user is not None:
+                self._hits += 1
+                self._hot_seconds += self._clock() - start
+                return user
+            writes = self._writes
+        start = self._clock()
+        user = self.cold.find_by_id(user_id)
+        elapsed = self._clock() - start
+        with self._lock:
+            self._misses += 1
+            self._cold_seconds += elapsed
+        if user is not None:
+            self._promote([user], writes)
+        return user
+
+    @override
+    def find_many(self, user_ids: Iterable[int]) -> dict[int, UserInDB]:
+        ids = list(dict.fromkeys(user_ids))
+        found: dict[int, UserInDB] = {}
+        start = self._clock()
+        with self._lock:
+            for user_id in ids:
+                user = self._hot_get(user_id)
+                if user is not None:
+                    found[user_id] = user
+            missing = [i for i in ids if i not in found]
+            self._hits += len(found)
+            self._hot_seconds += self._clock() - start
+            writes = self._writes
+        if missing:
+            start = self._clock()
+            cold = self.cold.find_many(missing)
+            elapsed = self._clock() - start
+            with self._lock:
+                self._misses += len(missing)
+                self._cold_seconds += elapsed
+            self._promote(cold.values(), writes)
+            found.update(cold)
+        return {i: found[i] for i in ids if i in found}
+
+    @override
+    def find_fields_by_id(
+        self, user_id: int, fields: Sequence[str]
+    ) -> dict[str, Any] | None:
+        # Counted and promoted as find_by_id, so misses read the whole user
+        user = self.find_by_id(user_id)
+        return None if user is None else {f: getattr(user, f) for f in fields}
+
+    @override
+    def encode(self, user: UserInDB) -> bytes:
+        with self._lock:
+            entry = self._hot.get(user.id)
+        if entry is not None and entry[0] == user:
+            return entry[1]
+        return encode_user(user)
+
+    @override
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        return self.cold.find_all(gym_id, where)
+
+    @override
+    def find_all_fields(
+        self,
+        fields: Sequence[str],
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+    ) -> list[dict[str, Any]]:
+        return self.cold.find_all_fields(fields, gym_id, where)
+
+    @override
+    def iter_all(
+        self,
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+        batch_size: int = 500,
+    ) -> Iterator[UserInDB]:
+        return self.cold.iter_all(gym_id, where, batch_size)
+
+    @override
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        return self.cold.search(query, limit, gym_id)
+
+    @override
+    def ping(self) -> None:
+        self.cold.ping()
+
+    @override
+    def close(self) -> None:
+        self.cold.close()
+
+    @override
+    def warm(self, limit: int) -> int:
+        """Fills the hot tier with the newest users, up to its bounds."""
+        with self._lock:
+            writes = self._writes
+        newest: deque[UserInDB] = deque(maxlen=min(limit, self.max_users))
+        if newest.maxlen:
+            # Users come by id, so the last ones kept are the newest
+            newest.extend(self.cold.iter_all())
+        self._promote(newest, writes)
+        with self._lock:
+            return sum(u.id in self._hot for u in newest)
+
+    @override
+    def create(self, user: UserCreate) -> UserInDB:
+        return self.cold.create(user)
+
+    @override
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        return self.cold.delete(user_id, expected_version)
+
+    @override
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        return self.cold.update(user_id, user, expected_version)
+
+    @override
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        return self.cold.update_with_previous(user_id, user, expected_version)
+
+    @override
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        return self.cold.restore(user_id, gym_id)
+
+    @override
+    def stored_ids(self) -> list[int]:
+        return self.cold.stored_ids()
+
+    @override
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        # Deleted users already left the hot tier
+        return self.cold.purge_deleted(before, limit)
@@ -1,18 +1,160 @@
+import heapq
+import itertools
+import threading
 from abc import ABC, abstractmethod
-from typing import override
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any, Literal, override
 
-from src.models.user import UserCreate, UserInDB, UserUpdate
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.search import UserSearchIndex
+from src.utils.encoding import dump_json
 
 
 class UserRepositoryError(Exception):
     """Exception raised by errors on operations in UserRepository"""
 
 
+class UserRepositoryConflictError(UserRepositoryError):
+    """Exception raised when the stored user version is not the expected one"""
+
+    user_id: int
+    expected_version: int
+    current_version: int
+
+    def __init__(
+        self, user_id: int, expected_version: int, current_version: int
+    ) -> None:
+        super().__init__(
+            f"User {user_id} is at version {current_version}, "
+            f"expected version {expected_version}"
+        )
+        self.user_id = user_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+type UserChangeOp = Literal["create", "update", "delete", "restore"]
+
+
+@dataclass(frozen=True, slots=True)
+class UserChange:
+    """Mutation of a user in store.
+
+    Attributes:
+        op: The kind of mutation.
+        user: The user as created, updated, restored or as it was when
+            deleted.
+    """
+
+    op: UserChangeOp
+    user: UserInDB
+
+
+type UserChangeListener = Callable[[UserChange], None]
+
+
+def encode_user(user: UserInDB) -> bytes:
+    """Encodes the public view of a user, without its password hash."""
+    return dump_json(user.to_dict(exclude=["password_hash"])).encode()
+
+
+class UserFragments:
+    """Encoded public views of users, kept next to the stored users.
+
+    Stores refresh a fragment when they create or update a user, so after
+    a write only that user is encoded again. A fragment is only returned
+    for the exact user it was encoded from, so a stale one is never used.
+
+    Attributes:
+        keep: If fragments are kept, else they are encoded on every get,
+            for stores under one keeping its own, as a tiered store.
+    """
+
+    keep: bool
+    _fragments: dict[int, tuple[UserInDB, bytes]]
+
+    def __init__(self, keep: bool = True) -> None:
+        self.keep = keep
+        self._fragments = {}
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def put(self, user: UserInDB) -> None:
+        if self.keep:
+            self._fragments[user.id] = (user, encode_user(user))
+
+    def discard(self, user_id: int) -> None:
+        self._fragments.pop(user_id, None)
+
+    def get(self, user: UserInDB) -> bytes:
+        """Returns the fragment of the user, encoding it if it is stale."""
+        entry = self._fragments.get(user.id)
+        if entry is not None and (entry[0] is user or entry[0] == user):
+            return entry[1]
+        fragment = encode_user(user)
+        if self.keep:
+            self._fragments[user.id] = (user, fragment)
+        return fragment
+
+
+# Shared by every repository, next() on it is atomic so no lock is needed
+_generations = itertools.count(1)
+
+
 class UserRepository(ABC):
+    # Replaced, never mutated, so it can be iterated while others subscribe
+    _listeners: tuple[UserChangeListener, ...] = ()
+    _generation: int = 0
+
+    @property
+    def generation(self) -> int:
+        """Number changed by every mutation in store.
+
+        Results read after getting a generation are at least as recent as
+        it, so they can be cached by it until it changes. Generations are
+        unique, not consecutive, and only mutations made through this
+        repository change it.
+        """
+        return self._generation
+
+    def subscribe(self, listener: UserChangeListener) -> Callable[[], None]:
+        """Calls the listener after every mutation in store.
+
+        Listeners are called synchronously by the thread that made the
+        mutation, so they must be quick and must not raise.
+
+        Returns:
+            A function that unsubscribes the listener.
+        """
+        self._listeners = (*self._listeners, listener)
+
+        def unsubscribe() -> None:
+            self._listeners = tuple(
+                li for li in self._listeners if li is not listener
+            )
+
+        return unsubscribe
+
+    def _publish(self, op: UserChangeOp, user: UserInDB) -> None:
+        self._generation = next(_generations)
+        if self._listeners:
+            change = UserChange(op, user)
+            for listener in self._listeners:
+                listener(change)
+
     @abstractmethod
-    def find_all(self) -> list[UserInDB]:
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
         """Returns all users in store.
 
+        Args:
+            gym_id: If given, only the users of this gym are returned.
+            where: If given, only the users matching it are returned.
+
         Raises:
             UserRepositoryError: If the underline operation in user store failed
         """
@@ -31,6 +173,163 @@ class UserRepository(ABC):
             UserRepositoryError: If the underline operation in user store failed
         """
 
+    def find_all_fields(
+        self,
+        fields: Sequence[str],
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+    ) -> list[dict[str, Any]]:
+        """Returns some fields of all users in store, as find_all.
+
+        Stores able to read only some fields should override this default,
+        which reads whole users.
+
+        Args:
+            fields: Names of the fields to return.
+            gym_id: If given, only the users of this gym are returned.
+            where: If given, only the users matching it are returned.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        return [
+            {f: getattr(u, f) for f in fields}
+            for u in self.find_all(gym_id, where)
+        ]
+
+    def find_fields_by_id(
+        self, user_id: int, fields: Sequence[str]
+    ) -> dict[str, Any] | None:
+        """Find some fields of a user by Id, as find_by_id.
+
+        Stores able to read only some fields should override this default,
+        which reads the whole user.
+
+        Args:
+            user_id: The id of the user.
+            fields: Names of the fields to return.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        user = self.find_by_id(user_id)
+        return None if user is None else {f: getattr(user, f) for f in fields}
+
+    def encode(self, user: UserInDB) -> bytes:
+        """Returns the encoded public view of a user read from the store.
+
+        Stores should override this default, which encodes the user every
+        time, to keep the fragments of their users in UserFragments.
+        """
+        return encode_user(user)
+
+    def ping(self) -> None:
+        """Checks the store can be reached.
+
+        Stores backed by a server or file should override this default,
+        which does nothing.
+
+        Raises:
+            UserRepositoryError: If the store can't be reached.
+        """
+        return None
+
+    def close(self) -> None:
+        """Releases what the store holds open.
+
+        Stores holding files or connections should override this default,
+        which does nothing. The store must not be used after it.
+        """
+        return None
+
+    def warm(self, limit: int) -> int:
+        """Loads users into the read caches of the store, newest first.
+
+        Called before the store serves traffic, so the first reads don't
+        all miss. Stores with read caches should override this default,
+        which loads nothing.
+
+        Args:
+            limit: Max users loaded.
+
+        Returns:
+            The number of users loaded.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        return 0
+
+    def iter_all(
+        self,
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+        batch_size: int = 500,
+    ) -> Iterator[UserInDB]:
+        """Iterates over the users in store by id.
+
+        Stores that don't keep users in memory should override this
+        default, which loads every user at once, to fetch them in batches
+        of batch_size users.
+
+        Args:
+            gym_id: If given, only the users of this gym are returned.
+            where: If given, only the users matching it are returned.
+            batch_size: Max users fetched at once.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        yield from sorted(self.find_all(gym_id, where), key=lambda u: u.id)
+
+    def find_many(self, user_ids: Iterable[int]) -> dict[int, UserInDB]:
+        """Find many users by Id at once.
+
+        Stores able to fetch many records in a single round trip should
+        override this default, which looks up each id on its own.
+
+        Args:
+            user_ids: The ids of the users.
+
+        Returns:
+            The users found keyed by id. Ids without a user are left out.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        users: dict[int, UserInDB] = {}
+        for user_id in user_ids:
+            user = self.find_by_id(user_id)
+            if user is not None:
+                users[user_id] = user
+        return users
+
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        """Search users by username and name.
+
+        Stores with a search index should override this default, which
+        indexes every user on each call.
+
+        Args:
+            query: Free text matched by prefix, or approximately, against
+                the username and name of the users.
+            limit: Max number of users to return.
+            gym_id: If given, only the users of this gym are searched.
+
+        Returns:
+            The matching users, best match first.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        index = UserSearchIndex()
+        users = {u.id: u for u in self.find_all(gym_id)}
+        for u in users.values():
+            index.add(u.id, u.username, u.name)
+        return [users[i] for i in index.search(query, limit)]
+
     @abstractmethod
     def create(self, user: UserCreate) -> UserInDB:
         """Create a new user in store.
@@ -46,68 +345,342 @@ class UserRepository(ABC):
         """
 
     @abstractmethod
-    def delete(self, user_id: int) -> UserInDB | None:
-        """Delete a user in store.
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        """Soft delete a user in store.
+
+        The user is kept as a tombstone, left out of every read, until it
+        is restored or purged. Its username stays taken until it is purged,
+        so it can always be restored.
 
         Args:
             user_id: The id of the user.
+            expected_version: If given, the user is only deleted if its
+                stored version is still this one.
 
         Returns:
             The deleted user or None if the user was not found.
 
         Raises:
+            UserRepositoryConflictError: If the stored version is not the
+                expected version
             UserRepositoryError: If the underline operation in user store failed
         """
 
     @abstractmethod
-    def update(self, user_id: int, user: UserUpdate) -> UserInDB | None:
-        """Update a user in store.
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        """Update a user in store, incrementing its version.
 
         Args:
             user_id: The id of the user to be updated.
             user: The new data to be updated in user.
+            expected_version: If given, the user is only updated if its
+                stored version is still this one.
 
         Returns:
             The updated user of None if the user was not found.
 
         Raises:
+            UserRepositoryConflictError: If the stored version is not the
+                expected version
+            UserRepositoryError: If the underline operation in user store failed
+        """
+
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        """Update a user like update, also returning the user it replaced.
+
+        The previous user is the very one the update was applied to, even
+        when other writes race with it. Stores should override this
+        default, which updates the version it read and reads again if
+        another write got first, to take it in the same swap.
+
+        Returns:
+            The user before and after the update, or None if the user was
+            not found.
+
+        Raises:
+            UserRepositoryConflictError: If the stored version is not the
+                expected version
             UserRepositoryError: If the underline operation in user store failed
         """
+        while True:
+            previous = self.find_by_id(user_id)
+            if previous is None:
+                return None
+            if expected_version not in (None, previous.version):
+                raise UserRepositoryConflictError(
+                    user_id, expected_version, previous.version
+                )
+            try:
+                updated = self.update(user_id, user, previous.version)
+            except UserRepositoryConflictError:
+                if expected_version is not None:
+                    raise
+                continue
+            return None if updated is None else (previous, updated)
+
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        """Restores a deleted user, not purged yet, incrementing its version.
+
+        Stores keeping tombstones must override this default, which finds
+        no deleted user.
+
+        Args:
+            user_id: The id of the user.
+            gym_id: If given, the user is only restored if it is of this gym.
+
+        Returns:
+            The restored user or None if there is no such deleted user.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        return None
+
+    def stored_ids(self) -> list[int]:
+        """Returns the ids of every user in store, by id, deleted users
+        included until they are purged.
+
+        Stores keeping tombstones must override this default, which only
+        returns the users not deleted.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        return sorted(u.id for u in self.find_all())
+
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        """Removes the tombstones of users deleted before a time for good.
+
+        Stores keeping tombstones must override this default, which finds
+        no deleted user.
+
+        Args:
+            before: Users deleted at this time or after are kept.
+            limit: Max users purged at once, the oldest deleted first.
+
+        Returns:
+            The ids of the purged users, in no particular order.
+
+        Raises:
+            UserRepositoryError: If the underline operation in user store failed
+        """
+        return []
 
 
 class InMemoryUserRepository(UserRepository):
+    """User store kept in a dict.
+
+    Updates and deletes are compare-and-swap operations: the new record is
+    built without holding any lock and only the final swap checks, under a
+    short lock, that the stored record is still the one that was read.
+
+    A search index over username and name and the encoded fragments of
+    the users are kept up to date on every mutation. Deleted users are
+    moved to a dict of tombstones, by id, with the time they were deleted.
+    """
+
     _data: dict[int, UserInDB]
+    _deleted: dict[int, tuple[UserInDB, datetime]]
     _cur_index: int
+    _next_id: Callable[[], int] | None
+    _lock: threading.Lock
+    _index: UserSearchIndex
+    _fragments: UserFragments
 
-    def __init__(self) -> None:
+    def __init__(self, next_id: Callable[[], int] | None = None) -> None:
+        """
+        Args:
+            next_id: Allocates the ids of new users, for stores sharing an
+                id space. By default ids are counted from 0.
+        """
         self._data = {}
+        self._deleted = {}
         self._cur_index = 0
+        self._next_id = next_id
+        self._lock = threading.Lock()
+        self._index = UserSearchIndex()
+        self._fragments = UserFragments()
+
+    def _check_version(
+        self, user: UserInDB, expected_version: int | None
+    ) -> None:
+        if expected_version is not None and user.version != expected_version:
+            raise UserRepositoryConflictError(
+                user.id, expected_version, user.version
+            )
+
+    def _compare_and_swap(
+        self, user_id: int, current: UserInDB, new: UserInDB | None
+    ) -> bool:
+        with self._lock:
+            if self._data.get(user_id) is not current:
+                return False
+            if new is None:
+                del self._data[user_id]
+                self._deleted[user_id] = (current, datetime.now(UTC))
+                self._index.remove(user_id)
+            else:
+                self._data[user_id] = new
+                self._index.add(user_id, new.username, new.name)
+            return True
+
+    @override
+    def warm(self, limit: int) -> int:
+        # Users are always in memory, only their fragments can be missing
+        users = list(self._data.values())[-limit:] if limit > 0 else []
+        for user in users:
+            self._fragments.get(user)
+        return len(users)
 
     @override
-    def find_all(self) -> list[UserInDB]:
-        return list(self._data.values())
+    def find_all(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        if gym_id is None and where is None:
+            return list(self._data.values())
+        return [
+            u
+            for u in list(self._data.values())
+            if (gym_id is None or u.gym_id == gym_id)
+            and (where is None or where.matches(u))
+        ]
 
     @override
     def find_by_id(self, user_id: int) -> UserInDB | None:
         return self._data.get(user_id, None)
 
+    @override
+    def encode(self, user: UserInDB) -> bytes:
+        return self._fragments.get(user)
+
+    @override
+    def find_many(self, user_ids: Iterable[int]) -> dict[int, UserInDB]:
+        data = self._data
+        return {i: u for i in user_ids if (u := data.get(i)) is not None}
+
+    @override
+    def search(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        if gym_id is not None:
+            # The index spans every gym, see ShardedUserRepository instead
+            return super().search(query, limit, gym_id)
+        data = self._data
+        return [
+            u
+            for i in self._index.search(query, limit)
+            if (u := data.get(i)) is not None
+        ]
+
     @override
     def create(self, user: UserCreate) -> UserInDB:
-        new_user_id = self._cur_index
+        if self._next_id is not None:
+            new_user_id = self._next_id()
+        else:
+            with self._lock:
+                new_user_id = self._cur_index
+                self._cur_index += 1
         new_user = UserInDB.from_user_create(new_user_id, user)
         self._data[new_user_id] = new_user
-        self._cur_index += 1
+        self._index.add(new_user_id, new_user.username, new_user.name)
+        self._fragments.put(new_user)
+        self._publish("create", new_user)
         return new_user
 
     @override
-    def delete(self, user_id: int) -> UserInDB | None:
-        return self._data.pop(user_id, None)
+    def delete(
+        self, user_id: int, expected_version: int | None = None
+    ) -> UserInDB | None:
+        while True:
+            u = self.find_by_id(user_id)
+            if u is None:
+                return None
+            self._check_version(u, expected_version)
+            if self._compare_and_swap(user_id, u, None):
+                self._fragments.discard(user_id)
+                self._publish("delete", u)
+                return u
+
+    @override
+    def update(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> UserInDB | None:
+        updated = self.update_with_previous(user_id, user, expected_version)
+        return None if updated is None else updated[1]
+
+    @override
+    def update_with_previous(
+        self,
+        user_id: int,
+        user: UserUpdate,
+        expected_version: int | None = None,
+    ) -> tuple[UserInDB, UserInDB] | None:
+        while True:
+            u = self.find_by_id(user_id)
+            if u is None:
+                return None
+            self._check_version(u, expected_version)
+            new_user = UserInDB(
+                **{**u.to_dict(), **user.to_dict(), "version": u.version + 1}
+            )
+            if self._compare_and_swap(user_id, u, new_user):
+                self._fragments.put(new_user)
+                self._publish("update", new_user)
+                return u, new_user
+
+    @override
+    def restore(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        with self._lock:
+            entry = self._deleted.get(user_id)
+            if entry is None or (
+                gym_id is not None and entry[0].gym_id != gym_id
+            ):
+                return None
+            del self._deleted[user_id]
+            user = UserInDB(
+                **{**entry[0].to_dict(), "version": entry[0].version + 1}
+            )
+            self._data[user_id] = user
+            self._index.add(user_id, user.username, user.name)
+        self._fragments.put(user)
+        self._publish("restore", user)
+        return user
+
+    @override
+    def stored_ids(self) -> list[int]:
+        with self._lock:
+            return sorted([*self._data, *self._deleted])
 
     @override
-    def update(self, user_id: int, user: UserUpdate) -> UserInDB | None:
-        u = self.find_by_id(user_id)
-        if u is None:
-            return None
-        u = UserInDB(**{**u.to_dict(), **user.to_dict()})
-        self._data[u.id] = u
-        return u
+    def purge_deleted(self, before: datetime, limit: int) -> list[int]:
+        with self._lock:
+            expired = heapq.nsmallest(
+                limit,
+                (
+                    (deleted_at, i)
+                    for i, (_, deleted_at) in self._deleted.items()
+                    if deleted_at < before
+                ),
+            )
+            for _, user_id in expired:
+                del self._deleted[user_id]
+        return [i for _, i in expired]
@@ -13,6 +13,31 @@ class HomeUser(HTTPEndpoint):
         return await user_controller.create_user(req)
 
 
+class BatchGetUser(HTTPEndpoint):
+    async def post(self, req: Request):
+        return await user_controller.batch_get_users(req)
+
+
+class ExportUser(HTTPEndpoint):
+    async def get(self, req: Request):
+        return await user_controller.export_users(req)
+
+
+class BulkUser(HTTPEndpoint):
+    async def post(self, req: Request):
+        return await user_controller.bulk_create_users(req)
+
+
+class UserChanges(HTTPEndpoint):
+    async def get(self, req: Request):
+        return await user_controller.user_changes(req)
+
+
+class SearchUser(HTTPEndpoint):
+    async def get(self, req: Request):
+        return await user_controller.search_users(req)
+
+
 class User(HTTPEndpoint):
     async def get(self, req: Request):
         return await user_controller.get_user(req)
@@ -24,7 +49,24 @@ class User(HTTPEndpoint):
         return await user_controller.update_user(req)
 
 
+class RestoreUser(HTTPEndpoint):
+    async def post(self, req: Request):
+        return await user_controller.restore_user(req)
+
+
+class UserAudit(HTTPEndpoint):
+    async def get(self, req: Request):
+        return await user_controller.user_audit(req)
+
+
 routes: tuple[Route, ...] = (
     Route("/", HomeUser),
+    Route("/batch-get", BatchGetUser),
+    Route("/bulk", BulkUser),
+    Route("/changes", UserChanges),
+    Route("/export.csv", ExportUser),
+    Route("/search", SearchUser),
     Route("/{user_id:int}", User),
+    Route("/{user_id:int}/audit", UserAudit),
+    Route("/{user_id:int}/restore", RestoreUser),
 )
@@ -1,13 +1,29 @@
-from collections.abc import Sequence
-from dataclasses import asdict, is_dataclass
+import asyncio
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import asdict, fields, is_dataclass
 from typing import Any
 
 from argon2 import PasswordHasher
 
-from src.models.user import UserCreate, UserCreateBody, UserInDB, UserUpdate
-from src.repositories.user import UserRepository
+from src.models.user import (
+    UserCreate,
+    UserCreateBody,
+    UserFilter,
+    UserInDB,
+    UserUpdate,
+)
+from src.repositories.user import (
+    UserRepository,
+    UserRepositoryConflictError,
+    encode_user,
+)
+from src.utils.audit import AuditLog, AuditRecord
 from src.utils.dataclass import ValidationError
-from src.utils.try_except import try_except
+from src.utils.decoder import Decoder, compile_decoder
+from src.utils.encoding import dump_json
+from src.utils.hashing import PasswordHashingPool
+from src.utils.singleflight import SingleFlight
+from src.utils.try_except import LazyMessage, try_except
 
 
 class UserServiceError(Exception): ...
@@ -27,13 +43,97 @@ class UserServiceValidationError(UserServiceError):
         self.validation_error = validation_error
 
 
+class UserServiceConflictError(UserServiceError):
+    current_version: int
+
+    def __init__(self, current_version: int) -> None:
+        super().__init__(f"User is at version {current_version}")
+        self.current_version = current_version
+
+
+_WARM_UP_USER = {
+    "username": "warm.up",
+    "name": "Warm Up",
+    "date_of_birth": "1990-01-01",
+    "role": "student",
+}
+
+
+def audit_values(user: UserInDB) -> dict[str, Any]:
+    """Values of a user kept in the audit log, all but the password."""
+    return user.to_dict(exclude=["password_hash"])
+
+
+def audit_diff(
+    before: UserInDB, after: UserInDB
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Values of the fields changed by an update, before and after it.
+
+    The version is always kept, so each record tells what it changed.
+    """
+    old, new = audit_values(before), audit_values(after)
+    changed = [k for k in new if k == "version" or old.get(k) != new[k]]
+    return {k: old.get(k) for k in changed}, {k: new[k] for k in changed}
+
+
 class UserService:
     repo: UserRepository
     ph: PasswordHasher
+    hashing: PasswordHashingPool
+    reads: SingleFlight[Any]
+    audit: AuditLog | None
 
-    def __init__(self, repo: UserRepository) -> None:
+    def __init__(
+        self,
+        repo: UserRepository,
+        hashing: PasswordHashingPool | None = None,
+        audit: AuditLog | None = None,
+    ) -> None:
+        """
+        Args:
+            repo: Store of the users.
+            hashing: Pool hashing the passwords of acreate_user, by default
+                one with the service hasher.
+            audit: Log the changes of users are appended to, None to not
+                keep them.
+        """
         self.repo = repo
-        self.ph = PasswordHasher()
+        self.ph = PasswordHasher() if hashing is None else hashing.hasher
+        self.hashing = (
+            PasswordHashingPool(self.ph) if hashing is None else hashing
+        )
+        self.reads = SingleFlight()
+        self.audit = audit
+
+    def _audit(
+        self,
+        op: str,
+        user: UserInDB,
+        actor: str | None,
+        before: dict[str, Any] | None,
+        after: dict[str, Any] | None,
+    ) -> None:
+        # Only enqueued, the log is written off the request path
+        if self.audit is not None:
+            self.audit.append(op, user.id, user.gym_id, actor, before, after)
+
+    def warm(self) -> int:
+        """Runs the decoders of the bodies and the encoder once on samples.
+
+        Decoders are compiled on first use, so this moves that cost and
+        the first run of the validators out of the first requests.
+
+        Returns:
+            The number of code paths run.
+        """
+        body = self.parse_create_body(
+            dump_json({**_WARM_UP_USER, "password": "warm-up-password"})
+        )
+        self.decode_body(compile_decoder(UserUpdate), dump_json(_WARM_UP_USER))
+        self.parse_filter({"role": "student", "name": "warm"})
+        user = UserInDB.from_user_create(0, self._user_create(body, "hash", 0))
+        encode_user(user)
+        return 4
 
     def get_dict_keys(
         self, body: Any, required_keys: Sequence[str]
@@ -58,45 +158,290 @@ class UserService:
             )
         return parsed_body
 
-    @try_except(UserServiceError, "Error creating new user")
-    def create_user(self, body: Any) -> UserInDB:
+    def decode_body[T](self, decoder: Decoder[T], body: Any) -> T:
+        """Decodes a request body in a single pass.
+
+        Args:
+            decoder: Decoder of the model to build.
+            body: Raw JSON bytes or text, an already parsed JSON object or
+                a model instance, which is returned as is.
+
+        Raises:
+            UserServiceValidationError: If the body has missing, unknown or
+                invalid fields.
+        """
+        if isinstance(body, decoder.cls):
+            return body
         try:
-            user_body = UserCreateBody(
-                **self.get_dict_keys(body, UserCreateBody.model_fields())
-            )
-            password_hash = self.ph.hash(user_body.password)
-            user_create = UserCreate(
-                **user_body.to_dict(exclude=["password"]),
+            if isinstance(body, bytes | bytearray | str):
+                return decoder.decode(body)
+            if is_dataclass(body) and not isinstance(body, type):
+                body = asdict(body)
+            return decoder.decode_obj(body)
+        except ValidationError as e:
+            raise UserServiceValidationError(validation_error=e) from e
+
+    def parse_filter(self, params: Mapping[str, Any]) -> UserFilter | None:
+        """Builds the filter of a user listing from its query params.
+
+        Params other than the filter fields are ignored.
+
+        Returns:
+            The filter or None if there are no filter params.
+
+        Raises:
+            UserServiceValidationError: If a filter param is invalid.
+        """
+        conditions = {
+            f.name: params[f.name]
+            for f in fields(UserFilter)
+            if f.name in params
+        }
+        if not conditions:
+            return None
+        return self.decode_body(compile_decoder(UserFilter), conditions)
+
+    def parse_create_body(self, body: Any) -> UserCreateBody:
+        """Decodes and validates a create body without creating the user.
+
+        Raises:
+            UserServiceValidationError: If the body is not valid.
+        """
+        return self.decode_body(compile_decoder(UserCreateBody), body)
+
+    def _user_create(
+        self, user_body: UserCreateBody, password_hash: str, gym_id: int
+    ) -> UserCreate:
+        try:
+            return UserCreate(
+                username=user_body.username,
+                name=user_body.name,
+                date_of_birth=user_body.date_of_birth,
+                role=user_body.role,
                 password_hash=password_hash,
+                gym_id=gym_id,
             )
         except ValidationError as e:
             raise UserServiceValidationError(validation_error=e) from e
-        else:
-            return self.repo.create(user_create)
+
+    @try_except(UserServiceError, "Error creating new user")
+    def create_user(
+        self, body: Any, gym_id: int = 0, actor: str | None = None
+    ) -> UserInDB:
+        user_body = self.parse_create_body(body)
+        password_hash = self.ph.hash(user_body.password)
+        user = self.repo.create(
+            self._user_create(user_body, password_hash, gym_id)
+        )
+        self._audit("create", user, actor, None, audit_values(user))
+        return user
+
+    async def acreate_user(
+        self, body: Any, gym_id: int = 0, actor: str | None = None
+    ) -> UserInDB:
+        """Creates a user like create_user, hashing on the hashing pool.
+
+        The event loop keeps serving other requests while the password is
+        hashed.
+        """
+        with try_except(UserServiceError, "Error creating new user"):
+            user_body = self.parse_create_body(body)
+            password_hash = await self.hashing.hash(user_body.password)
+            user = self.repo.create(
+                self._user_create(user_body, password_hash, gym_id)
+            )
+            self._audit("create", user, actor, None, audit_values(user))
+            return user
 
     @try_except(UserServiceError, "Error finding all users")
-    def find_all_users(self) -> list[UserInDB]:
-        return self.repo.find_all()
+    def find_all_users(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[UserInDB]:
+        return self.repo.find_all(gym_id, where)
 
-    def find_user_by_id(self, user_id: int) -> UserInDB | None:
-        with try_except(
-            UserServiceError, f"Error finding user with id: {user_id}"
-        ):
-            return self.repo.find_by_id(user_id)
+    @try_except(UserServiceError, "Error encoding all users")
+    def find_all_users_encoded(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> list[bytes]:
+        """Returns the users as find_all_users, each one encoded as JSON."""
+        return self.encode_users(self.repo.find_all(gym_id, where))
 
-    def update_user(self, user_id: int, body: Any) -> UserInDB | None:
-        with try_except(UserServiceError, f"Error updating user {user_id}"):
-            try:
-                user = UserUpdate(
-                    **self.get_dict_keys(body, UserUpdate.model_fields())
-                )
-            except ValidationError as e:
-                raise UserServiceValidationError(validation_error=e) from e
-            else:
-                return self.repo.update(user_id, user)
-
-    def delete_user_by_id(self, user_id: int) -> UserInDB | None:
-        with try_except(
-            UserServiceError, f"Error finding user with id: {user_id}"
-        ):
-            return self.repo.delete(user_id)
+    def encode_users(self, users: Iterable[UserInDB]) -> list[bytes]:
+        """Encodes the public view of users, reusing the stored fragments."""
+        return [self.repo.encode(u) for u in users]
+
+    def iter_users(
+        self, gym_id: int | None = None, where: UserFilter | None = None
+    ) -> Iterator[UserInDB]:
+        """Iterates over the users by id, fetching them in batches.
+
+        Raises:
+            UserRepositoryError: While iterating, if the store failed.
+        """
+        return self.repo.iter_all(gym_id, where)
+
+    @try_except(UserServiceError, "Error finding users by ids")
+    def find_users_by_ids(
+        self, user_ids: Iterable[int], gym_id: int | None = None
+    ) -> dict[int, UserInDB]:
+        users = self.repo.find_many(user_ids)
+        if gym_id is None:
+            return users
+        return {i: u for i, u in users.items() if u.gym_id == gym_id}
+
+    @try_except(UserServiceError, LazyMessage("Error searching users: {query}"))
+    def search_users(
+        self, query: str, limit: int, gym_id: int | None = None
+    ) -> list[UserInDB]:
+        return self.repo.search(query, limit, gym_id)
+
+    @try_except(UserServiceError, "Error finding fields of all users")
+    def find_all_users_fields(
+        self,
+        fields: Sequence[str],
+        gym_id: int | None = None,
+        where: UserFilter | None = None,
+    ) -> list[dict[str, Any]]:
+        """Returns only some fields of the users, read from the store."""
+        return self.repo.find_all_fields(fields, gym_id, where)
+
+    @try_except(
+        UserServiceError,
+        LazyMessage("Error finding fields of user with id: {user_id}"),
+    )
+    def find_user_fields_by_id(
+        self, user_id: int, fields: Sequence[str], gym_id: int | None = None
+    ) -> dict[str, Any] | None:
+        """Returns only some fields of a user, read from the store."""
+        if gym_id is None:
+            return self.repo.find_fields_by_id(user_id, fields)
+        read = fields if "gym_id" in fields else [*fields, "gym_id"]
+        user = self.repo.find_fields_by_id(user_id, read)
+        if user is None or user["gym_id"] != gym_id:
+            return None
+        if read is not fields:
+            del user["gym_id"]
+        return user
+
+    @try_except(
+        UserServiceError, LazyMessage("Error finding user with id: {user_id}")
+    )
+    def find_user_by_id(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        user = self.repo.find_by_id(user_id)
+        if user is None or (gym_id is not None and user.gym_id != gym_id):
+            return None
+        return user
+
+    async def afind_user_by_id(
+        self, user_id: int, gym_id: int | None = None
+    ) -> UserInDB | None:
+        """Finds a user like find_user_by_id, reading the store off the loop.
+
+        Concurrent calls with the same arguments share a single read, see
+        reads.stats for how many were coalesced.
+        """
+        return await self.reads.do(
+            ("find_user_by_id", user_id, gym_id),
+            lambda: asyncio.to_thread(self.find_user_by_id, user_id, gym_id),
+        )
+
+    async def afind_user_fields_by_id(
+        self, user_id: int, fields: Sequence[str], gym_id: int | None = None
+    ) -> dict[str, Any] | None:
+        """Finds some fields of a user like find_user_fields_by_id.
+
+        Concurrent calls with the same arguments share a single read, so
+        the returned dict must not be mutated.
+        """
+        fields = tuple(fields)
+        return await self.reads.do(
+            ("find_user_fields_by_id", user_id, fields, gym_id),
+            lambda: asyncio.to_thread(
+                self.find_user_fields_by_id, user_id, fields, gym_id
+            ),
+        )
+
+    @try_except(UserServiceError, LazyMessage("Error updating user {user_id}"))
+    def update_user(
+        self,
+        user_id: int,
+        body: Any,
+        expected_version: int | None = None,
+        gym_id: int | None = None,
+        actor: str | None = None,
+    ) -> UserInDB | None:
+        user = self.decode_body(compile_decoder(UserUpdate), body)
+        # Users never change gym, so this check can't go stale
+        if gym_id is not None and not self.find_user_by_id(user_id, gym_id):
+            return None
+        try:
+            if self.audit is None:
+                return self.repo.update(user_id, user, expected_version)
+            # The previous user comes from the same swap as the update, so
+            # the audited diff is right even when writes race
+            updated = self.repo.update_with_previous(
+                user_id, user, expected_version
+            )
+        except UserRepositoryConflictError as e:
+            raise UserServiceConflictError(e.current_version) from e
+        if updated is None:
+            return None
+        self._audit("update", updated[1], actor, *audit_diff(*updated))
+        return updated[1]
+
+    @try_except(
+        UserServiceError, LazyMessage("Error deleting user with id: {user_id}")
+    )
+    def delete_user_by_id(
+        self,
+        user_id: int,
+        expected_version: int | None = None,
+        gym_id: int | None = None,
+        actor: str | None = None,
+    ) -> UserInDB | None:
+        if gym_id is not None and not self.find_user_by_id(user_id, gym_id):
+            return None
+        try:
+            user = self.repo.delete(user_id, expected_version)
+        except UserRepositoryConflictError as e:
+            raise UserServiceConflictError(e.current_version) from e
+        if user is not None:
+            self._audit("delete", user, actor, audit_values(user), None)
+        return user
+
+    @try_except(
+        UserServiceError, LazyMessage("Error restoring user with id: {user_id}")
+    )
+    def restore_user_by_id(
+        self, user_id: int, gym_id: int | None = None, actor: str | None = None
+    ) -> UserInDB | None:
+        """Restores a deleted user, until its tombstone is purged."""
+        user = self.repo.restore(user_id, gym_id)
+        if user is not None:
+            self._audit("restore", user, actor, None, audit_values(user))
+        return user
+
+    @try_except(
+        UserServiceError,
+        LazyMessage("Error reading audit records of user {user_id}"),
+    )
+    def user_audit_records(
+        self,
+        user_id: int,
+        limit: int,
+        before_seq: int | None = None,
+        gym_id: int | None = None,
+    ) -> list[AuditRecord]:
+        """Returns the audit records of a user, newest first.
+
+        Args:
+            user_id: The user.
+            limit: Max records returned.
+            before_seq: If given, only records older than this one.
+            gym_id: If given, only records of users of this gym.
+        """
+        if self.audit is None:
+            return []
+        return self.audit.history(user_id, limit, before_seq, gym_id)
@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import queue
+import threading
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from src.utils.encoding import dump_json
+
+_SEGMENT_GLOB = "audit-*.jsonl"
+# Marks the end of the queue, so the writer stops after what came before
+_STOP = object()
+
+type _Entry = tuple[
+    str, str | None, str, int, int, dict[str, Any] | None, dict[str, Any] | None
+]
+
+
+@dataclass(frozen=True, slots=True)
+class AuditRecord:
+    """Change of a user, as written to the audit log.
+
+    Attributes:
+        seq: Number of the record, increasing across segments.
+        at: ISO time of the change, in UTC.
+        actor: Who made the change, None if unknown.
+        op: The kind of change, see UserChangeOp.
+        user_id: The changed user.
+        gym_id: Gym of the changed user.
+        before: Values before the change, None for creates.
+        after: Values after the change, None for deletes.
+    """
+
+    seq: int
+    at: str
+    actor: str | None
+    op: str
+    user_id: int
+    gym_id: int
+    before: dict[str, Any] | None
+    after: dict[str, Any] | None
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class _Segment:
+    path: Path
+    # Positions of the records of each user, as (seq, offset, gym_id) by
+    # seq
+    positions: dict[int, list[tuple[int, int, int]]]
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix(".idx")
+
+
+class AuditLog:
+    """Append-only log of user changes, in rotated segment files.
+
+    Appending only enqueues the record, so changes never wait for the
+    disk, and records are dropped while the queue is full. A writer thread
+    takes the queued records in batches, writes each batch as JSON lines
+    to the active segment with a single write and sync, and starts a new
+    segment once the active one reaches `segment_size` bytes. Records are
+    only readable once written.
+
+    Each segment has an index of the offsets of the records of each user,
+    kept in memory and saved next to the segment when it is sealed, so
+    the history of a user is read without scanning the segments.
+
+    Attributes:
+        directory: Directory of the segments.
+        segment_size: Bytes after which a new segment is started.
+        batch_size: Max records written at once.
+        fsync: If each batch is synced to disk before the next.
+        dropped: Records dropped because the queue was full.
+    """
+
+    directory: Path
+    segment_size: int
+    batch_size: int
+    fsync: bool
+    dropped: int
+    _queue: queue.Queue[Any]
+    _segments: list[_Segment]
+    _lock: threading.Lock
+    _seq: int
+    _logger: logging.Logger
+    _thread: threading.Thread
+
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_size: int = 64 * 1024 * 1024,
+        batch_size: int = 256,
+        max_queued: int = 10_000,
+        fsync: bool = True,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        """
+        Args:
+            directory: Directory of the segments, created if missing.
+            segment_size: Bytes after which a new segment is started.
+            batch_size: Max records written at once.
+            max_queued: Records queued before appends are dropped, until
+                the writer catches up.
+            fsync: If each batch is synced to disk before the next.
+        """
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.dropped = 0
+        self._queue = queue.Queue(max_queued)
+        self._lock = threading.Lock()
+        self._logger = logger or logging.getLogger(__name__)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segments = self._load()
+        self._seq = max(
+            (p[-1][0] for s in self._segments for p in s.positions.values()),
+            default=0,
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="audit-log", daemon=True
+        )
+        self._thread.start()
+
+    def _load(self) -> list[_Segment]:
+        paths = sorted(self.directory.glob(_SEGMENT_GLOB))
+        segments = []
+        for i, path in enumerate(paths):
+            segment = _Segment(path, {})
+            sealed = i < len(paths) - 1
+            if sealed and segment.index_path.exists():
+                index = json.loads(segment.index_path.read_text())
+                segment.positions = {
+                    int(k): [tuple(p) for p in v] for k, v in index.items()
+                }
+            else:
+                self._scan(segment, truncate=not sealed)
+            segments.append(segment)
+        return segments
+
+    def _scan(self, segment: _Segment, truncate: bool) -> None:
+        offset = 0
+        with segment.path.open("rb") as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                segment.positions.setdefault(data["user_id"], []).append(
+                    (data["seq"], offset, data["gym_id"])
+                )
+                offset += len(line)
+        if truncate:
+            # Drops a record cut short by a crash, so appends start clean
+            os.truncate(segment.path, offset)
+
+    def append(
+        self,
+        op: str,
+        user_id: int,
+        gym_id: int,
+        actor: str | None,
+        before: dict[str, Any] | None,
+        after: dict[str, Any] | None,
+    ) -> None:
+        """Enqueues a change to be written, dropping it if the queue is
+        full, so the caller never waits for the writer."""
+        at = datetime.now(UTC).isoformat()
+        try:
+            self._queue.put_nowait(
+                (at, actor, op, user_id, gym_id, before, after)
+            )
+        except queue.Full:
+            # Not under the lock, which the writer holds while writing
+            self.dropped += 1
+            self._logger.warning(
+                "Audit queue is full, dropped the %s of user %d", op, user_id
+            )
+
+    def _take_batch(self) -> list[Any]:
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _new_segment(self, seq: int) -> _Segment:
+        if self._segments:
+            sealed = self._segments[-1]
+            sealed.index_path.write_text(dump_json(sealed.positions))
+        segment = _Segment(self.directory / f"audit-{seq:012d}.jsonl", {})
+        self._segments.append(segment)
+        return segment
+
+    def _write(self, entries: list[_Entry]) -> None:
+        with self._lock:
+            seq = self._seq
+            segment = self._segments[-1] if self._segments else None
+        if segment is None or (
+            segment.path.exists()
+            and segment.path.stat().st_size >= self.segment_size
+        ):
+            segment = self._new_segment(seq + 1)
+        lines: list[bytes] = []
+        positions: list[tuple[int, int, int, int]] = []
+        offset = segment.path.stat().st_size if segment.path.exists() else 0
+        for at, actor, op, user_id, gym_id, before, after in entries:
+            seq += 1
+            record = AuditRecord(
+                seq, at, actor, op, user_id, gym_id, before, after
+            )
+            line = dump_json(record.to_dict()).encode() + b"\n"
+            positions.append((user_id, seq, offset, gym_id))
+            lines.append(line)
+            offset += len(line)
+        with segment.path.open("ab") as f:
+            f.write(b"".join(lines))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        with self._lock:
+            for user_id, record_seq, record_offset, gym_id in positions:
+                segment.positions.setdefault(user_id, []).append(
+                    (record_seq, record_offset, gym_id)
+                )
+            self._seq = seq
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            entries = [e for e in batch if isinstance(e, tuple)]
+            if entries:
+                try:
+                    self._write(entries)
+                except Exception:
+                    # Kept going, so one failed write doesn't stop the log
+                    self._logger.exception(
+                        "Error writing %d audit records", len(entries)
+                    )
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch[-1] is _STOP:
+                return
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every record appended so far is written.
+
+        Returns:
+            False if the timeout expired first.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def history(
+        self,
+        user_id: int,
+        limit: int,
+        before_seq: int | None = None,
+        gym_id: int | None = None,
+    ) -> list[AuditRecord]:
+        """Returns the written records of a user, newest first.
+
+        Args:
+            user_id: The user.
+            limit: Max records returned.
+            before_seq: If given, only records older than this one, to
+                page through the history.
+            gym_id: If given, only records of this gym.
+        """
+        with self._lock:
+            found: list[tuple[Path, int]] = []
+            for segment in reversed(self._segments):
+                positions = reversed(segment.positions.get(user_id, ()))
+                for seq, offset, record_gym_id in positions:
+                    if (before_seq is not None and seq >= before_seq) or (
+                        gym_id is not None and record_gym_id != gym_id
+                    ):
+                        continue
+                    found.append((segment.path, offset))
+                    if len(found) >= limit:
+                        break
+                if len(found) >= limit:
+                    break
+        records = []
+        for path, offset in found:
+            with path.open("rb") as f:
+                f.seek(offset)
+                records.append(AuditRecord(**json.loads(f.readline())))
+        return records
+
+    def close(self, timeout: float | None = None) -> None:
+        """Writes the queued records and stops the writer."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
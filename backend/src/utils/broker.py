@@ -0,0 +1,230 @@
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    """Published event, with its Server-Sent Events frame encoded once."""
+
+    id: int
+    type: str
+    data: str
+    topic: str | None = None
+    frame: bytes = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        frame = f"id: {self.id}\nevent: {self.type}\ndata: {self.data}\n\n"
+        object.__setattr__(self, "frame", frame.encode())
+
+
+class Subscription:
+    """Bounded buffer of the events published to one subscriber.
+
+    A subscriber that lets `max_size` events pile up is evicted: its buffer
+    is dropped and the subscription is closed, so it must subscribe again
+    from the last event it got.
+
+    Attributes:
+        max_size: Max events waiting to be consumed.
+        topic: If given, only the events of this topic are delivered.
+        closed: If no more events will be delivered.
+        evicted: If it was closed for being too slow.
+    """
+
+    max_size: int
+    topic: str | None
+    closed: bool
+    evicted: bool
+    _events: deque[Event]
+    _replayed: int
+    _ready: asyncio.Event
+    _broker: "Broker"
+
+    def __init__(
+        self, broker: "Broker", max_size: int, topic: str | None = None
+    ) -> None:
+        self.max_size = max_size
+        self.topic = topic
+        self.closed = False
+        self.evicted = False
+        self._events = deque()
+        # Missed events replayed on subscribing, on top of max_size
+        self._replayed = 0
+        self._ready = asyncio.Event()
+        self._broker = broker
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def _accepts(self, event: Event) -> bool:
+        return self.topic is None or event.topic in (None, self.topic)
+
+    def _push(self, event: Event) -> bool:
+        # Called under the broker lock, False if the subscriber was evicted
+        if not self._accepts(event):
+            return True
+        if len(self._events) - self._replayed >= self.max_size:
+            self._events.clear()
+            self.closed = self.evicted = True
+            return False
+        self._events.append(event)
+        return True
+
+    def _wake(self) -> None:
+        if self._events or self.closed:
+            self._ready.set()
+
+    async def get(self) -> list[Event]:
+        """Waits for events and takes all those waiting at once.
+
+        Returns:
+            The events in publishing order, empty once the subscription is
+            closed.
+        """
+        if not self._events and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        # Publishers may append from other threads
+        with self._broker._lock:
+            events = list(self._events)
+            self._events.clear()
+            self._replayed = 0
+        return events
+
+    def close(self) -> None:
+        """Stops receiving events."""
+        self._broker._unsubscribe(self)
+        self.closed = True
+        self._ready.set()
+
+
+class Broker:
+    """In-process publish/subscribe of events to asyncio subscribers.
+
+    Events get increasing ids and the last `history_size` ones are kept, so
+    subscribers can resume from the last event id they got. Publishing is
+    thread-safe and never blocks: each event is added to the buffer of
+    every subscriber and slow subscribers are evicted.
+
+    Attributes:
+        buffer_size: Max events waiting for each subscriber.
+        history_size: Events kept to resume from.
+    """
+
+    RESET: ClassVar[str] = "reset"
+
+    buffer_size: int
+    history_size: int
+    _lock: threading.Lock
+    _last_id: int
+    _history: deque[Event]
+    _subscribers: set[Subscription]
+    _loop: asyncio.AbstractEventLoop | None
+
+    def __init__(
+        self, buffer_size: int = 256, history_size: int = 1024
+    ) -> None:
+        self.buffer_size = buffer_size
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(
+        self, event_type: str, data: str, topic: str | None = None
+    ) -> Event:
+        """Publishes an event to every subscriber.
+
+        Args:
+            event_type: Name of the event.
+            data: Payload of the event, a single line.
+            topic: If given, the event only goes to the subscribers of all
+                topics or of this topic.
+
+        Returns:
+            The published event.
+        """
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, event_type, data, topic)
+            self._history.append(event)
+            evicted = [s for s in self._subscribers if not s._push(event)]
+            self._subscribers.difference_update(evicted)
+            subscribers = [*self._subscribers, *evicted]
+        if subscribers:
+            self._call_soon(self._wake, subscribers)
+        return event
+
+    def _call_soon(self, callback, *args) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            callback(*args)
+        else:
+            loop.call_soon_threadsafe(callback, *args)
+
+    @staticmethod
+    def _wake(subscribers: list[Subscription]) -> None:
+        for s in subscribers:
+            s._wake()
+
+    def subscribe(
+        self, last_event_id: int | None = None, topic: str | None = None
+    ) -> Subscription:
+        """Subscribes to the events published from now on.
+
+        Must be called from the event loop the subscribers run on.
+
+        Args:
+            topic: If given, only the events of this topic are delivered.
+            last_event_id: Id of the last event received before, to first
+                get the events published since then. When those events are
+                no longer kept, a "reset" event is delivered first, telling
+                the subscriber to reload its whole state.
+
+        Returns:
+            The subscription, to be closed when done.
+        """
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, self.buffer_size, topic)
+        with self._lock:
+            if last_event_id is not None:
+                self._replay(subscription, last_event_id)
+            if not subscription.closed:
+                self._subscribers.add(subscription)
+        subscription._wake()
+        return subscription
+
+    def _replay(self, subscription: Subscription, last_event_id: int) -> None:
+        first_id = self._history[0].id if self._history else self._last_id + 1
+        if not first_id - 1 <= last_event_id <= self._last_id:
+            subscription._push(Event(self._last_id, self.RESET, "{}"))
+            return
+        missed = [
+            e
+            for e in self._history
+            if e.id > last_event_id and subscription._accepts(e)
+        ]
+        subscription._events.extend(missed)
+        subscription._replayed = len(missed)
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
@@ -0,0 +1,145 @@
+import asyncio
+import contextlib
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+type Purge = Callable[[datetime, int], list[int]]
+"""Purges up to a number of tombstones older than a time, see
+UserRepository.purge_deleted."""
+
+
+@dataclass(frozen=True, slots=True)
+class OffPeakWindow:
+    """Hours of the day, in UTC, when background work can run.
+
+    Attributes:
+        start_hour: First hour of the window.
+        end_hour: Hour the window ends, before start_hour if it spans
+            midnight.
+    """
+
+    start_hour: int
+    end_hour: int
+
+    def __post_init__(self) -> None:
+        if not (0 <= self.start_hour < 24 and 0 <= self.end_hour < 24):
+            raise ValueError("Window hours must be from 0 to 23")
+        if self.start_hour == self.end_hour:
+            # Would be an empty window, an empty text is for always
+            raise ValueError("Window must not start and end at one hour")
+
+    @classmethod
+    def parse(cls, text: str) -> "OffPeakWindow | None":
+        """Parses a START-END window, e.g. 2-5 or 22-4, empty for always.
+
+        Raises:
+            ValueError: If the text is not a window.
+        """
+        if not text.strip():
+            return None
+        start, sep, end = text.partition("-")
+        if not sep:
+            raise ValueError(f"Invalid window {text}, expected START-END")
+        return cls(int(start), int(end))
+
+    def contains(self, now: datetime) -> bool:
+        hour = now.astimezone(UTC).hour
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= hour < self.end_hour
+        return hour >= self.start_hour or hour < self.end_hour
+
+
+class TombstoneCompactor:
+    """Purges the tombstones of deleted users in the background.
+
+    Every `interval` seconds, inside the off-peak window, tombstones older
+    than `retention` are purged in batches of `batch_size`, with a pause
+    between batches. So a large purge is spread over many short writes
+    instead of one long write blocking every other, and stops as soon as
+    the window ends.
+
+    Attributes:
+        retention: How long deleted users can still be restored.
+        window: When purges can run, None for any time.
+        batch_size: Max tombstones purged at once.
+        pause: Seconds between batches.
+        interval: Seconds between purge runs.
+        purged: Tombstones purged so far.
+    """
+
+    retention: timedelta
+    window: OffPeakWindow | None
+    batch_size: int
+    pause: float
+    interval: float
+    purged: int
+    _purge: Purge
+    _clock: Callable[[], datetime]
+    _logger: logging.Logger
+    _task: asyncio.Task[None] | None
+
+    def __init__(
+        self,
+        purge: Purge,
+        retention: timedelta,
+        window: OffPeakWindow | None = None,
+        batch_size: int = 100,
+        pause: float = 0.5,
+        interval: float = 300.0,
+        clock: Callable[[], datetime] = lambda: datetime.now(UTC),
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.retention = retention
+        self.window = window
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.purged = 0
+        self._purge = purge
+        self._clock = clock
+        self._logger = logger or logging.getLogger(__name__)
+        self._task = None
+
+    def _in_window(self) -> bool:
+        return self.window is None or self.window.contains(self._clock())
+
+    async def compact(self) -> int:
+        """Purges batches while there are expired tombstones and it is in
+        the window.
+
+        Returns:
+            The number of tombstones purged.
+        """
+        purged = 0
+        while self._in_window():
+            before = self._clock() - self.retention
+            ids = await asyncio.to_thread(self._purge, before, self.batch_size)
+            purged += len(ids)
+            self.purged += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        return purged
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if purged := await self.compact():
+                    self._logger.info("Purged %d deleted users", purged)
+            except Exception:
+                self._logger.exception("Error purging deleted users")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Starts purging in the background, from the event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
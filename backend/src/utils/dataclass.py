@@ -3,6 +3,23 @@ from dataclasses import asdict, dataclass, fields, is_dataclass
 from typing import Any, NotRequired, TypedDict
 
 _INIT_NAME = "__init__"
+_fail_fast = False
+
+
+def set_fail_fast(enabled: bool) -> None:
+    """Sets if validation stops at the first invalid field.
+
+    By default every field is validated and all the errors are reported
+    together. In fail fast mode the ValidationError holds only the first
+    error, which makes rejecting invalid data cheaper.
+    """
+    global _fail_fast
+    _fail_fast = enabled
+
+
+def is_fail_fast() -> bool:
+    """Returns if validation stops at the first invalid field."""
+    return _fail_fast
 
 
 @dataclass
@@ -99,7 +116,7 @@ def is_dataclass_class(cls) -> bool:
     return is_dataclass(cls) and isinstance(cls, type)
 
 
-def _validator_name(field_name: str) -> str:
+def validator_name(field_name: str) -> str:
     return f"__validate_{field_name}__"
 
 
@@ -108,13 +125,15 @@ def validate_fields(self):
     for field in fields(self):
         name = field.name
         value = getattr(self, name)
-        validator = getattr(self, _validator_name(name), None)
+        validator = getattr(self, validator_name(name), None)
 
         try:
             if validator and not validator(name=name, value=value):
                 raise FieldError(name=name, value=value)
         except FieldError as f:
             errors.append(f)
+            if _fail_fast:
+                break
     if errors:
         raise ValidationError(cls_name=self.__class__.__name__, errors=errors)
 
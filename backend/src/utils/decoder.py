@@ -0,0 +1,149 @@
+import functools
+import json
+from collections.abc import Callable, Mapping
+from dataclasses import MISSING, dataclass, fields
+from typing import Any
+
+from src.utils.dataclass import (
+    FieldError,
+    ValidationError,
+    is_dataclass_class,
+    is_fail_fast,
+    validator_name,
+)
+
+_BODY = "body"
+
+
+@dataclass(frozen=True, slots=True)
+class _FieldSpec:
+    name: str
+    validator: Callable[..., bool] | None
+    # Builds the value of an omitted field, None if the field is required
+    default: Callable[[], Any] | None
+
+
+def _constant(value: Any) -> Callable[[], Any]:
+    return lambda: value
+
+
+class Decoder[T]:
+    """Decoder from JSON bodies to a validated dataclass.
+
+    The fields, their validators and their defaults are looked up once, when
+    the decoder is created. Decoding then fills a new instance straight from
+    the parsed body and runs the validators on it, skipping the dataclass
+    __init__ and the intermediate dicts.
+
+    Missing, unknown and invalid fields are all reported in a single
+    ValidationError, or just the first one in fail fast mode.
+
+    Attributes:
+        cls: Dataclass the bodies are decoded to.
+    """
+
+    cls: type[T]
+    _specs: tuple[_FieldSpec, ...]
+    _names: frozenset[str]
+
+    def __init__(self, cls: type[T]) -> None:
+        if not is_dataclass_class(cls):
+            raise ValueError(f"class {cls.__name__} must be a dataclass")
+        specs: list[_FieldSpec] = []
+        for f in fields(cls):  # type: ignore[arg-type]
+            if not f.init:
+                continue
+            if f.default is not MISSING:
+                default = _constant(f.default)
+            elif f.default_factory is not MISSING:
+                default = f.default_factory
+            else:
+                default = None
+            validator = getattr(cls, validator_name(f.name), None)
+            specs.append(_FieldSpec(f.name, validator, default))
+        self.cls = cls
+        self._specs = tuple(specs)
+        self._names = frozenset(s.name for s in specs)
+
+    def decode(self, data: bytes | bytearray | str) -> T:
+        """Decodes a JSON document to a validated instance.
+
+        Raises:
+            ValidationError: If the document is not valid JSON or not a
+                valid object for the dataclass.
+        """
+        try:
+            obj = json.loads(data)
+        except ValueError as e:
+            raise self._error(
+                [FieldError(_BODY, None, f"body must be valid JSON: {e}")]
+            ) from e
+        return self.decode_obj(obj)
+
+    def decode_obj(self, obj: Any) -> T:
+        """Builds a validated instance from an already parsed JSON object.
+
+        Raises:
+            ValidationError: If the object is not a mapping or has missing,
+                unknown or invalid fields.
+        """
+        if not isinstance(obj, Mapping):
+            raise self._error(
+                [
+                    FieldError(
+                        _BODY,
+                        type(obj).__name__,
+                        "body must be a JSON object",
+                    )
+                ]
+            )
+        instance = self.cls.__new__(self.cls)
+        errors: list[FieldError] = []
+        fail_fast = is_fail_fast()
+        for spec in self._specs:
+            error = self._set_field(instance, spec, obj)
+            if error is not None:
+                errors.append(error)
+                if fail_fast:
+                    break
+        if not (errors and fail_fast) and not self._names.issuperset(obj):
+            errors.extend(
+                FieldError(name, obj[name], "unknown field")
+                for name in obj
+                if name not in self._names
+            )
+        if errors:
+            raise self._error(errors)
+        post_init = getattr(instance, "__post_init__", None)
+        if post_init is not None:
+            post_init()
+        return instance
+
+    @staticmethod
+    def _set_field(
+        instance: Any, spec: _FieldSpec, obj: Mapping[str, Any]
+    ) -> FieldError | None:
+        if spec.name not in obj:
+            if spec.default is None:
+                return FieldError(spec.name, None, "field is required")
+            object.__setattr__(instance, spec.name, spec.default())
+            return None
+        value = obj[spec.name]
+        object.__setattr__(instance, spec.name, value)
+        try:
+            if spec.validator is not None and not spec.validator(
+                instance, name=spec.name, value=value
+            ):
+                return FieldError(spec.name, value)
+        except FieldError as e:
+            return e
+        return None
+
+    def _error(self, errors: list[FieldError]) -> ValidationError:
+        return ValidationError(cls_name=self.cls.__name__, errors=errors)
+
+
+@functools.cache
+def compile_decoder[T](cls: type[T]) -> Decoder[T]:
+    """Returns the decoder of a dataclass, creating it on first use."""
+    return Decoder(cls)
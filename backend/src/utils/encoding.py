@@ -0,0 +1,20 @@
+import json
+from collections.abc import Iterable
+from typing import Any
+
+
+def dump_json(content: Any) -> str:
+    """Encodes JSON compactly, with dates and other objects as str."""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def join_json_array(fragments: Iterable[bytes]) -> bytes:
+    """Joins encoded JSON values into an encoded array, as dump_json would."""
+    return b"[" + b",".join(fragments) + b"]"
@@ -0,0 +1,47 @@
+import csv
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any
+
+# Spreadsheets run cells starting with these as formulas
+_FORMULA_CHARS = ("=", "+", "-", "@", "\t", "\r")
+
+
+class _Line:
+    # File-like target of csv.writer, returning each line instead
+    def write(self, line: str) -> str:
+        return line
+
+
+def csv_cell(value: Any) -> Any:
+    """Quotes text read as a formula by spreadsheets, keeping it as text."""
+    if isinstance(value, str) and value.startswith(_FORMULA_CHARS):
+        return f"'{value}"
+    return value
+
+
+def iter_csv(
+    header: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    rows_per_chunk: int = 256,
+) -> Iterator[bytes]:
+    """Encodes rows as CSV lazily, a chunk of rows at a time.
+
+    Only one chunk is held in memory, whatever the number of rows.
+
+    Args:
+        header: Names of the columns, the first line.
+        rows: Values of each line, converted with str.
+        rows_per_chunk: Lines yielded at once.
+
+    Returns:
+        The UTF-8 encoded CSV, in chunks.
+    """
+    writer = csv.writer(_Line())
+    lines: list[str] = [writer.writerow(header)]
+    for row in rows:
+        lines.append(writer.writerow([csv_cell(v) for v in row]))
+        if len(lines) >= rows_per_chunk:
+            yield "".join(lines).encode()
+            lines.clear()
+    if lines:
+        yield "".join(lines).encode()
@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from argon2 import PasswordHasher
+
+# Seconds a worker warming up waits for the others to start
+_WARM_UP_TIMEOUT = 5.0
+
+
+class PasswordHashingPool:
+    """Hashes passwords on worker threads, off the event loop.
+
+    Hashing is slow on purpose and argon2 releases the GIL while it runs,
+    so the workers hash in parallel while the event loop keeps serving.
+
+    Attributes:
+        hasher: Hasher run by the workers.
+        workers: Number of worker threads.
+    """
+
+    hasher: PasswordHasher
+    workers: int
+    _executor: ThreadPoolExecutor
+    _lock: threading.Lock
+    _pending: int
+
+    def __init__(
+        self, hasher: PasswordHasher | None = None, workers: int = 2
+    ) -> None:
+        self.hasher = PasswordHasher() if hasher is None else hasher
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="password-hashing"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Passwords being hashed or waiting for a worker."""
+        return self._pending
+
+    def _done(self, _: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(self.hasher.hash, password)
+        except BaseException:
+            self._done(Future())
+            raise
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    async def warm(self) -> int:
+        """Starts every worker, hashing a password on each at once.
+
+        Workers are started on demand, so otherwise the first requests
+        wait for the threads to start and argon2 to allocate its memory.
+
+        Returns:
+            The number of workers started.
+        """
+        started = threading.Barrier(self.workers)
+        await asyncio.gather(
+            *(
+                asyncio.wrap_future(
+                    self._executor.submit(self._warm_worker, started)
+                )
+                for _ in range(self.workers)
+            )
+        )
+        return self.workers
+
+    def _warm_worker(self, started: threading.Barrier) -> None:
+        self.hasher.hash("warm-up")
+        # Held until every worker hashed, or an idle one would be reused
+        # instead of starting the next
+        with contextlib.suppress(threading.BrokenBarrierError):
+            started.wait(_WARM_UP_TIMEOUT)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
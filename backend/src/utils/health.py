@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+type HealthCheck = Callable[[], Awaitable[str | None]]
+"""Checks a dependency, returning a detail or raising if it is unhealthy."""
+
+
+@dataclass(frozen=True, slots=True)
+class CheckResult:
+    """Outcome of the last run of a health check.
+
+    Attributes:
+        ok: If the check passed.
+        detail: What the check found, or why it failed.
+        checked_at: Monotonic time of the run.
+    """
+
+    ok: bool
+    detail: str | None
+    checked_at: float
+
+
+class HealthMonitor:
+    """Runs health checks on an interval and keeps their last results.
+
+    Probes only read the cached results, so they never reach the checked
+    dependencies themselves. The monitor also measures the event loop lag,
+    as how late its own sleeps wake up.
+
+    Attributes:
+        interval: Seconds between check runs.
+        timeout: Max seconds a check can run before it fails.
+        loop_lag: Seconds the last sleep woke up late.
+    """
+
+    interval: float
+    timeout: float
+    loop_lag: float
+    _checks: dict[str, HealthCheck]
+    _results: dict[str, CheckResult]
+    _clock: Callable[[], float]
+    _task: asyncio.Task[None] | None
+
+    def __init__(
+        self,
+        interval: float = 5.0,
+        timeout: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.interval = interval
+        self.timeout = timeout
+        self.loop_lag = 0.0
+        self._checks = {}
+        self._results = {}
+        self._clock = clock
+        self._task = None
+
+    def add(self, name: str, check: HealthCheck) -> None:
+        self._checks[name] = check
+
+    @property
+    def results(self) -> dict[str, CheckResult]:
+        return dict(self._results)
+
+    @property
+    def ready(self) -> bool:
+        """If every check ran and passed in the last interval or so."""
+        if set(self._results) != set(self._checks):
+            return False
+        # Results older than a few intervals mean the monitor is stuck
+        stale_at = self._clock() - 3 * self.interval
+        return all(
+            r.ok and r.checked_at > stale_at for r in self._results.values()
+        )
+
+    async def _check(self, name: str, check: HealthCheck) -> None:
+        try:
+            async with asyncio.timeout(self.timeout):
+                detail = await check()
+            result = CheckResult(True, detail, self._clock())
+        except TimeoutError:
+            result = CheckResult(
+                False, f"timed out after {self.timeout}s", self._clock()
+            )
+        except Exception as e:
+            result = CheckResult(False, str(e) or repr(e), self._clock())
+        self._results[name] = result
+
+    async def run_checks(self) -> dict[str, CheckResult]:
+        """Runs every check at once and caches the results."""
+        await asyncio.gather(
+            *(self._check(n, c) for n, c in list(self._checks.items()))
+        )
+        return self.results
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_checks()
+            start = self._clock()
+            await asyncio.sleep(self.interval)
+            self.loop_lag = max(0.0, self._clock() - start - self.interval)
+
+    def loop_lag_check(self, max_lag: float) -> HealthCheck:
+        """Check failing when the event loop lags more than max_lag."""
+
+        async def check() -> str:
+            if self.loop_lag > max_lag:
+                raise RuntimeError(f"event loop lag {self.loop_lag:.3f}s")
+            return f"{self.loop_lag:.3f}s"
+
+        return check
+
+    def start(self) -> None:
+        """Starts running the checks, from the event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
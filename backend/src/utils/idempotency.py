@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from starlette.responses import Response
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(*parts: bytes) -> str:
+    """Digest identifying the request an idempotency key was used with."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResponse:
+    """Response of a completed request, as sent to the client."""
+
+    fingerprint: str
+    status_code: int
+    raw_headers: tuple[tuple[bytes, bytes], ...]
+    body: bytes
+
+    @classmethod
+    def from_response(
+        cls, request_fingerprint: str, response: Response
+    ) -> "StoredResponse":
+        return cls(
+            request_fingerprint,
+            response.status_code,
+            tuple(response.raw_headers),
+            bytes(response.body),
+        )
+
+    def to_response(self, replayed: bool) -> Response:
+        response = Response(status_code=self.status_code)
+        response.raw_headers = list(self.raw_headers)
+        response.body = self.body
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+
+class IdempotencyKeyReusedError(Exception):
+    key: str
+
+    def __init__(self, key: str) -> None:
+        super().__init__(f"Idempotency key {key} used for another request")
+        self.key = key
+
+
+class IdempotencyStore:
+    """Bounded store of the responses of requests by idempotency key.
+
+    The first request with a key runs and its response is stored for `ttl`
+    seconds, up to `max_keys` keys with the least recently used dropped
+    first. Retries get the stored response instead of running again, and
+    retries arriving while the first request still runs wait for it.
+
+    Server errors (5xx) are not stored, so the request can be retried. A
+    key can only be used with one request fingerprint.
+
+    Attributes:
+        max_keys: Max number of stored responses.
+        ttl: Seconds a response is kept.
+    """
+
+    max_keys: int
+    ttl: float
+    _clock: Callable[[], float]
+    _responses: OrderedDict[str, tuple[float, StoredResponse]]
+    _in_flight: dict[str, tuple[str, asyncio.Future[StoredResponse | None]]]
+
+    def __init__(
+        self,
+        max_keys: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._clock = clock
+        self._responses = OrderedDict()
+        self._in_flight = {}
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def _get(self, key: str) -> StoredResponse | None:
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        expires_at, stored = entry
+        if expires_at <= self._clock():
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return stored
+
+    def _put(self, key: str, stored: StoredResponse) -> None:
+        self._responses[key] = (self._clock() + self.ttl, stored)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_keys:
+            self._responses.popitem(last=False)
+
+    async def run(
+        self,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        """Runs the request once per key and replays its response after.
+
+        Args:
+            key: Idempotency key sent by the client.
+            request_fingerprint: Digest of the request, see fingerprint.
+            handler: Handles the request when there is no stored response.
+
+        Returns:
+            The response of the handler or the stored one, marked with the
+            Idempotent-Replayed header.
+
+        Raises:
+            IdempotencyKeyReusedError: If the key was used with another
+                request fingerprint.
+        """
+        while True:
+            stored = self._get(key)
+            if stored is None and key in self._in_flight:
+                in_flight_fingerprint, future = self._in_flight[key]
+                if in_flight_fingerprint != request_fingerprint:
+                    raise IdempotencyKeyReusedError(key)
+                # None when the first request failed, then run it again
+                stored = await asyncio.shield(future)
+                if stored is None:
+                    continue
+            if stored is None:
+                return await self._run(key, request_fingerprint, handler)
+            if stored.fingerprint != request_fingerprint:
+                raise IdempotencyKeyReusedError(key)
+            return stored.to_response(replayed=True)
+
+    async def _run(
+        self,
+        key: str,
+        request_fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        future: asyncio.Future[StoredResponse | None] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._in_flight[key] = (request_fingerprint, future)
+        stored = None
+        try:
+            response = await handler()
+            if response.status_code < 500:
+                stored = StoredResponse.from_response(
+                    request_fingerprint, response
+                )
+                self._put(key, stored)
+            return response
+        finally:
+            del self._in_flight[key]
+            future.set_result(stored)
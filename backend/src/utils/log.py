@@ -0,0 +1,199 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from enum import StrEnum
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, override
+
+
+class ExceptionRateLimitFilter(logging.Filter):
+    """Logging filter that rate limits the tracebacks of logged exceptions.
+
+    Formatting and writing a traceback is the costly part of logging an
+    exception, so under a flood of errors only `rate` records per second
+    (with bursts up to `burst`) keep their traceback. The others are still
+    logged, but as their message alone, and the next traceback let through
+    tells how many were left out.
+
+    Attributes:
+        rate: Tracebacks let through per second.
+        burst: Max tracebacks let through at once.
+        suppressed: Tracebacks left out since the last one let through.
+    """
+
+    rate: float
+    burst: float
+    suppressed: int
+    _tokens: float
+    _last: float
+    _lock: threading.Lock
+
+    def __init__(self, rate: float = 1.0, burst: int = 10) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.suppressed = 0
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.suppressed += 1
+            return False
+
+    @override
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not record.exc_info:
+            return True
+        if not self._take():
+            record.exc_info = None
+            record.exc_text = None
+        elif self.suppressed:
+            with self._lock:
+                suppressed, self.suppressed = self.suppressed, 0
+            record.msg = f"{record.msg} [{suppressed} tracebacks suppressed]"
+        return True
+
+
+class QueuePolicy(StrEnum):
+    """What a full logging queue does with new records."""
+
+    DROP = "drop"
+    BLOCK = "block"
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler over a bounded queue, for a QueueListener to consume.
+
+    Logging from the event loop only costs putting the record in the queue,
+    the formatting and writing happen on the listener thread. When the
+    queue is full records are either dropped or the caller blocks until
+    there is room, and the next record queued tells how many were dropped.
+
+    Attributes:
+        policy: What to do with records when the queue is full.
+        dropped: Records dropped since the last one queued.
+    """
+
+    policy: QueuePolicy
+    dropped: int
+
+    def __init__(
+        self, maxsize: int = 10_000, policy: str = QueuePolicy.DROP
+    ) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.policy = QueuePolicy(policy)
+        self.dropped = 0
+
+    @override
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments into the message, since they may change
+        # before the record is handled. Unlike the default, the traceback is
+        # kept so the final handlers can filter and format it themselves.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    @override
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called under the handler lock, so no other thread changes dropped
+        if self.dropped:
+            record.msg = f"{record.msg} [{self.dropped} records dropped]"
+        try:
+            self.queue.put(record, block=self.policy is QueuePolicy.BLOCK)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+
+class _QueueListener(QueueListener):
+    @override
+    def enqueue_sentinel(self) -> None:
+        # Wait for room instead of failing when the queue is full
+        self.queue.put(self._sentinel)
+
+    @override
+    def stop(self) -> None:
+        # Allow stopping early, before the call registered at exit
+        if self._thread is not None:
+            super().stop()
+
+
+def start_queue_listener(
+    handler: logging.Handler, *handlers: logging.Handler
+) -> QueueListener:
+    """Starts handling the records of a queue handler on a thread.
+
+    The listener is stopped at exit, after handling the records left.
+
+    Args:
+        handler: Queue handler whose records are consumed.
+        *handlers: Handlers the records are passed to.
+
+    Returns:
+        The started listener.
+    """
+    if not isinstance(handler, QueueHandler):
+        raise TypeError(f"{handler!r} is not a QueueHandler")
+    listener = _QueueListener(
+        handler.queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+"""Correlation id of the request being handled, if any."""
+
+
+class RequestIdFilter(logging.Filter):
+    """Logging filter that tags records with the current request id.
+
+    Must be attached where the record is created, as in a queue handler,
+    since the id lives in the context of the request.
+    """
+
+    @override
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON objects."""
+
+    @override
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
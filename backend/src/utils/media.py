@@ -0,0 +1,127 @@
+from contextvars import ContextVar
+from typing import Any
+
+try:
+    import msgpack
+except ImportError:  # Optional, see the msgpack extra of the project
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Names MessagePack goes by, the first one is sent
+MSGPACK_TYPES = (MSGPACK, "application/vnd.msgpack", "application/x-msgpack")
+
+
+class UnsupportedMediaTypeError(Exception):
+    media_type: str
+
+    def __init__(self, media_type: str) -> None:
+        super().__init__(f"{media_type} bodies are not supported")
+        self.media_type = media_type
+
+
+response_media_type: ContextVar[str] = ContextVar(
+    "response_media_type", default=JSON
+)
+"""Format of the responses to the request being handled, see negotiate."""
+
+
+def msgpack_available() -> bool:
+    """If the msgpack package is installed, else only JSON is spoken."""
+    return msgpack is not None
+
+
+def _parse_accept(accept: str) -> list[tuple[str, float]]:
+    # Media ranges and their q-values, ranges with an invalid q are dropped
+    ranges = []
+    for part in accept.split(","):
+        media_range, *params = (p.strip() for p in part.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = -1.0
+        if media_range and 0.0 <= quality <= 1.0:
+            ranges.append((media_range.lower(), quality))
+    return ranges
+
+
+def _preference(
+    ranges: list[tuple[str, float]], media_types: tuple[str, ...]
+) -> tuple[float, int]:
+    # The q-value and specificity of the most specific range matching any
+    # of the media types, specificity -1 if none does
+    best = (0.0, -1)
+    for media_type in media_types:
+        wildcard = media_type.partition("/")[0] + "/*"
+        for media_range, quality in ranges:
+            if media_range == media_type:
+                specificity = 2
+            elif media_range == wildcard:
+                specificity = 1
+            elif media_range == "*/*":
+                specificity = 0
+            else:
+                continue
+            if specificity > best[1]:
+                best = (quality, specificity)
+    return best
+
+
+def negotiate(accept: str | None) -> str:
+    """Picks the format of a response from the Accept header of a request.
+
+    MessagePack is picked when it has a higher q-value than JSON, or the
+    same one by a more specific media range, as for "application/msgpack,
+    */*". Otherwise, or without msgpack installed, it is JSON, even if the
+    client doesn't accept it.
+
+    Returns:
+        JSON or MSGPACK.
+    """
+    if not accept or msgpack is None:
+        return JSON
+    ranges = _parse_accept(accept)
+    preference = _preference(ranges, MSGPACK_TYPES)
+    if preference[0] > 0 and preference > _preference(ranges, (JSON,)):
+        return MSGPACK
+    return JSON
+
+
+def body_media_type(content_type: str | None) -> str:
+    """Returns the format of a request body from its Content-Type header.
+
+    Bodies of any type but MessagePack are read as JSON, as they always
+    were.
+
+    Raises:
+        UnsupportedMediaTypeError: If the body is MessagePack but msgpack
+            is not installed.
+    """
+    media_type = (content_type or "").partition(";")[0].strip().lower()
+    if media_type not in MSGPACK_TYPES:
+        return JSON
+    if msgpack is None:
+        raise UnsupportedMediaTypeError(media_type)
+    return MSGPACK
+
+
+def dump_msgpack(content: Any) -> bytes:
+    """Encodes MessagePack, with dates and other objects as str like
+    dump_json, so both formats carry the same values."""
+    return msgpack.packb(content, default=str)
+
+
+def load_msgpack(data: bytes) -> Any:
+    """Decodes a single MessagePack value.
+
+    Raises:
+        ValueError: If data is not exactly one valid value.
+    """
+    try:
+        return msgpack.unpackb(data)
+    except ValueError as e:
+        raise ValueError("body must be a single MessagePack value") from e
@@ -0,0 +1,257 @@
+import codecs
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+from starlette.requests import Request
+
+from src.utils.media import msgpack
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+class BodyTooLargeError(Exception):
+    limit: int
+
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"Request body is larger than {limit} bytes")
+        self.limit = limit
+
+
+class InvalidJsonArrayError(ValueError):
+    index: int
+    reason: str
+
+    def __init__(self, index: int, reason: str) -> None:
+        super().__init__(reason)
+        self.index = index
+        self.reason = reason
+
+
+def _check_content_length(req: Request, max_size: int) -> None:
+    # Reject before reading anything when the client announces the size
+    content_length = req.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_size:
+        raise BodyTooLargeError(max_size)
+
+
+async def _stream(req: Request, max_size: int) -> AsyncIterator[bytes]:
+    _check_content_length(req, max_size)
+    size = 0
+    async for chunk in req.stream():
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLargeError(max_size)
+        yield chunk
+
+
+async def read_body(req: Request, max_size: int) -> bytes:
+    """Reads the request body, stopping as soon as it gets too large.
+
+    Unlike Request.body, the body is never buffered past max_size bytes.
+
+    Raises:
+        BodyTooLargeError: If the body is larger than max_size bytes.
+    """
+    return b"".join([chunk async for chunk in _stream(req, max_size)])
+
+
+class _ArrayReader:
+    # Incremental reader of a JSON array from the chunks of a stream
+
+    def __init__(
+        self, chunks: AsyncIterator[bytes], max_item_size: int
+    ) -> None:
+        self._chunks = chunks
+        self._max_item_size = max_item_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    async def _fill(self) -> bool:
+        # Appends the next chunk to the buffer, False at the end of stream
+        if self._eof:
+            return False
+        try:
+            chunk = await anext(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                self._buffer += self._decoder.decode(b"", final=True)
+                return False
+            text = self._decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise InvalidJsonArrayError(0, "body must be UTF-8") from e
+        self._buffer = self._buffer[self._pos :] + text
+        self._pos = 0
+        return True
+
+    async def _peek(self) -> str:
+        # Skips whitespace and returns the next char, "" at the end
+        while True:
+            while (
+                self._pos < len(self._buffer)
+                and self._buffer[self._pos] in _WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not await self._fill():
+                return ""
+
+    async def _value(self, index: int) -> Any:
+        # Decodes the next value, which is only complete once a delimiter
+        # after it was read, since a number cut by the end of the buffer
+        # (as "1." of "1.5") may go on in the next chunk
+        await self._peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if len(self._buffer) - self._pos > self._max_item_size:
+                    raise InvalidJsonArrayError(
+                        index,
+                        f"items must be at most {self._max_item_size} chars",
+                    ) from e
+                if await self._fill():
+                    continue
+                raise InvalidJsonArrayError(
+                    index, f"invalid JSON: {e.msg}"
+                ) from e
+            complete = end < len(self._buffer) and (
+                self._buffer[end] in _DELIMITERS
+            )
+            if complete or not await self._fill():
+                self._pos = end
+                return value
+
+    async def items(self) -> AsyncIterator[Any]:
+        if await self._peek() != "[":
+            raise InvalidJsonArrayError(0, "body must be a JSON array")
+        self._pos += 1
+        index = 0
+        if await self._peek() == "]":
+            self._pos += 1
+        else:
+            while True:
+                yield await self._value(index)
+                index += 1
+                separator = await self._peek()
+                self._pos += 1
+                if separator == "]":
+                    break
+                if separator != ",":
+                    raise InvalidJsonArrayError(
+                        index, "array items must be separated by commas"
+                    )
+        if await self._peek() != "":
+            raise InvalidJsonArrayError(index, "unexpected data after array")
+
+
+async def iter_json_array(
+    req: Request, max_size: int, max_item_size: int
+) -> AsyncIterator[Any]:
+    """Parses the items of a JSON array body while it streams in.
+
+    Each item is yielded as soon as it is complete, so they can be
+    validated one by one without holding the whole document.
+
+    Raises:
+        BodyTooLargeError: If the body is larger than max_size bytes.
+        InvalidJsonArrayError: If the body is not a valid JSON array or an
+            item is larger than max_item_size chars.
+    """
+    reader = _ArrayReader(_stream(req, max_size), max_item_size)
+    async for item in reader.items():
+        yield item
+
+
+class _MsgpackArrayReader:
+    # Incremental reader of a MessagePack array from the chunks of a stream
+
+    def __init__(
+        self, chunks: AsyncIterator[bytes], max_size: int, max_item_size: int
+    ) -> None:
+        self._chunks = chunks
+        self._max_item_size = max_item_size
+        self._unpacker = msgpack.Unpacker(max_buffer_size=max_size)
+        self._fed = 0
+
+    async def _fill(self) -> bool:
+        # Feeds the next chunk to the unpacker, False at the end of stream
+        chunk = await anext(self._chunks, None)
+        if chunk is None:
+            return False
+        self._unpacker.feed(chunk)
+        self._fed += len(chunk)
+        return True
+
+    async def _header(self) -> int:
+        while True:
+            try:
+                return self._unpacker.read_array_header()
+            except msgpack.OutOfData:
+                if not await self._fill():
+                    break
+            except ValueError:
+                break
+        raise InvalidJsonArrayError(0, "body must be a MessagePack array")
+
+    def _too_large(self, index: int) -> InvalidJsonArrayError:
+        return InvalidJsonArrayError(
+            index, f"items must be at most {self._max_item_size} bytes"
+        )
+
+    async def _value(self, index: int) -> Any:
+        start = self._unpacker.tell()
+        while True:
+            try:
+                value = self._unpacker.unpack()
+            except msgpack.OutOfData:
+                # Incomplete, though already larger than an item can be
+                if self._fed - start > self._max_item_size:
+                    raise self._too_large(index) from None
+                if not await self._fill():
+                    raise InvalidJsonArrayError(
+                        index, "body must be a MessagePack array"
+                    ) from None
+                continue
+            except ValueError as e:
+                raise InvalidJsonArrayError(
+                    index, "items must be valid MessagePack"
+                ) from e
+            if self._unpacker.tell() - start > self._max_item_size:
+                raise self._too_large(index)
+            return value
+
+    async def items(self) -> AsyncIterator[Any]:
+        count = await self._header()
+        for index in range(count):
+            yield await self._value(index)
+        # The rest is read, to tell whether anything follows the array
+        while await self._fill():
+            pass
+        if self._fed > self._unpacker.tell():
+            raise InvalidJsonArrayError(count, "unexpected data after array")
+
+
+async def iter_msgpack_array(
+    req: Request, max_size: int, max_item_size: int
+) -> AsyncIterator[Any]:
+    """Parses the items of a MessagePack array body while it streams in.
+
+    Like iter_json_array, but item sizes are in bytes. Needs msgpack, see
+    body_media_type.
+
+    Raises:
+        BodyTooLargeError: If the body is larger than max_size bytes.
+        InvalidJsonArrayError: If the body is not a valid MessagePack array
+            or an item is larger than max_item_size bytes.
+    """
+    reader = _MsgpackArrayReader(
+        _stream(req, max_size), max_size, max_item_size
+    )
+    async for item in reader.items():
+        yield item
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+
+def etag_matches(
+    if_none_match: str | None, etag: str, wildcard: bool = True
+) -> bool:
+    """If an If-None-Match header matches the ETag, by weak comparison.
+
+    Args:
+        if_none_match: The header, if any.
+        etag: The ETag of the current body.
+        wildcard: If "*" matches any ETag.
+    """
+    if if_none_match is None:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(
+        (wildcard and tag == "*") or tag.removeprefix("W/") == opaque
+        for tag in (t.strip() for t in if_none_match.split(","))
+    )
+
+
+def accepts_gzip(headers: Headers) -> bool:
+    """If the Accept-Encoding header allows gzip, ignoring its q-values."""
+    for coding in headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+@dataclass(frozen=True, slots=True)
+class RenderedBody:
+    """Body of a response rendered once, served as is while it is current.
+
+    Attributes:
+        etag: Weak ETag of the body.
+        media_type: Content-Type of the body.
+        body: The rendered body.
+        gzipped: The body compressed with gzip, None if it is too small.
+    """
+
+    etag: str
+    media_type: str
+    body: bytes
+    gzipped: bytes | None
+
+    def to_response(self, gzip_ok: bool) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+        if gzip_ok and self.gzipped is not None:
+            headers["Content-Encoding"] = "gzip"
+            body = self.gzipped
+        else:
+            body = self.body
+        return Response(body, headers=headers, media_type=self.media_type)
+
+
+class RenderedResponseCache:
+    """Bounded cache of rendered response bodies, by generation and key.
+
+    A generation is a number changed by every mutation of the cached data,
+    see UserRepository.generation. A cached body is current while its
+    generation is, so a newer generation drops every older body at once.
+    The key tells apart the responses of one generation, e.g. the path and
+    query of the request. Up to `max_entries` bodies are kept, with the
+    least recently used dropped first, and none with 0, which turns the
+    cache and its ETags off.
+
+    Generations only count the mutations made in this process, so when
+    several processes write to one store the cache must be turned off, or
+    it serves bodies and ETags made stale by the other processes.
+
+    Attributes:
+        max_entries: Max number of cached bodies.
+        gzip_min_size: Bodies of at least this many bytes are also kept
+            compressed with gzip.
+    """
+
+    max_entries: int
+    gzip_min_size: int
+    _generation: int
+    _entries: OrderedDict[str, RenderedBody]
+
+    def __init__(self, max_entries: int = 256, gzip_min_size: int = 1024):
+        self.max_entries = max_entries
+        self.gzip_min_size = gzip_min_size
+        self._generation = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def etag(generation: int, key: str) -> str:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return f'W/"{generation}-{digest}"'
+
+    def _sync(self, generation: int) -> bool:
+        # False for a generation older than the cached one
+        if generation > self._generation:
+            self._entries.clear()
+            self._generation = generation
+        return generation == self._generation
+
+    def get(self, generation: int, key: str) -> RenderedBody | None:
+        if not self._sync(generation):
+            return None
+        rendered = self._entries.get(key)
+        if rendered is not None:
+            self._entries.move_to_end(key)
+        return rendered
+
+    def put(
+        self, generation: int, key: str, response: Response
+    ) -> RenderedBody:
+        """Caches the body of a response rendered at the generation.
+
+        Bodies of older generations are returned but not cached.
+        """
+        body = bytes(response.body)
+        rendered = RenderedBody(
+            self.etag(generation, key),
+            response.headers.get("content-type", ""),
+            body,
+            gzip.compress(body, mtime=0)
+            if len(body) >= self.gzip_min_size
+            else None,
+        )
+        if self._sync(generation):
+            self._entries[key] = rendered
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rendered
+
+    def respond(
+        self,
+        generation: int,
+        key: str,
+        headers: Headers,
+        render: Callable[[], Response],
+    ) -> Response:
+        """Serves the cached body of the key, rendering it on a miss.
+
+        Args:
+            generation: Current generation, got before rendering.
+            key: Identifies the response in the generation.
+            headers: Headers of the request, for If-None-Match and
+                Accept-Encoding.
+            render: Renders the response, only 200 responses are cached.
+
+        Returns:
+            304 if the client holds the current body, else the body,
+            compressed if the client accepts gzip. Only the ETag of a
+            rendered body is matched, not "*", so errors of the request are
+            still returned.
+        """
+        if self.max_entries <= 0:
+            return render()
+        rendered = self.get(generation, key)
+        if rendered is None:
+            response = render()
+            if response.status_code != 200:
+                return response
+            rendered = self.put(generation, key, response)
+        if etag_matches(
+            headers.get("if-none-match"), rendered.etag, wildcard=False
+        ):
+            return Response(
+                status_code=304,
+                headers={"ETag": rendered.etag, "Vary": "Accept-Encoding"},
+            )
+        return rendered.to_response(accepts_gzip(headers))
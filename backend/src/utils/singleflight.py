@@ -0,0 +1,77 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class SingleFlightStats:
+    """Counts of the calls made through a SingleFlight.
+
+    Attributes:
+        calls: Calls made.
+        coalesced: Calls that shared the flight of an earlier call.
+        in_flight: Flights running now.
+    """
+
+    calls: int
+    coalesced: int
+    in_flight: int
+
+
+class SingleFlight[T]:
+    """Coalesces concurrent calls with the same key into one flight.
+
+    The first call of a key starts a flight, and calls of that key made
+    before it lands await the same flight and get its result or exception.
+    Nothing is kept after it lands, so results are never staler than the
+    call itself, unlike a cache.
+
+    Flights run as tasks of their own, so a caller cancelled while waiting
+    doesn't cancel the flight of the others. Every caller gets the same
+    result object, which must not be mutated.
+    """
+
+    _flights: dict[Hashable, asyncio.Task[T]]
+    _calls: int
+    _coalesced: int
+
+    def __init__(self) -> None:
+        self._flights = {}
+        self._calls = self._coalesced = 0
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            self._calls, self._coalesced, len(self._flights)
+        )
+
+    def _land(self, key: Hashable, flight: asyncio.Task[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieved here, so exceptions no one awaited are not logged
+        if not flight.cancelled():
+            flight.exception()
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Awaits the flight of the key, starting it with call if none runs.
+
+        Args:
+            key: Identifies the call, e.g. the method and its arguments.
+            call: Makes the call, only awaited if no flight of key runs.
+
+        Returns:
+            The result of the flight.
+        """
+        self._calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+
+            async def run() -> T:
+                return await call()
+
+            flight = asyncio.create_task(run())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda f: self._land(key, f))
+        else:
+            self._coalesced += 1
+        return await asyncio.shield(flight)
@@ -1,9 +1,64 @@
 import functools
+import inspect
+import string
 from collections.abc import Callable
-from contextlib import AbstractContextManager
+from contextlib import AbstractContextManager, suppress
 from types import TracebackType
 from typing import Any
 
+_FORMATTER = string.Formatter()
+
+
+class _FormatArgs(dict[str, Any]):
+    def __missing__(self, key: str) -> str:
+        return f"{{{key}}}"
+
+
+class LazyMessage:
+    """Exception message only formatted when the exception is raised.
+
+    When used by a TryExcept decorator, the placeholders are filled with the
+    arguments of the decorated function, by name, so the same TryExcept can
+    be reused by every call with no message being built on success.
+
+    Example:
+        >>> @try_except(ServiceError, LazyMessage("Error on user {user_id}"))
+        ... def find_user(user_id: int) -> User: ...
+
+    Attributes:
+        template: str.format template of the message.
+        args: Positional arguments to format the template with.
+        kwargs: Keyword arguments to format the template with.
+    """
+
+    __slots__ = ("args", "kwargs", "template")
+
+    template: str
+    args: tuple[Any, ...]
+    kwargs: dict[str, Any]
+
+    def __init__(self, template: str, /, *args, **kwargs) -> None:
+        self.template = template
+        self.args = args
+        self.kwargs = kwargs
+
+    def format(self, bound_args: dict[str, Any] | None = None) -> str:
+        """Formats the message.
+
+        Args:
+            bound_args: Extra named values to fill the template with.
+                Placeholders without a value are kept as they are.
+        """
+        values = _FormatArgs(bound_args or {})
+        values.update(self.kwargs)
+        return _FORMATTER.vformat(self.template, self.args, values)
+
+    def __str__(self) -> str:
+        return self.format()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.template!r})"
+
 
 class TryExcept(AbstractContextManager):
     """Class to capture exceptions and raise the provided exception.
@@ -16,6 +71,10 @@ class TryExcept(AbstractContextManager):
     exception, then it's re-raised. Otherwise, the provided exception will
     be raised with the supplied arguments.
 
+    Instances hold no state of their own, so the same one can be reused.
+    Arguments given as LazyMessage are only formatted when the exception is
+    raised.
+
     Attributes:
         exc_type: Exception to raise in place of other exceptions.
         *exc_args: Positional arguments to pass to "exc_type" instantiation.
@@ -40,13 +99,50 @@ class TryExcept(AbstractContextManager):
         self.exc_kwargs = exc_kwargs
 
     def __call__[**P, T](self, f: Callable[P, T]) -> Callable[P, T]:
+        signature = inspect.signature(f) if self._is_lazy() else None
+
         @functools.wraps(f)
         def _wrap(*args: P.args, **kwargs: P.kwargs) -> T:
-            with self:
+            try:
                 return f(*args, **kwargs)
+            except self.exc_type:
+                raise
+            except BaseException as e:
+                bound_args: dict[str, Any] = {}
+                if signature is not None:
+                    with suppress(TypeError):
+                        bound = signature.bind_partial(*args, **kwargs)
+                        bound.apply_defaults()
+                        bound_args = bound.arguments
+                raise self.exception(bound_args) from e
 
         return _wrap
 
+    def _is_lazy(self) -> bool:
+        return any(
+            isinstance(a, LazyMessage)
+            for a in (*self.exc_args, *self.exc_kwargs.values())
+        )
+
+    def exception(
+        self, bound_args: dict[str, Any] | None = None
+    ) -> BaseException:
+        """Instantiates the exception to raise, formatting lazy messages.
+
+        Args:
+            bound_args: Named values to fill the LazyMessage arguments with.
+        """
+
+        def resolve(arg: Any) -> Any:
+            if isinstance(arg, LazyMessage):
+                return arg.format(bound_args)
+            return arg
+
+        return self.exc_type(
+            *map(resolve, self.exc_args),
+            **{k: resolve(v) for k, v in self.exc_kwargs.items()},
+        )
+
     def __enter__(self):
         return None
 
@@ -58,9 +154,7 @@ class TryExcept(AbstractContextManager):
         /,
     ) -> bool:
         if exc_type is not None and not issubclass(exc_type, self.exc_type):
-            raise self.exc_type(
-                *self.exc_args, **self.exc_kwargs
-            ) from exc_value
+            raise self.exception() from exc_value
         return False
 
 
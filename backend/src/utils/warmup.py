@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+type WarmUpStep = Callable[[], Awaitable[int]]
+"""Warms something up, returning the number of items warmed."""
+
+
+@dataclass(frozen=True, slots=True)
+class WarmUpResult:
+    """Outcome of a warm-up.
+
+    Attributes:
+        duration: Seconds the warm-up took.
+        counts: Items warmed by each step that succeeded.
+        failed: Steps that raised, their caches left cold.
+    """
+
+    duration: float
+    counts: dict[str, int]
+    failed: tuple[str, ...]
+
+
+class WarmUp:
+    """Steps run once at startup, before the app reports it is ready.
+
+    Steps run in the order added, in the background so liveness probes are
+    still answered. A step that fails is logged and skipped, since it only
+    leaves a cache cold, so the warm-up always finishes.
+    """
+
+    _steps: dict[str, WarmUpStep]
+    _result: WarmUpResult | None
+    _clock: Callable[[], float]
+    _logger: logging.Logger
+    _task: asyncio.Task[WarmUpResult] | None
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.perf_counter,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._steps = {}
+        self._result = None
+        self._clock = clock
+        self._logger = logger or logging.getLogger(__name__)
+        self._task = None
+
+    def add(self, name: str, step: WarmUpStep) -> None:
+        self._steps[name] = step
+
+    @property
+    def result(self) -> WarmUpResult | None:
+        """The outcome, None until the warm-up finished."""
+        return self._result
+
+    async def run(self) -> WarmUpResult:
+        """Runs every step and logs how long it took and what it warmed."""
+        start = self._clock()
+        counts: dict[str, int] = {}
+        failed: list[str] = []
+        for name, step in self._steps.items():
+            try:
+                counts[name] = await step()
+            except Exception:
+                self._logger.exception("Error warming up %s", name)
+                failed.append(name)
+        self._result = WarmUpResult(
+            self._clock() - start, counts, tuple(failed)
+        )
+        self._logger.info(
+            "Warmed up in %.3fs: %s",
+            self._result.duration,
+            ", ".join(f"{n} {c}" for n, c in counts.items()) or "nothing",
+        )
+        return self._result
+
+    async def check(self) -> str:
+        """Health check failing until the warm-up finished."""
+        if self._result is None:
+            raise RuntimeError("warming up")
+        return f"done in {self._result.duration:.3f}s"
+
+    def start(
+        self, then: Callable[[], Awaitable[object]] | None = None
+    ) -> None:
+        """Starts the warm-up in the background, from the event loop.
+
+        Args:
+            then: Awaited after the warm-up, e.g. to rerun the health checks
+                instead of waiting for their next run.
+        """
+
+        async def run() -> WarmUpResult:
+            result = await self.run()
+            if then is not None:
+                await then()
+            return result
+
+        if self._task is None:
+            self._task = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
@@ -0,0 +1,48 @@
+import unittest
+
+from starlette.types import Message, Receive, Scope, Send
+
+from src.middlewares.content_negotiation import ContentNegotiationMiddleware
+from src.utils.media import (
+    JSON,
+    MSGPACK,
+    msgpack_available,
+    response_media_type,
+)
+
+
+class TestContentNegotiationMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def call(self, headers: list[tuple[bytes, bytes]]):
+        seen: list[str] = []
+        sent: list[Message] = []
+
+        async def app(scope: Scope, receive: Receive, send: Send) -> None:
+            seen.append(response_media_type.get())
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"vary", b"Accept-Encoding")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message: Message) -> None:
+            sent.append(message)
+
+        scope = {"type": "http", "headers": headers}
+        await ContentNegotiationMiddleware(app)(scope, None, send)  # type: ignore
+        response_headers = dict(sent[0]["headers"])
+        return seen[0], response_headers[b"vary"].decode()
+
+    async def test_should_default_to_json(self):
+        seen, vary = await self.call([])
+        self.assertEqual(seen, JSON)
+        self.assertEqual(vary, "Accept-Encoding, Accept")
+
+    @unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+    async def test_should_set_negotiated_format(self):
+        seen, vary = await self.call([(b"accept", b"application/msgpack")])
+        self.assertEqual(seen, MSGPACK)
+        self.assertEqual(vary, "Accept-Encoding, Accept")
+        self.assertEqual(response_media_type.get(), JSON)
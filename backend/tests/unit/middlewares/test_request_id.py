@@ -0,0 +1,38 @@
+import unittest
+
+from starlette.types import Message, Receive, Scope, Send
+
+from src.middlewares.request_id import RequestIdMiddleware
+from src.utils.log import request_id
+
+
+class TestRequestIdMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def call(self, headers: list[tuple[bytes, bytes]]):
+        seen: list[str | None] = []
+        sent: list[Message] = []
+
+        async def app(scope: Scope, receive: Receive, send: Send) -> None:
+            seen.append(request_id.get())
+            await send({"type": "http.response.start", "status": 200})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message: Message) -> None:
+            sent.append(message)
+
+        scope = {"type": "http", "headers": headers}
+        await RequestIdMiddleware(app)(scope, None, send)  # type: ignore
+        response_headers = dict(sent[0]["headers"])
+        return seen[0], response_headers[b"x-request-id"].decode()
+
+    async def test_should_reuse_request_header(self):
+        seen, sent = await self.call([(b"x-request-id", b"abc-123")])
+        self.assertEqual(seen, "abc-123")
+        self.assertEqual(sent, "abc-123")
+        self.assertIsNone(request_id.get())
+
+    async def test_should_generate_id_when_missing_or_unsafe(self):
+        for headers in ([], [(b"x-request-id", b"bad\nid")]):
+            seen, sent = await self.call(headers)
+            self.assertIsNotNone(seen)
+            self.assertEqual(seen, sent)
+            self.assertRegex(sent, r"^[0-9a-f]{32}$")
@@ -4,7 +4,14 @@ from datetime import UTC, date, datetime
 from typing import Any
 from unittest.mock import patch
 
-from src.models.user import User, UserBase, UserCreate, UserCreateBody, UserInDB
+from src.models.user import (
+    User,
+    UserBase,
+    UserCreate,
+    UserCreateBody,
+    UserFilter,
+    UserInDB,
+)
 from src.utils.dataclass import ValidationError
 
 
@@ -294,6 +301,8 @@ class TestUser(unittest.TestCase):
             "name": "name",
             "role": "staff",
             "date_of_birth": date(1990, 9, 9),
+            "version": 1,
+            "gym_id": 2,
         }
         user = UserInDB(**user_dict, password_hash="password_hash")  # type: ignore
         self.assertDictEqual(User.from_db_model(user).to_dict(), user_dict)
@@ -313,3 +322,85 @@ class TestUserInDb(unittest.TestCase):
         self.assertDictEqual(
             UserInDB.from_user_create(0, user_create).to_dict(), user.to_dict()
         )
+
+    def test_should_keep_the_gym_of_the_user_create(self):
+        user_create = UserCreate(
+            username="username",
+            name="name",
+            password_hash="password_hash",
+            role="staff",
+            date_of_birth=date(1990, 9, 9),
+            gym_id=3,
+        )
+        self.assertEqual(UserInDB.from_user_create(0, user_create).gym_id, 3)
+
+    def test_should_validate_gym_id(self):
+        for gym_id in (-1, True, "1", None):
+            with (
+                self.subTest(gym_id=gym_id),
+                self.assertRaises(ValidationError),
+            ):
+                UserCreate(
+                    username="username",
+                    name="name",
+                    password_hash="password_hash",
+                    role="staff",
+                    date_of_birth=date(1990, 9, 9),
+                    gym_id=gym_id,  # type: ignore
+                )
+
+    def test_should_start_at_version_one(self):
+        user = UserInDB(
+            id=0,
+            username="username",
+            name="name",
+            role="staff",
+            date_of_birth=date(1990, 9, 9),
+            password_hash="password_hash",
+        )
+        self.assertEqual(user.version, 1)
+
+    def test_should_raise_invalid_version(self):
+        invalid_values = [0, -1, "1", 1.0, True, None]
+        regex_err = f"{ValidationError.__name__}: Error while validating {UserInDB.__name__}."
+        for i, v in enumerate(invalid_values):
+            with (
+                self.subTest(i=i),
+                self.assertRaisesRegex(ValidationError, regex_err) as e,
+            ):
+                UserInDB(
+                    id=0,
+                    username="username",
+                    name="name",
+                    role="staff",
+                    date_of_birth=date(1990, 9, 9),
+                    password_hash="password_hash",
+                    version=v,  # type: ignore
+                )
+            self.assertIn("version", e.exception.to_json())
+
+
+class TestUserFilter(unittest.TestCase):
+    def test_should_match_users(self):
+        user = UserInDB(
+            id=0,
+            username="username",
+            name="Élise Doe",
+            role="staff",
+            date_of_birth=date(1990, 9, 9),
+            password_hash="password_hash",
+        )
+        self.assertTrue(UserFilter().matches(user))
+        self.assertTrue(UserFilter(role="STAFF", name="Éli").matches(user))
+        self.assertFalse(UserFilter(name="éli").matches(user))
+        self.assertTrue(
+            UserFilter(born_from="1990-09-09", born_to="1990-09-09").matches(
+                user
+            )
+        )
+        self.assertFalse(UserFilter(born_from=date(1990, 9, 10)).matches(user))
+
+    def test_should_validate_conditions(self):
+        for kwargs in ({"role": "admin"}, {"name": ""}, {"born_to": "x"}):
+            with self.subTest(**kwargs), self.assertRaises(ValidationError):
+                UserFilter(**kwargs)  # type: ignore
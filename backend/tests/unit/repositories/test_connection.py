@@ -0,0 +1,129 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date
+from pathlib import Path
+
+from src.models.user import UserCreate
+from src.repositories.connection import (
+    ConnectionPool,
+    ConnectionRouter,
+    PoolTimeoutError,
+    database_path,
+)
+from src.repositories.migrations import migrate
+from src.repositories.sqlite import SQLiteUserRepository
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.pool = ConnectionPool([self.conn], timeout=0.01)
+
+    def tearDown(self) -> None:
+        self.pool.close()
+
+    def test_should_count_acquisitions(self):
+        with self.pool.acquire() as conn:
+            self.assertIs(conn, self.conn)
+        with self.pool.acquire():
+            pass
+        stats = self.pool.stats
+        self.assertEqual(stats.size, 1)
+        self.assertEqual(stats.acquired, 2)
+        self.assertEqual(stats.waited, 0)
+
+    def test_should_time_out_when_no_connection_is_free(self):
+        with (
+            self.pool.acquire(),
+            self.assertRaises(PoolTimeoutError),
+            self.pool.acquire(),
+        ):
+            pass
+        self.assertEqual(self.pool.stats.timeouts, 1)
+
+    def test_should_measure_waits(self):
+        self.pool.timeout = 5
+        taken = threading.Event()
+        release = threading.Event()
+
+        def hold() -> None:
+            with self.pool.acquire():
+                taken.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        taken.wait()
+        threading.Timer(0.02, release.set).start()
+        with self.pool.acquire():
+            pass
+        thread.join()
+        stats = self.pool.stats
+        self.assertEqual(stats.waited, 1)
+        self.assertGreater(stats.max_wait_time, 0)
+        self.assertEqual(stats.wait_time, stats.max_wait_time)
+
+
+class TestConnectionRouter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = ConnectionRouter.connect(
+            str(Path(self.dir.name) / "gym.db"), readers=2
+        )
+        with self.db.write() as conn:
+            migrate(conn)
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.dir.cleanup()
+
+    def test_should_read_on_read_only_connections(self):
+        self.assertEqual(len(self.db.readers), 2)
+        self.assertIsNot(self.db.readers, self.db.writer)
+        with self.db.read() as conn, self.assertRaises(sqlite3.Error):
+            conn.execute("DELETE FROM user_account")
+        with self.db.write() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_should_read_committed_writes(self):
+        repo = SQLiteUserRepository(self.db)
+        user = repo.create(
+            UserCreate(
+                username="jdoe",
+                name="John Doe",
+                date_of_birth=date(1999, 9, 9),
+                role="staff",
+                password_hash="hash",
+            )
+        )
+        self.assertEqual(repo.find_by_id(user.id), user)
+        self.assertListEqual(repo.search("john", 10), [user])
+        self.assertEqual(self.db.writer.stats.acquired, 2)
+        self.assertEqual(self.db.readers.stats.acquired, 2)
+
+    def test_should_share_the_connection_of_memory_databases(self):
+        db = ConnectionRouter.connect(":memory:", readers=2)
+        self.assertIs(db.readers, db.writer)
+        db.close()
+
+
+class TestDatabasePath(unittest.TestCase):
+    def test_should_get_the_path_of_sqlite_urls(self):
+        tests = (
+            ("sqlite:///gym.db", "gym.db"),
+            ("sqlite:////data/gym.db", "/data/gym.db"),
+            ("sqlite://", ":memory:"),
+            ("gym.db", "gym.db"),
+            (":memory:", ":memory:"),
+        )
+        for url, path in tests:
+            with self.subTest(url=url):
+                self.assertEqual(database_path(url), path)
+
+    def test_should_raise_for_other_urls(self):
+        for url in ("memory://", "sqlite://gym.db"):
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                database_path(url)
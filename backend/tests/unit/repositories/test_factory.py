@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+
+from src.models.user import UserCreate
+from src.repositories.factory import open_user_store
+from src.repositories.sharded import ShardedUserRepository
+from src.repositories.shared import SharedMemoryUserRepository
+from src.repositories.sqlite import SQLiteUserRepository
+from src.repositories.tiered import TieredUserRepository
+
+
+class TestOpenUserStore(unittest.TestCase):
+    directory: tempfile.TemporaryDirectory
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _user(self) -> UserCreate:
+        return UserCreate(
+            username="username",
+            name="name",
+            date_of_birth=date(1990, 9, 9),
+            role="staff",
+            password_hash="hash",
+            gym_id=1,
+        )
+
+    def test_should_open_the_store_of_the_scheme(self):
+        path = Path(self.directory.name)
+        tests = (
+            ("memory://", ShardedUserRepository, False),
+            (f"shared:///{path / 'users'}", SharedMemoryUserRepository, False),
+            (f"sqlite:///{path / 'gym.db'}", SQLiteUserRepository, True),
+            (str(path / "other.db"), SQLiteUserRepository, True),
+        )
+        for url, cls, has_db in tests:
+            with self.subTest(url=url):
+                store = open_user_store(url, shared_capacity=8)
+                try:
+                    self.assertIsInstance(store.repo, cls)
+                    self.assertEqual(store.db is not None, has_db)
+                    user = store.repo.create(self._user())
+                    self.assertEqual(store.repo.find_by_id(user.id), user)
+                finally:
+                    store.close()
+
+    def test_should_tier_sqlite_stores(self):
+        store = open_user_store("sqlite://", hot_users=10)
+        try:
+            self.assertIsInstance(store.repo, TieredUserRepository)
+            self.assertIsInstance(store.repo.cold, SQLiteUserRepository)  # type: ignore
+        finally:
+            store.close()
+
+    def test_should_only_keep_fragments_of_hot_users(self):
+        store = open_user_store("sqlite://", hot_users=2)
+        try:
+            for i in range(10):
+                user = store.repo.create(
+                    UserCreate(
+                        **{**self._user().to_dict(), "username": f"user{i}"}
+                    )
+                )
+                store.repo.encode(store.repo.find_by_id(user.id))  # type: ignore
+            self.assertLessEqual(len(store.repo.cold._fragments), 2)  # type: ignore
+            self.assertEqual(store.repo.stats.hot_users, 2)  # type: ignore
+        finally:
+            store.close()
+
+    def test_should_raise_for_unknown_schemes(self):
+        for url in ("postgres://localhost/gym", "shared://"):
+            with self.subTest(url=url), self.assertRaises(ValueError):
+                open_user_store(url)
@@ -0,0 +1,140 @@
+import io
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import date
+from pathlib import Path
+
+from src.models.user import UserFilter
+from src.repositories.migrations import (
+    Migration,
+    MigrationError,
+    applied_versions,
+    load_migrations,
+    main,
+    migrate,
+)
+from src.repositories.sqlite import _SELECT, _where
+
+
+class TestMigrations(unittest.TestCase):
+    conn: sqlite3.Connection
+
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(":memory:")
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def test_should_load_migrations_by_version(self):
+        migrations = load_migrations()
+        versions = [m.version for m in migrations]
+        self.assertListEqual(versions, sorted(versions))
+        self.assertEqual(migrations[0].name, "create_user_account")
+
+    def test_should_reject_duplicated_versions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("0001_a.sql", "0001_b.sql"):
+                (Path(directory) / name).write_text("SELECT 1;")
+            with self.assertRaises(MigrationError):
+                load_migrations(Path(directory))
+
+    def test_should_split_statements_keeping_triggers(self):
+        sql = next(m for m in load_migrations() if m.version == 1).sql
+        statements = list(Migration(1, "a", sql).statements())
+        triggers = [s for s in statements if s.startswith("CREATE TRIGGER")]
+        self.assertEqual(len(triggers), 3)
+        self.assertTrue(all(s.endswith("END;") for s in triggers))
+
+    def test_should_apply_pending_migrations_once(self):
+        applied = migrate(self.conn, target=1)
+        self.assertListEqual([m.version for m in applied], [1])
+        applied = migrate(self.conn)
+        self.assertNotIn(1, [m.version for m in applied])
+        self.assertListEqual(
+            applied_versions(self.conn),
+            [m.version for m in load_migrations()],
+        )
+        self.assertListEqual(migrate(self.conn), [])
+
+    def test_should_roll_back_failed_migrations(self):
+        migrations = [
+            Migration(1, "create", "CREATE TABLE t (a INTEGER);"),
+            Migration(2, "broken", "CREATE TABLE u (a); INSERT INTO v;"),
+        ]
+        with self.assertRaises(MigrationError):
+            migrate(self.conn, migrations)
+        self.assertListEqual(applied_versions(self.conn), [1])
+        tables = {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+        }
+        self.assertIn("t", tables)
+        self.assertNotIn("u", tables)
+
+    def test_cli(self):
+        with (
+            tempfile.TemporaryDirectory() as directory,
+            redirect_stdout(io.StringIO()) as out,
+        ):
+            path = str(Path(directory) / "gym.db")
+            self.assertEqual(main([path, "--target", "1"]), 0)
+            self.assertEqual(main([path, "--list"]), 0)
+            self.assertEqual(main([path]), 0)
+            self.assertIn(
+                "0002 add_user_account_indexes pending", out.getvalue()
+            )
+            conn = sqlite3.connect(path)
+            self.assertEqual(
+                len(applied_versions(conn)), len(load_migrations())
+            )
+            conn.close()
+
+
+class TestUserAccountIndexes(unittest.TestCase):
+    conn: sqlite3.Connection
+
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(":memory:")
+        migrate(self.conn)
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def _plan(self, where: UserFilter, gym_id: int | None = None) -> str:
+        clause, params = _where(gym_id, where)
+        rows = self.conn.execute(
+            f"EXPLAIN QUERY PLAN {_SELECT} {clause} ORDER BY id", params
+        )
+        return "\n".join(row[-1] for row in rows)
+
+    def test_should_filter_role_by_index(self):
+        self.assertIn(
+            "USING INDEX user_account_role (role=?)",
+            self._plan(UserFilter(role="staff")),
+        )
+
+    def test_should_filter_date_of_birth_by_index(self):
+        self.assertIn(
+            "USING INDEX user_account_date_of_birth (date_of_birth>? AND date_of_birth<?)",
+            self._plan(
+                UserFilter(
+                    born_from=date(1990, 1, 1), born_to=date(1999, 12, 31)
+                )
+            ),
+        )
+
+    def test_should_filter_name_prefix_by_index(self):
+        self.assertIn(
+            "USING INDEX user_account_name_lower (<expr>>? AND <expr><?)",
+            self._plan(UserFilter(name="Jo")),
+        )
+
+    def test_should_filter_gym_by_index(self):
+        self.assertIn(
+            "USING INDEX user_account_gym_id (gym_id=?)",
+            self._plan(UserFilter(), gym_id=1),
+        )
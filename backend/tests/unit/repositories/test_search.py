@@ -0,0 +1,64 @@
+import unittest
+
+from src.repositories.search import UserSearchIndex, tokenize, trigrams
+
+
+class TestTokenize(unittest.TestCase):
+    def test_should_normalize_tokens(self):
+        tests = (
+            ("John Doe", ["john", "doe"]),
+            ("joão_silva", ["joao", "silva"]),
+            ("  ÉMILE  ", ["emile"]),
+            ("ana-maria 23", ["ana", "maria", "23"]),
+            ("", []),
+            ("__", []),
+        )
+        for i, (text, expected) in enumerate(tests):
+            with self.subTest(i=i):
+                self.assertListEqual(tokenize(text), expected)
+
+    def test_should_pad_trigrams(self):
+        self.assertSetEqual(trigrams("ab"), {"  a", " ab", "ab "})
+
+
+class TestUserSearchIndex(unittest.TestCase):
+    index: UserSearchIndex
+
+    def setUp(self) -> None:
+        self.index = UserSearchIndex()
+        self.index.add(0, "jdoe", "John Doe")
+        self.index.add(1, "johnny", "Johnny Walker")
+        self.index.add(2, "maria", "Maria Joana")
+        self.index.add(3, "jo", "Ana Souza")
+
+    def test_should_find_by_prefix(self):
+        self.assertListEqual(self.index.search("walk", 10), [1])
+        self.assertListEqual(self.index.search("mar jo", 10), [2])
+        self.assertSetEqual(set(self.index.search("jo", 10)), {0, 1, 2, 3})
+
+    def test_should_rank_exact_and_username_matches_first(self):
+        self.assertListEqual(self.index.search("jo", 10)[:1], [3])
+        self.assertListEqual(self.index.search("john", 10)[:2], [0, 1])
+
+    def test_should_limit_results(self):
+        self.assertEqual(len(self.index.search("jo", 2)), 2)
+        self.assertListEqual(self.index.search("jo", 0), [])
+
+    def test_should_find_by_fuzzy_match(self):
+        self.assertListEqual(self.index.search("jonny", 10)[:1], [1])
+        self.assertListEqual(self.index.search("souza", 10), [3])
+        self.assertIn(3, self.index.search("sousa", 10))
+
+    def test_should_not_find_unrelated_query(self):
+        self.assertListEqual(self.index.search("xyz", 10), [])
+        self.assertListEqual(self.index.search("  ", 10), [])
+
+    def test_should_update_incrementally(self):
+        self.index.add(1, "johnny", "Johnny Cash")
+        self.assertListEqual(self.index.search("walker", 10), [])
+        self.assertListEqual(self.index.search("cash", 10), [1])
+        self.index.remove(1)
+        self.index.remove(99)
+        self.assertListEqual(self.index.search("cash", 10), [])
+        self.assertEqual(len(self.index), 3)
+        self.assertNotIn(1, self.index.search("johnny", 10))
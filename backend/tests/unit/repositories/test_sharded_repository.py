@@ -0,0 +1,193 @@
+import sqlite3
+import unittest
+from collections.abc import Callable
+from datetime import UTC, date, datetime, timedelta
+
+from src.models.user import UserCreate, UserInDB, UserUpdate
+from src.repositories.migrations import migrate
+from src.repositories.sharded import ShardedUserRepository
+from src.repositories.sqlite import SQLiteUserRepository
+from src.repositories.user import (
+    InMemoryUserRepository,
+    UserChange,
+    UserRepository,
+    encode_user,
+)
+
+
+def in_memory_shard(gym_id: int, next_id: Callable[[], int]) -> UserRepository:
+    return InMemoryUserRepository(next_id)
+
+
+class TestShardedUserRepository(unittest.TestCase):
+    repo: ShardedUserRepository
+
+    def setUp(self) -> None:
+        self.repo = ShardedUserRepository(in_memory_shard)
+
+    def _create(self, username: str, gym_id: int) -> UserInDB:
+        return self.repo.create(
+            UserCreate(
+                username=username,
+                name=f"{username} Doe",
+                date_of_birth=date(1999, 9, 9),
+                role="student",
+                password_hash="hash",
+                gym_id=gym_id,
+            )
+        )
+
+    def test_should_keep_gyms_apart(self):
+        u1 = self._create("user1", 1)
+        u2 = self._create("user2", 2)
+        u3 = self._create("user3", 1)
+        self.assertListEqual([u1.id, u2.id, u3.id], [0, 1, 2])
+        self.assertListEqual(self.repo.gym_ids, [1, 2])
+        self.assertListEqual(self.repo.find_all(1), [u1, u3])
+        self.assertListEqual(self.repo.find_all(2), [u2])
+        self.assertListEqual(self.repo.find_all(3), [])
+        self.assertListEqual(self.repo.find_all(), [u1, u2, u3])
+
+    def test_should_find_users_by_id_in_any_gym(self):
+        u1 = self._create("user1", 1)
+        u2 = self._create("user2", 2)
+        self.assertEqual(self.repo.find_by_id(u2.id), u2)
+        self.assertIsNone(self.repo.find_by_id(99))
+        self.assertDictEqual(
+            self.repo.find_many([u2.id, 99, u1.id]), {u1.id: u1, u2.id: u2}
+        )
+
+    def test_should_update_and_delete_in_the_gym_of_the_user(self):
+        user = self._create("user1", 2)
+        update = UserUpdate(
+            username="user1",
+            name="New Name",
+            date_of_birth=date(1999, 9, 9),
+            role="student",
+        )
+        updated = self.repo.update(user.id, update)
+        self.assertEqual(updated.gym_id, 2)  # type: ignore
+        self.assertEqual(updated.name, "New Name")  # type: ignore
+        self.assertIsNone(self.repo.update(99, update))
+        self.assertEqual(self.repo.delete(user.id), updated)
+        self.assertIsNone(self.repo.find_by_id(user.id))
+        self.assertIsNone(self.repo.delete(user.id))
+
+    def test_should_iterate_users_of_every_gym_by_id(self):
+        u1 = self._create("user1", 2)
+        u2 = self._create("user2", 1)
+        u3 = self._create("user3", 2)
+        self.assertListEqual(list(self.repo.iter_all()), [u1, u2, u3])
+        self.assertListEqual(list(self.repo.iter_all(2)), [u1, u3])
+        self.assertListEqual(list(self.repo.iter_all(3)), [])
+
+    def test_should_find_fields_across_gyms(self):
+        u1 = self._create("user1", 2)
+        u2 = self._create("user2", 1)
+        self.assertListEqual(
+            self.repo.find_all_fields(["username"]),
+            [{"username": "user1"}, {"username": "user2"}],
+        )
+        self.assertListEqual(
+            self.repo.find_all_fields(["id"], 1), [{"id": u2.id}]
+        )
+        self.assertDictEqual(
+            self.repo.find_fields_by_id(u1.id, ["gym_id"]),  # type: ignore
+            {"gym_id": 2},
+        )
+        self.assertIsNone(self.repo.find_fields_by_id(99, ["id"]))
+
+    def test_should_search_gyms(self):
+        u1 = self._create("anna", 1)
+        u2 = self._create("annie", 2)
+        self._create("bobby", 2)
+        self.assertListEqual(self.repo.search("ann", 10, 2), [u2])
+        self.assertListEqual(self.repo.search("ann", 10, 3), [])
+        self.assertSetEqual(
+            {u.id for u in self.repo.search("ann", 10)}, {u1.id, u2.id}
+        )
+        self.assertEqual(len(self.repo.search("ann", 1)), 1)
+
+    def test_should_publish_changes_of_every_gym(self):
+        changes: list[UserChange] = []
+        self.repo.subscribe(changes.append)
+        u1 = self._create("user1", 1)
+        u2 = self._create("user2", 2)
+        self.repo.delete(u1.id)
+        self.assertListEqual(
+            [(c.op, c.user) for c in changes],
+            [("create", u1), ("create", u2), ("delete", u1)],
+        )
+
+    def test_should_encode_users_with_fragments_of_their_shard(self):
+        u1 = self._create("user1", 1)
+        fragment = self.repo.encode(u1)
+        self.assertEqual(fragment, encode_user(u1))
+        self.assertIs(self.repo._shards[1].encode(u1), fragment)
+
+    def test_should_change_generation_on_mutations_of_any_gym(self):
+        generation = self.repo.generation
+        self._create("user1", 1)
+        self.assertNotEqual(self.repo.generation, generation)
+        generation = self.repo.generation
+        self._create("user2", 2)
+        self.assertNotEqual(self.repo.generation, generation)
+
+    def test_should_restore_and_purge_users_of_every_gym(self):
+        u1 = self._create("user1", 1)
+        u2 = self._create("user2", 2)
+        self.repo.delete(u1.id)
+        self.repo.delete(u2.id)
+        self.assertIsNone(self.repo.restore(u1.id, gym_id=2))
+        restored = UserInDB(**{**u1.to_dict(), "version": u1.version + 1})
+        self.assertEqual(self.repo.restore(u1.id), restored)
+        self.assertEqual(self.repo.find_by_id(u1.id), restored)
+        self.repo.delete(u1.id)
+        later = datetime.now(UTC) + timedelta(seconds=1)
+        self.assertListEqual(self.repo.purge_deleted(later, 1), [u1.id])
+        self.assertListEqual(self.repo.purge_deleted(later, 5), [u2.id])
+        self.assertDictEqual(self.repo._directory, {})
+
+    def test_should_warm_shards_up_to_the_limit(self):
+        for i in range(4):
+            self._create(f"user{i}", gym_id=i % 2)
+        self.assertEqual(self.repo.warm(3), 3)
+        self.assertEqual(self.repo.warm(10), 4)
+
+    def sqlite_shards(
+        self,
+    ) -> Callable[[int, Callable[[], int]], UserRepository]:
+        conns: dict[int, sqlite3.Connection] = {}
+
+        def sqlite_shard(
+            gym_id: int, next_id: Callable[[], int]
+        ) -> UserRepository:
+            if gym_id not in conns:
+                conns[gym_id] = sqlite3.connect(":memory:")
+                migrate(conns[gym_id])
+                self.addCleanup(conns[gym_id].close)
+            return SQLiteUserRepository(conns[gym_id], next_id)
+
+        return sqlite_shard
+
+    def test_should_load_existing_shards(self):
+        sqlite_shard = self.sqlite_shards()
+        self.repo = ShardedUserRepository(sqlite_shard)
+        u1 = self._create("user1", 1)
+        u2 = self._create("user2", 2)
+        reopened = ShardedUserRepository(sqlite_shard, gym_ids=[1, 2])
+        self.assertEqual(reopened.find_by_id(u2.id), u2)
+        self.assertListEqual(reopened.find_all(), [u1, u2])
+        self.repo = reopened
+        self.assertEqual(self._create("user3", 1).id, u2.id + 1)
+
+    def test_should_load_deleted_users_of_existing_shards(self):
+        sqlite_shard = self.sqlite_shards()
+        self.repo = ShardedUserRepository(sqlite_shard)
+        self._create("user0", 0)
+        u1 = self._create("user1", 0)
+        self.repo.delete(u1.id)
+        self.repo = ShardedUserRepository(sqlite_shard, gym_ids=[0])
+        self.assertEqual(self.repo.stored_ids(), [0, u1.id])
+        self.assertEqual(self._create("user2", 0).id, u1.id + 1)
+        self.assertEqual(self.repo.restore(u1.id).version, u1.version + 1)  # type: ignore
@@ -0,0 +1,205 @@
+import tempfile
+import threading
+import unittest
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.shared import (
+    _SEQ,
+    SharedMemoryUserRepository,
+)
+from src.repositories.user import (
+    UserChange,
+    UserRepositoryConflictError,
+    UserRepositoryError,
+    encode_user,
+)
+
+
+class TestSharedMemoryUserRepository(unittest.TestCase):
+    directory: tempfile.TemporaryDirectory
+    path: str
+    repo: SharedMemoryUserRepository
+    other: SharedMemoryUserRepository
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.directory.name) / "users")
+        self.repo = SharedMemoryUserRepository(self.path, capacity=8)
+        # Another worker process, mapping the same file
+        self.other = SharedMemoryUserRepository(self.path)
+
+    def tearDown(self) -> None:
+        self.repo.close()
+        self.other.close()
+        self.directory.cleanup()
+
+    def _create(self, username: str, gym_id: int = 0, repo=None) -> UserInDB:
+        return (repo or self.repo).create(
+            UserCreate(
+                username=username,
+                name=f"{username} Doe",
+                date_of_birth=date(1999, 9, 9),
+                role="student",
+                password_hash="hash",
+                gym_id=gym_id,
+            )
+        )
+
+    def _update(self, name: str) -> UserUpdate:
+        return UserUpdate(
+            username="username",
+            name=name,
+            date_of_birth=date(2000, 1, 1),
+            role="staff",
+        )
+
+    def test_should_keep_the_layout_of_the_file(self):
+        self.assertEqual(self.other.capacity, 8)
+        self.assertEqual(self.other.slot_size, 512)
+
+    def test_should_share_users_between_processes(self):
+        u0 = self._create("user0")
+        u1 = self._create("user1", gym_id=1, repo=self.other)
+        self.assertListEqual([u0.id, u1.id], [0, 1])
+        self.assertEqual(self.other.find_by_id(u0.id), u0)
+        self.assertListEqual(self.repo.find_all(), [u0, u1])
+        self.assertListEqual(self.repo.find_all(1), [u1])
+        self.assertListEqual(
+            self.other.find_all(where=UserFilter(name="user0")), [u0]
+        )
+        self.assertDictEqual(self.repo.find_many([1, 5, 99]), {1: u1})
+
+    def test_should_see_updates_and_deletes_of_other_processes(self):
+        user = self._create("user0")
+        self.assertEqual(self.other.find_by_id(user.id), user)
+        updated = self.repo.update(user.id, self._update("Jane Doe"))
+        self.assertEqual(self.other.find_by_id(user.id), updated)
+        self.assertEqual(updated.version, 2)  # type: ignore
+        self.assertEqual(self.other.delete(user.id), updated)
+        self.assertIsNone(self.repo.find_by_id(user.id))
+        self.assertIsNone(self.repo.update(user.id, self._update("name")))
+        self.assertIsNone(self.repo.delete(99))
+
+    def test_should_update_returning_the_previous_user(self):
+        user = self._create("user0")
+        previous, updated = self.repo.update_with_previous(  # type: ignore
+            user.id, self._update("Jane Doe")
+        )
+        self.assertEqual(previous, user)
+        self.assertEqual(self.other.find_by_id(user.id), updated)
+        self.assertIsNone(
+            self.repo.update_with_previous(99, self._update("name"))
+        )
+
+    def test_should_restore_deleted_users(self):
+        user = self._create("user0")
+        self.repo.delete(user.id)
+        self.assertIsNone(self.other.find_by_id(user.id))
+        self.assertIsNone(self.other.restore(user.id, gym_id=1))
+        restored = UserInDB(**{**user.to_dict(), "version": user.version + 1})
+        self.assertEqual(self.other.restore(user.id, gym_id=0), restored)
+        self.assertEqual(self.repo.find_by_id(user.id), restored)
+        self.assertIsNone(self.repo.restore(user.id))
+
+    def test_should_purge_oldest_deleted_users_in_batches(self):
+        users = [self._create(f"user{i}") for i in range(3)]
+        for user in reversed(users):
+            self.repo.delete(user.id)
+        later = datetime.now(UTC) + timedelta(seconds=1)
+        self.assertListEqual(
+            self.other.purge_deleted(later - timedelta(hours=1), 9), []
+        )
+        self.assertListEqual(self.other.purge_deleted(later, 2), [2, 1])
+        self.assertListEqual(self.repo.purge_deleted(later, 2), [0])
+        self.assertIsNone(self.repo.restore(0))
+
+    def test_should_check_expected_version(self):
+        user = self._create("user0")
+        self.other.update(user.id, self._update("Jane Doe"))
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.update(user.id, self._update("name"), 1)
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.delete(user.id, 1)
+        self.assertIsNotNone(self.repo.delete(user.id, 2))
+
+    def test_should_share_generation(self):
+        generation = self.other.generation
+        self._create("user0")
+        self.assertGreater(self.other.generation, generation)
+
+    def test_should_publish_own_changes(self):
+        changes: list[UserChange] = []
+        self.repo.subscribe(changes.append)
+        user = self._create("user0")
+        self._create("user1", repo=self.other)
+        self.assertListEqual(changes, [UserChange("create", user)])
+
+    def test_should_search_users_of_other_processes(self):
+        u0 = self._create("alice")
+        u1 = self._create("alicia", gym_id=1, repo=self.other)
+        self.assertListEqual(self.repo.search("ali", 10), [u0, u1])
+        index = self.repo._search
+        self.assertListEqual(self.repo.search("ali", 10, gym_id=1), [u1])
+        self.assertIs(self.repo._search, index)
+        updated = self.other.update(u1.id, self._update("Bobby Smith"))
+        self.assertListEqual(self.repo.search("bobby", 10), [updated])
+        self.assertNotIn(updated, self.repo.search("alicia", 10))
+
+    def test_should_encode_users(self):
+        user = self._create("user0")
+        self.assertEqual(self.other.encode(user), encode_user(user))
+
+    def test_should_warm_newest_users(self):
+        users = [self._create(f"user{i}", repo=self.other) for i in range(3)]
+        self.other.delete(users[2].id)
+        self.assertEqual(self.repo.warm(1), 1)
+        self.assertIn(users[1].id, self.repo._cache)
+        self.assertNotIn(users[0].id, self.repo._cache)
+        self.assertEqual(len(self.repo._fragments), 1)
+        self.assertEqual(self.repo.warm(10), 2)
+
+    def test_should_reject_users_over_capacity(self):
+        for i in range(8):
+            self._create(f"user{i}")
+        with self.assertRaises(UserRepositoryError):
+            self._create("user8")
+
+    def test_should_reject_records_larger_than_slots(self):
+        with self.assertRaises(UserRepositoryError):
+            self._create("user" * 200)
+        self.assertListEqual(self.repo.find_all(), [])
+
+    def test_should_recover_slots_of_dead_writers(self):
+        user = self._create("user0")
+        # A writer that died mid write leaves the sequence number odd
+        offset = self.repo._offset(user.id)
+        seq = _SEQ.unpack_from(self.repo._mm, offset)[0]
+        _SEQ.pack_into(self.repo._mm, offset, seq + 1)
+        self.assertEqual(self.other.find_by_id(user.id), user)
+        self.assertEqual(_SEQ.unpack_from(self.repo._mm, offset)[0], seq + 2)
+
+    def test_should_not_read_records_not_fully_seen(self):
+        user = self._create("user0")
+        # As if the sequence number was seen before the whole record
+        at = self.repo._mm.find(b"user0 Doe", self.repo._offset(user.id))
+        self.repo._mm[at : at + 5] = b"user9"
+        found = []
+        with self.repo._locked():
+            reader = threading.Thread(
+                target=lambda: found.append(self.other.find_by_id(user.id))
+            )
+            reader.start()
+            reader.join(0.2)
+            self.assertTrue(reader.is_alive())
+            self.repo._mm[at : at + 5] = b"user0"
+        reader.join()
+        self.assertListEqual(found, [user])
+
+    def test_should_reject_other_files(self):
+        path = Path(self.directory.name) / "other"
+        path.write_bytes(b"\0" * 128)
+        with self.assertRaises(UserRepositoryError):
+            SharedMemoryUserRepository(str(path))
+        self.repo.ping()
@@ -0,0 +1,309 @@
+import sqlite3
+import unittest
+from datetime import UTC, date, datetime, timedelta
+
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.migrations import migrate
+from src.repositories.sqlite import SQLiteUserRepository, fts_query
+from src.repositories.user import (
+    UserChange,
+    UserRepositoryConflictError,
+    UserRepositoryError,
+    encode_user,
+)
+
+
+class TestSQLiteUserRepository(unittest.TestCase):
+    conn: sqlite3.Connection
+    repo: SQLiteUserRepository
+
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(":memory:")
+        migrate(self.conn)
+        self.repo = SQLiteUserRepository(self.conn)
+        self.user_create = UserCreate(
+            username="jdoe",
+            name="John Doe",
+            date_of_birth=date(1999, 9, 9),
+            role="staff",
+            password_hash="hash",
+        )
+        self.user_update = UserUpdate(
+            username="jwalker",
+            name="Johnny Walker",
+            date_of_birth=date(1999, 9, 9),
+            role="student",
+        )
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def _create(self, username: str, name: str) -> UserInDB:
+        return self.repo.create(
+            UserCreate(
+                **{
+                    **self.user_create.to_dict(),
+                    "username": username,
+                    "name": name,
+                }
+            )
+        )
+
+    def test_create_and_find(self):
+        user = self.repo.create(self.user_create)
+        self.assertEqual(
+            user, UserInDB.from_user_create(user.id, self.user_create)
+        )
+        self.assertEqual(self.repo.find_by_id(user.id), user)
+        self.assertIsNone(self.repo.find_by_id(999))
+        self.assertListEqual(self.repo.find_all(), [user])
+
+    def test_create_duplicated_username(self):
+        self.repo.create(self.user_create)
+        with self.assertRaises(UserRepositoryError):
+            self.repo.create(self.user_create)
+
+    def test_find_many(self):
+        u1 = self._create("user1", "User One")
+        u2 = self._create("user2", "User Two")
+        self.assertDictEqual(
+            self.repo.find_many([u2.id, 999, u1.id, u2.id]),
+            {u1.id: u1, u2.id: u2},
+        )
+        self.assertDictEqual(self.repo.find_many([]), {})
+
+    def test_update(self):
+        user = self.repo.create(self.user_create)
+        updated = self.repo.update(user.id, self.user_update)
+        self.assertIsNotNone(updated)
+        self.assertEqual(updated.version, 2)  # type: ignore
+        self.assertEqual(updated.name, "Johnny Walker")  # type: ignore
+        self.assertEqual(updated.password_hash, "hash")  # type: ignore
+        self.assertIsNone(self.repo.update(999, self.user_update))
+
+    def test_update_with_expected_version(self):
+        user = self.repo.create(self.user_create)
+        self.repo.update(user.id, self.user_update, expected_version=1)
+        with self.assertRaises(UserRepositoryConflictError) as e:
+            self.repo.update(user.id, self.user_update, expected_version=1)
+        self.assertEqual(e.exception.current_version, 2)
+        self.assertIsNone(self.repo.update(999, self.user_update, 1))
+
+    def test_update_with_previous(self):
+        user = self.repo.create(self.user_create)
+        previous, updated = self.repo.update_with_previous(  # type: ignore
+            user.id, self.user_update
+        )
+        self.assertEqual(previous, user)
+        self.assertEqual(updated, self.repo.find_by_id(user.id))
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.update_with_previous(user.id, self.user_update, 1)
+        self.assertIsNone(self.repo.update_with_previous(999, self.user_update))
+
+    def test_delete(self):
+        user = self.repo.create(self.user_create)
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.delete(user.id, expected_version=2)
+        self.assertEqual(self.repo.delete(user.id, expected_version=1), user)
+        self.assertIsNone(self.repo.delete(user.id))
+        self.assertListEqual(self.repo.find_all(), [])
+
+    def test_should_keep_deleted_users_as_tombstones(self):
+        jdoe = self.repo.create(self.user_create)
+        self.repo.delete(jdoe.id)
+        self.assertIsNone(self.repo.find_by_id(jdoe.id))
+        self.assertDictEqual(self.repo.find_many([jdoe.id]), {})
+        self.assertIsNone(self.repo.find_fields_by_id(jdoe.id, ["id"]))
+        self.assertListEqual(self.repo.search("doe", 10), [])
+        self.assertIsNone(self.repo.update(jdoe.id, self.user_update))
+        # The username stays taken, so the user can always be restored
+        with self.assertRaises(UserRepositoryError):
+            self.repo.create(self.user_create)
+        self.assertIsNone(self.repo.restore(jdoe.id, gym_id=3))
+        restored = UserInDB(**{**jdoe.to_dict(), "version": jdoe.version + 1})
+        self.assertEqual(self.repo.restore(jdoe.id, gym_id=0), restored)
+        self.assertListEqual(self.repo.search("doe", 10), [restored])
+        self.assertIsNone(self.repo.restore(jdoe.id))
+
+    def test_should_purge_oldest_deleted_users_in_batches(self):
+        users = [self._create(f"user{i}", f"User {i}") for i in range(3)]
+        for user in reversed(users):
+            self.repo.delete(user.id)
+        later = datetime.now(UTC) + timedelta(seconds=1)
+        self.assertListEqual(
+            self.repo.purge_deleted(later - timedelta(hours=1), 9), []
+        )
+        self.assertCountEqual(
+            self.repo.purge_deleted(later, 2), [users[2].id, users[1].id]
+        )
+        self.assertListEqual(self.repo.purge_deleted(later, 2), [users[0].id])
+        self.assertEqual(
+            self.conn.execute("SELECT COUNT(*) FROM user_account").fetchone(),
+            (0,),
+        )
+        self.assertEqual(self.repo.create(self.user_create).username, "jdoe")
+
+    def test_search(self):
+        jdoe = self.repo.create(self.user_create)
+        maria = self._create("maria", "Maria Joana")
+        self.assertListEqual(self.repo.search("doe", 10), [jdoe])
+        self.assertListEqual(self.repo.search("mar jo", 10), [maria])
+        self.assertSetEqual(
+            {u.id for u in self.repo.search("jo", 10)}, {jdoe.id, maria.id}
+        )
+        self.assertEqual(len(self.repo.search("jo", 1)), 1)
+        self.assertListEqual(self.repo.search('"*', 10), [])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        jdoe = self.repo.create(self.user_create)
+        self.repo.update(jdoe.id, self.user_update)
+        self.assertListEqual(self.repo.search("doe", 10), [])
+        self.assertListEqual(
+            [u.id for u in self.repo.search("walker", 10)], [jdoe.id]
+        )
+        self.repo.delete(jdoe.id)
+        self.assertListEqual(self.repo.search("walker", 10), [])
+
+    def test_should_publish_changes(self):
+        changes: list[UserChange] = []
+        self.repo.subscribe(changes.append)
+        user = self.repo.create(self.user_create)
+        updated = self.repo.update(user.id, self.user_update)
+        self.repo.update(99, self.user_update)
+        self.repo.delete(user.id)
+        self.assertListEqual(
+            [(c.op, c.user) for c in changes],
+            [("create", user), ("update", updated), ("delete", updated)],
+        )
+
+    def test_should_filter_by_gym(self):
+        jdoe = self.repo.create(self.user_create)
+        maria = self.repo.create(
+            UserCreate(
+                **{
+                    **self.user_create.to_dict(),
+                    "username": "maria",
+                    "name": "Maria Doe",
+                    "gym_id": 3,
+                }
+            )
+        )
+        self.assertEqual(self.repo.find_by_id(maria.id), maria)
+        self.assertListEqual(self.repo.find_all(), [jdoe, maria])
+        self.assertListEqual(self.repo.find_all(3), [maria])
+        self.assertListEqual(self.repo.find_all(4), [])
+        self.assertListEqual(self.repo.search("doe", 10, 0), [jdoe])
+        self.assertListEqual(self.repo.search("doe", 10, 3), [maria])
+
+    def test_should_filter_users(self):
+        jdoe = self.repo.create(self.user_create)
+        maria = self.repo.create(
+            UserCreate(
+                **{
+                    **self.user_create.to_dict(),
+                    "username": "maria",
+                    "name": "maria Joana",
+                    "date_of_birth": date(2001, 1, 1),
+                    "role": "student",
+                }
+            )
+        )
+        self.assertListEqual(
+            self.repo.find_all(where=UserFilter(role="student")), [maria]
+        )
+        self.assertListEqual(
+            self.repo.find_all(where=UserFilter(name="JO")), [jdoe]
+        )
+        self.assertListEqual(
+            self.repo.find_all(where=UserFilter(name="M", role="staff")), []
+        )
+        self.assertListEqual(
+            self.repo.find_all(
+                where=UserFilter(
+                    born_from=date(1999, 9, 9), born_to=date(2000, 1, 1)
+                )
+            ),
+            [jdoe],
+        )
+        self.assertListEqual(
+            self.repo.find_all(0, UserFilter(born_from=date(2001, 1, 1))),
+            [maria],
+        )
+
+    def test_should_iterate_users_in_batches(self):
+        users = [self._create(f"user{i}", f"User {i}") for i in range(5)]
+        self.assertListEqual(list(self.repo.iter_all(batch_size=2)), users)
+        self.assertListEqual(list(self.repo.iter_all(batch_size=5)), users)
+        self.assertListEqual(
+            list(self.repo.iter_all(0, UserFilter(name="user 3"), 1)),
+            [users[3]],
+        )
+        self.assertListEqual(list(self.repo.iter_all(9)), [])
+
+    def test_should_use_given_ids(self):
+        repo = SQLiteUserRepository(self.conn, iter([7]).__next__)
+        self.assertEqual(repo.create(self.user_create).id, 7)
+
+    def test_should_keep_fragments_of_written_users(self):
+        jdoe = self.repo.create(self.user_create)
+        fragment = self.repo.encode(self.repo.find_by_id(jdoe.id))  # type: ignore
+        self.assertEqual(fragment, encode_user(jdoe))
+        self.assertIs(self.repo.encode(self.repo.find_all()[0]), fragment)
+        updated = self.repo.update(
+            jdoe.id,
+            UserUpdate(**{**self.user_update.to_dict(), "name": "Jane Doe"}),
+        )
+        self.assertEqual(
+            self.repo.encode(self.repo.find_by_id(jdoe.id)),  # type: ignore
+            encode_user(updated),  # type: ignore
+        )
+        self.repo.delete(jdoe.id)
+        self.assertEqual(len(self.repo._fragments), 0)
+
+    def test_should_warm_fragments_of_newest_users(self):
+        users = [self._create(f"user{i}", f"User {i}") for i in range(3)]
+        # A fresh store over the same database, as after a restart
+        repo = SQLiteUserRepository(self.conn)
+        self.assertEqual(repo.warm(2), 2)
+        self.assertEqual(len(repo._fragments), 2)
+        self.assertIs(
+            repo.encode(users[2]),
+            repo.encode(repo.find_by_id(users[2].id)),  # type: ignore
+        )
+        self.assertEqual(repo.warm(10), 3)
+
+    def test_find_fields(self):
+        jdoe = self.repo.create(self.user_create)
+        maria = self._create("maria", "Maria Joana")
+        self.assertListEqual(
+            self.repo.find_all_fields(["name", "id"]),
+            [
+                {"name": "John Doe", "id": jdoe.id},
+                {"name": "Maria Joana", "id": maria.id},
+            ],
+        )
+        self.assertListEqual(
+            self.repo.find_all_fields(["id"], 0, UserFilter(name="mar")),
+            [{"id": maria.id}],
+        )
+        self.assertDictEqual(
+            self.repo.find_fields_by_id(jdoe.id, ["date_of_birth"]),  # type: ignore
+            {"date_of_birth": date(1999, 9, 9)},
+        )
+        self.assertIsNone(self.repo.find_fields_by_id(999, ["id"]))
+        for fields in ([], ["id", "id; DROP TABLE user_account"]):
+            with (
+                self.subTest(fields=fields),
+                self.assertRaises(UserRepositoryError),
+            ):
+                self.repo.find_all_fields(fields)
+
+    def test_ping(self):
+        self.repo.ping()
+        self.conn.close()
+        with self.assertRaises(UserRepositoryError):
+            self.repo.ping()
+
+    def test_fts_query(self):
+        self.assertEqual(fts_query("John  D"), '"john"* "d"*')
+        self.assertIsNone(fts_query(" - "))
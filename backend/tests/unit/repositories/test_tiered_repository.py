@@ -0,0 +1,135 @@
+import sqlite3
+import unittest
+from datetime import date
+
+from src.models.user import UserCreate, UserInDB, UserUpdate
+from src.repositories.migrations import migrate
+from src.repositories.sqlite import SQLiteUserRepository
+from src.repositories.tiered import TieredUserRepository
+from src.repositories.user import UserChange, encode_user
+
+
+class TestTieredUserRepository(unittest.TestCase):
+    conn: sqlite3.Connection
+    cold: SQLiteUserRepository
+    loader: SQLiteUserRepository
+    repo: TieredUserRepository
+
+    def setUp(self) -> None:
+        self.conn = sqlite3.connect(":memory:")
+        migrate(self.conn)
+        self.cold = SQLiteUserRepository(self.conn)
+        self.repo = TieredUserRepository(self.cold, max_users=2)
+        # Writes users the tiers don't see, as if they were already stored
+        self.loader = SQLiteUserRepository(self.conn)
+
+    def tearDown(self) -> None:
+        self.conn.close()
+
+    def _create(self, username: str, repo=None) -> UserInDB:
+        return (repo or self.repo).create(
+            UserCreate(
+                username=username,
+                name=f"{username} Doe",
+                date_of_birth=date(1999, 9, 9),
+                role="student",
+                password_hash="hash",
+            )
+        )
+
+    def _update(self, name: str) -> UserUpdate:
+        return UserUpdate(
+            username="username",
+            name=name,
+            date_of_birth=date(2000, 1, 1),
+            role="staff",
+        )
+
+    def test_should_promote_misses_and_count_hits(self):
+        user = self._create("user0", repo=self.loader)
+        self.assertEqual(self.repo.find_by_id(user.id), user)
+        self.assertEqual(self.repo.find_by_id(user.id), user)
+        self.assertIsNone(self.repo.find_by_id(999))
+        stats = self.repo.stats
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+        self.assertAlmostEqual(stats.hit_ratio, 1 / 3)
+        self.assertEqual(stats.hot_users, 1)
+        self.assertEqual(stats.hot_bytes, len(encode_user(user)))
+
+    def test_should_count_and_promote_field_reads(self):
+        user = self._create("user0", repo=self.loader)
+        for _ in range(2):
+            self.assertDictEqual(
+                self.repo.find_fields_by_id(user.id, ["id", "name"]),  # type: ignore
+                {"id": user.id, "name": user.name},
+            )
+        self.assertIsNone(self.repo.find_fields_by_id(999, ["id"]))
+        stats = self.repo.stats
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+        self.assertEqual(stats.hot_users, 1)
+
+    def test_should_measure_tier_latency(self):
+        ticks = iter([0.0, 1.0, 3.0, 10.0, 10.25])
+        repo = TieredUserRepository(self.cold, clock=lambda: next(ticks))
+        user = self._create("user0", repo=self.loader)
+        repo.find_by_id(user.id)
+        repo.find_by_id(user.id)
+        stats = repo.stats
+        self.assertEqual(stats.cold_latency, 2.0)
+        self.assertEqual(stats.hot_latency, 0.25)
+
+    def test_should_evict_least_recently_read_users(self):
+        users = [self._create(f"user{i}", repo=self.loader) for i in range(3)]
+        self.repo.find_by_id(users[0].id)
+        self.repo.find_by_id(users[1].id)
+        self.repo.find_by_id(users[0].id)
+        self.repo.find_by_id(users[2].id)
+        self.assertListEqual(list(self.repo._hot), [users[0].id, users[2].id])
+        self.assertEqual(self.repo.stats.evictions, 1)
+
+    def test_should_bound_bytes_of_hot_users(self):
+        users = [self._create(f"user{i}", repo=self.loader) for i in range(3)]
+        size = len(encode_user(users[0]))
+        repo = TieredUserRepository(self.cold, 10, max_bytes=size * 2)
+        self.assertEqual(len(repo.find_many(u.id for u in users)), 3)
+        self.assertEqual(repo.stats.hot_users, 2)
+        self.assertLessEqual(repo.stats.hot_bytes, size * 2)
+
+    def test_should_write_through_and_keep_hot_users_current(self):
+        user = self._create("user0")
+        self.assertEqual(self.cold.find_by_id(user.id), user)
+        self.assertIn(user.id, self.repo._hot)
+        updated = self.repo.update(user.id, self._update("New Name"))
+        self.assertEqual(self.repo.find_by_id(user.id), updated)
+        self.assertEqual(self.repo.encode(updated), encode_user(updated))  # type: ignore
+        self.repo.delete(user.id)
+        self.assertIsNone(self.repo.find_by_id(user.id))
+        restored = self.repo.restore(user.id)
+        self.assertEqual(restored.version, updated.version + 1)  # type: ignore
+        self.assertEqual(self.repo.find_by_id(user.id), restored)
+
+    def test_should_not_promote_reads_that_raced_a_write(self):
+        user = self._create("user0", repo=self.loader)
+        writes = self.repo._writes
+        self.repo.update(user.id, self._update("New Name"))
+        self.repo._promote([user], writes)
+        self.assertNotIn(user.id, self.repo._hot)
+
+    def test_should_scan_the_cold_tier_without_promoting(self):
+        users = [self._create(f"user{i}", repo=self.loader) for i in range(3)]
+        self.assertListEqual(self.repo.find_all(), users)
+        self.assertListEqual(self.repo.search("user1", 10), [users[1]])
+        self.assertEqual(self.repo.stats.hot_users, 0)
+
+    def test_should_warm_newest_users(self):
+        users = [self._create(f"user{i}", repo=self.loader) for i in range(3)]
+        self.assertEqual(self.repo.warm(5), 2)
+        self.assertListEqual(list(self.repo._hot), [users[1].id, users[2].id])
+
+    def test_should_publish_changes(self):
+        changes: list[UserChange] = []
+        self.repo.subscribe(changes.append)
+        generation = self.repo.generation
+        user = self._create("user0")
+        self.assertListEqual(changes, [UserChange("create", user)])
+        self.assertGreater(self.repo.generation, generation)
@@ -1,8 +1,15 @@
 import unittest
-from datetime import date
+from datetime import UTC, date, datetime, timedelta
 
-from src.models.user import UserCreate, UserInDB, UserUpdate
-from src.repositories.user import InMemoryUserRepository
+from src.models.user import UserCreate, UserFilter, UserInDB, UserUpdate
+from src.repositories.user import (
+    InMemoryUserRepository,
+    UserChange,
+    UserFragments,
+    UserRepository,
+    UserRepositoryConflictError,
+    encode_user,
+)
 
 
 class TestInMemoryUserRepository(unittest.TestCase):
@@ -59,6 +66,7 @@ class TestInMemoryUserRepository(unittest.TestCase):
             date_of_birth=date(1999, 9, 9),
             role="staff",
             password_hash="hash",
+            version=2,
         )
         self.user_updated_in_db_2 = UserInDB(
             id=1,
@@ -67,6 +75,7 @@ class TestInMemoryUserRepository(unittest.TestCase):
             date_of_birth=date(1999, 9, 9),
             role="staff",
             password_hash="hash",
+            version=2,
         )
 
     def test_create(self):
@@ -92,6 +101,29 @@ class TestInMemoryUserRepository(unittest.TestCase):
             self.repo.find_all(), [self.user_in_db_1, self.user_in_db_2]
         )
 
+    def test_find_all_with_filter(self):
+        self.repo.create(self.user_create)
+        self.assertListEqual(
+            self.repo.find_all(where=UserFilter(role="staff", name="NA")),
+            [self.user_in_db_1],
+        )
+        self.assertListEqual(
+            self.repo.find_all(where=UserFilter(born_to=date(1999, 9, 8))), []
+        )
+        self.assertListEqual(self.repo.find_all(1, UserFilter()), [])
+
+    def test_find_fields(self):
+        self.repo.create(self.user_create)
+        self.assertListEqual(
+            self.repo.find_all_fields(["id", "role"]),
+            [{"id": 0, "role": "staff"}],
+        )
+        self.assertDictEqual(
+            self.repo.find_fields_by_id(0, ["username"]),  # type: ignore
+            {"username": "username"},
+        )
+        self.assertIsNone(self.repo.find_fields_by_id(1, ["username"]))
+
     def test_find_by_id(self):
         self.assertIsNone(self.repo.find_by_id(999))
         self.repo.create(self.user_create)
@@ -99,6 +131,27 @@ class TestInMemoryUserRepository(unittest.TestCase):
         self.assertEqual(self.repo.find_by_id(0), self.user_in_db_1)
         self.assertEqual(self.repo.find_by_id(1), self.user_in_db_2)
 
+    def test_find_many(self):
+        self.assertDictEqual(self.repo.find_many([0, 1]), {})
+        self.repo.create(self.user_create)
+        self.repo.create(self.user_create)
+        self.assertDictEqual(
+            self.repo.find_many([1, 999, 0]),
+            {0: self.user_in_db_1, 1: self.user_in_db_2},
+        )
+        self.assertDictEqual(self.repo.find_many([]), {})
+
+    def test_search(self):
+        self.assertListEqual(self.repo.search("name", 10), [])
+        self.repo.create(self.user_create)
+        self.assertListEqual(self.repo.search("nam", 10), [self.user_in_db_1])
+        self.repo.update(0, self.user_update1)
+        self.assertListEqual(
+            self.repo.search("new", 10), [self.user_updated_in_db_1]
+        )
+        self.repo.delete(0)
+        self.assertListEqual(self.repo.search("new", 10), [])
+
     def test_delete(self):
         self.assertIsNone(self.repo.delete(999))
         self.repo.create(self.user_create)
@@ -111,6 +164,31 @@ class TestInMemoryUserRepository(unittest.TestCase):
         self.assertEqual(self.repo.delete(1), self.user_in_db_2)
         self.assertDictEqual(self.repo._data, {})
 
+    def test_should_restore_deleted_users(self):
+        user = self.repo.create(self.user_create)
+        self.repo.delete(user.id)
+        self.assertIsNone(self.repo.find_by_id(user.id))
+        self.assertListEqual(self.repo.search("username", 10), [])
+        self.assertIsNone(self.repo.restore(user.id, gym_id=1))
+        restored = UserInDB(**{**user.to_dict(), "version": user.version + 1})
+        self.assertEqual(self.repo.restore(user.id, gym_id=0), restored)
+        self.assertEqual(self.repo.find_by_id(user.id), restored)
+        self.assertListEqual(self.repo.search("username", 10), [restored])
+        self.assertIsNone(self.repo.restore(user.id))
+
+    def test_should_purge_oldest_deleted_users_in_batches(self):
+        users = [self.repo.create(self.user_create) for _ in range(3)]
+        for user in reversed(users):
+            self.repo.delete(user.id)
+        self.assertListEqual(
+            self.repo.purge_deleted(datetime.now(UTC) - timedelta(hours=1), 9),
+            [],
+        )
+        later = datetime.now(UTC) + timedelta(seconds=1)
+        self.assertListEqual(self.repo.purge_deleted(later, 2), [2, 1])
+        self.assertListEqual(self.repo.purge_deleted(later, 2), [0])
+        self.assertIsNone(self.repo.restore(0))
+
     def test_update(self):
         self.repo.create(self.user_create)
         self.repo.create(self.user_create)
@@ -121,3 +199,154 @@ class TestInMemoryUserRepository(unittest.TestCase):
         self.assertEqual(
             self.repo.update(1, self.user_update2), self.user_updated_in_db_2
         )
+
+    def test_update_with_expected_version(self):
+        self.repo.create(self.user_create)
+        self.assertEqual(
+            self.repo.update(0, self.user_update1, expected_version=1),
+            self.user_updated_in_db_1,
+        )
+        with self.assertRaises(UserRepositoryConflictError) as e:
+            self.repo.update(0, self.user_update2, expected_version=1)
+        self.assertEqual(e.exception.current_version, 2)
+        self.assertEqual(self.repo.find_by_id(0), self.user_updated_in_db_1)
+        self.assertIsNone(self.repo.update(999, self.user_update1, 1))
+
+    def test_delete_with_expected_version(self):
+        self.repo.create(self.user_create)
+        self.repo.update(0, self.user_update1)
+        with self.assertRaises(UserRepositoryConflictError) as e:
+            self.repo.delete(0, expected_version=1)
+        self.assertEqual(e.exception.current_version, 2)
+        self.assertEqual(
+            self.repo.delete(0, expected_version=2), self.user_updated_in_db_1
+        )
+        self.assertDictEqual(self.repo._data, {})
+
+    def test_update_with_previous(self):
+        self.repo.create(self.user_create)
+        self.assertTupleEqual(
+            self.repo.update_with_previous(0, self.user_update1),  # type: ignore
+            (self.user_in_db_1, self.user_updated_in_db_1),
+        )
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.update_with_previous(0, self.user_update2, 1)
+        self.assertIsNone(
+            self.repo.update_with_previous(999, self.user_update1)
+        )
+
+    def test_default_update_with_previous_should_retry_raced_updates(self):
+        self.repo.create(self.user_create)
+        find_by_id = self.repo.find_by_id
+
+        def racing_find_by_id(user_id: int) -> UserInDB | None:
+            # Another write lands right after the first read
+            user = find_by_id(user_id)
+            self.repo.find_by_id = find_by_id  # type: ignore
+            self.repo.update(user_id, self.user_update1)
+            return user
+
+        self.repo.find_by_id = racing_find_by_id  # type: ignore
+        previous, updated = UserRepository.update_with_previous(  # type: ignore
+            self.repo, 0, self.user_update2
+        )
+        self.assertEqual(previous, self.user_updated_in_db_1)
+        self.assertEqual(updated.version, 3)
+
+    def test_update_should_not_overwrite_concurrent_swap(self):
+        self.repo.create(self.user_create)
+        stale = self.repo.find_by_id(0)
+        self.repo.update(0, self.user_update1)
+        self.assertFalse(
+            self.repo._compare_and_swap(0, stale, self.user_in_db_1)  # type: ignore
+        )
+        self.assertEqual(self.repo.find_by_id(0), self.user_updated_in_db_1)
+
+    def test_should_keep_fragments_of_users(self):
+        user = self.repo.create(self.user_create)
+        fragment = self.repo.encode(user)
+        self.assertEqual(
+            fragment,
+            b'{"username":"username","name":"name",'
+            b'"date_of_birth":"1999-09-09","role":"staff","gym_id":0,'
+            b'"id":0,"version":1}',
+        )
+        self.assertIs(self.repo.encode(self.repo.find_by_id(0)), fragment)  # type: ignore
+        updated = self.repo.update(0, self.user_update1)
+        self.assertEqual(self.repo.encode(updated), encode_user(updated))  # type: ignore
+        self.repo.delete(0)
+        self.assertEqual(len(self.repo._fragments), 0)
+
+    def test_should_warm_newest_users(self):
+        self.repo.create(self.user_create)
+        self.assertEqual(self.repo.warm(5), 1)
+        self.assertEqual(self.repo.warm(0), 0)
+
+    def test_should_change_generation_on_mutations(self):
+        generations = [self.repo.generation]
+        self.repo.create(self.user_create)
+        generations.append(self.repo.generation)
+        self.repo.find_all()
+        self.repo.update(99, self.user_update1)
+        self.assertEqual(self.repo.generation, generations[-1])
+        self.repo.update(0, self.user_update1)
+        generations.append(self.repo.generation)
+        self.repo.delete(0)
+        generations.append(self.repo.generation)
+        self.assertEqual(len(set(generations)), 4)
+
+    def test_should_publish_changes(self):
+        changes: list[UserChange] = []
+        unsubscribe = self.repo.subscribe(changes.append)
+        self.repo.create(self.user_create)
+        self.repo.update(0, self.user_update1)
+        self.repo.update(99, self.user_update1)
+        with self.assertRaises(UserRepositoryConflictError):
+            self.repo.delete(0, expected_version=1)
+        self.repo.delete(0)
+        unsubscribe()
+        self.repo.create(self.user_create)
+        self.assertListEqual(
+            changes,
+            [
+                UserChange("create", self.user_in_db_1),
+                UserChange("update", self.user_updated_in_db_1),
+                UserChange("delete", self.user_updated_in_db_1),
+            ],
+        )
+
+
+class TestUserFragments(unittest.TestCase):
+    def test_should_encode_stale_users_again(self):
+        fragments = UserFragments()
+        user = UserInDB(
+            id=0,
+            username="username",
+            name="name",
+            date_of_birth=date(1999, 9, 9),
+            role="staff",
+            password_hash="hash",
+        )
+        fragments.put(user)
+        fragment = fragments.get(user)
+        self.assertNotIn(b"hash", fragment)
+        self.assertIs(fragments.get(UserInDB(**user.to_dict())), fragment)
+        renamed = UserInDB(**{**user.to_dict(), "name": "other"})
+        self.assertEqual(fragments.get(renamed), encode_user(renamed))
+        self.assertEqual(len(fragments), 1)
+        fragments.discard(0)
+        self.assertEqual(len(fragments), 0)
+
+    def test_should_not_keep_fragments_if_disabled(self):
+        fragments = UserFragments(keep=False)
+        user = UserInDB(
+            id=0,
+            username="username",
+            name="name",
+            date_of_birth=date(1999, 9, 9),
+            role="staff",
+            password_hash="hash",
+        )
+        fragments.put(user)
+        self.assertEqual(fragments.get(user), encode_user(user))
+        self.assertEqual(len(fragments), 0)
@@ -1,15 +1,29 @@
+import asyncio
 import os
+import tempfile
 import unittest
 from datetime import date
 from unittest.mock import MagicMock
 
-from src.models.user import UserCreate, UserCreateBody, UserInDB, UserUpdate
-from src.repositories.user import InMemoryUserRepository, UserRepository
+from src.models.user import (
+    UserCreate,
+    UserCreateBody,
+    UserFilter,
+    UserInDB,
+    UserUpdate,
+)
+from src.repositories.user import (
+    InMemoryUserRepository,
+    UserRepository,
+    encode_user,
+)
 from src.services.user import (
     UserService,
+    UserServiceConflictError,
     UserServiceError,
     UserServiceValidationError,
 )
+from src.utils.audit import AuditLog
 
 
 class MockRepository(UserRepository):
@@ -49,6 +63,9 @@ class MockRepository(UserRepository):
     def delete(self, *args, **kwargs) -> UserInDB | None:
         return self.delete_mock(*args, **kwargs)
 
+    def restore(self, *args, **kwargs) -> UserInDB | None:
+        return self.repo.restore(*args, **kwargs)
+
     def find_all(self, *args, **kwargs) -> list[UserInDB]:
         return self.find_all_mock(*args, **kwargs)
 
@@ -244,6 +261,37 @@ class TestUserService(unittest.TestCase):
             ):
                 self.service.create_user(t)
 
+    def test_should_create_user_from_json(self):
+        user = self.service.create_user(
+            b'{"username": "username 0", "name": "name 0", "role": "staff",'
+            b' "date_of_birth": "1990-09-09", "password": "password"}'
+        )
+        self.assertEqual(self.mock_repo.repo._data, {user.id: user})
+        self.assertEqual(user.date_of_birth, date(1990, 9, 9))
+
+    def test_should_report_all_body_errors_on_create(self):
+        with self.assertRaises(UserServiceValidationError) as e:
+            self.service.create_user(
+                b'{"username": "", "role": "staff", "admin": true}'
+            )
+        errors = e.exception.validation_error.errors  # type: ignore
+        self.assertListEqual(
+            [f.name for f in errors],
+            ["username", "name", "date_of_birth", "password", "admin"],
+        )
+
+    def test_should_create_user_on_hashing_pool(self):
+        user = asyncio.run(
+            self.service.acreate_user(self.user_create_0, gym_id=2)
+        )
+        self.assertEqual(self.mock_repo.repo._data, {user.id: user})
+        self.assertEqual(user.gym_id, 2)
+        self.assertTrue(self.service.ph.verify(user.password_hash, "password"))
+        with self.assertRaises(UserServiceValidationError):
+            asyncio.run(self.service.acreate_user(b"{}"))
+        with self.assertRaises(UserServiceError):
+            asyncio.run(self.servce_exc.acreate_user(self.user_create_0))
+
     def test_should_raise_correct_error_on_create(self):
         with self.assertRaises(UserServiceError):
             valid_user = UserCreateBody(
@@ -257,10 +305,69 @@ class TestUserService(unittest.TestCase):
 
     def test_should_find_all(self):
         self.assertListEqual(self.service.find_all_users(), [])
-        self.mock_repo.find_all_mock.assert_called_once_with()
+        self.mock_repo.find_all_mock.assert_called_once_with(None, None)
         self._create_users()
         self.assertListEqual(self.service.find_all_users(), self.users)
 
+    def test_should_find_all_encoded(self):
+        self._create_users()
+        self.assertListEqual(
+            self.service.find_all_users_encoded(),
+            [encode_user(u) for u in self.users],
+        )
+        with self.assertRaises(UserServiceError):
+            self.servce_exc.find_all_users_encoded()
+
+    def test_should_parse_filter(self):
+        self.assertIsNone(self.service.parse_filter({"ids": "1"}))
+        where = self.service.parse_filter(
+            {"role": "Staff", "born_from": "1990-01-01", "other": "x"}
+        )
+        self.assertEqual(
+            where, UserFilter(role="staff", born_from=date(1990, 1, 1))
+        )
+        with self.assertRaises(UserServiceValidationError):
+            self.service.parse_filter({"born_to": "yesterday"})
+
+    def test_should_find_user_fields_in_gym(self):
+        user = self.service.create_user(self.user_create_0, gym_id=1)
+        self.assertDictEqual(
+            self.service.find_user_fields_by_id(user.id, ["name"], 1),  # type: ignore
+            {"name": "name 0"},
+        )
+        self.assertIsNone(
+            self.service.find_user_fields_by_id(user.id, ["id"], 2)
+        )
+        self.assertListEqual(
+            self.service.find_all_users_fields(["id", "gym_id"]),
+            [{"id": user.id, "gym_id": 1}],
+        )
+
+    def test_should_scope_users_to_gym(self):
+        self._create_users()
+        user = self.service.create_user(self.user_create_0, gym_id=1)
+        self.assertEqual(user.gym_id, 1)
+        self.assertListEqual(self.service.find_all_users(1), [user])
+        self.assertEqual(self.service.find_user_by_id(user.id, 1), user)
+        self.assertIsNone(self.service.find_user_by_id(user.id, 0))
+        self.assertDictEqual(
+            self.service.find_users_by_ids([user.id, self.users[0].id], 1),
+            {user.id: user},
+        )
+        user_update = UserUpdate(
+            name="updated_name",
+            role="student",
+            username="updated_username",
+            date_of_birth=date(2010, 10, 10),
+        )
+        self.assertIsNone(
+            self.service.update_user(user.id, user_update, gym_id=0)
+        )
+        self.assertIsNone(self.service.delete_user_by_id(user.id, gym_id=0))
+        self.assertEqual(
+            self.service.delete_user_by_id(user.id, gym_id=1), user
+        )
+
     def test_should_raise_correct_error_on_find_all(self):
         with self.assertRaises(UserServiceError):
             self.assertListEqual(self.servce_exc.find_all_users(), [])
@@ -277,6 +384,47 @@ class TestUserService(unittest.TestCase):
             self.service.find_user_by_id(self.users[1].id), self.users[1]
         )
 
+    def test_should_find_users_by_ids(self):
+        self.assertDictEqual(self.service.find_users_by_ids([0, 1]), {})
+        self._create_users()
+        self.assertDictEqual(
+            self.service.find_users_by_ids([self.users[1].id, 999]),
+            {self.users[1].id: self.users[1]},
+        )
+
+    def test_should_coalesce_concurrent_finds_by_id(self):
+        self._create_users()
+        user = self.users[0]
+
+        async def find_all_at_once() -> list[UserInDB | None]:
+            return await asyncio.gather(
+                *(self.service.afind_user_by_id(user.id) for _ in range(3)),
+                self.service.afind_user_by_id(user.id, gym_id=99),
+            )
+
+        self.assertListEqual(
+            asyncio.run(find_all_at_once()), [user, user, user, None]
+        )
+        self.assertEqual(self.mock_repo.find_by_id_mock.call_count, 2)
+        self.assertEqual(self.service.reads.stats.coalesced, 2)
+        with self.assertRaises(UserServiceError):
+            asyncio.run(self.servce_exc.afind_user_by_id(user.id))
+
+    def test_should_coalesce_concurrent_finds_of_fields(self):
+        user = self.service.create_user(self.user_create_0, gym_id=1)
+
+        async def find_all_at_once() -> list[dict | None]:
+            return await asyncio.gather(
+                *(
+                    self.service.afind_user_fields_by_id(user.id, ["name"], 1)
+                    for _ in range(2)
+                )
+            )
+
+        first, second = asyncio.run(find_all_at_once())
+        self.assertIs(first, second)
+        self.assertDictEqual(first, {"name": "name 0"})  # type: ignore
+
     def test_should_raise_correct_error_on_find_by_id(self):
         with self.assertRaises(UserServiceError):
             self.servce_exc.find_user_by_id(0)
@@ -290,6 +438,58 @@ class TestUserService(unittest.TestCase):
             with self.subTest(i=u.id):
                 self.assertEqual(self.service.delete_user_by_id(u.id), u)
 
+    def test_should_restore_deleted_users(self):
+        user = self.service.create_user(self.user_create_0, gym_id=1)
+        self.service.delete_user_by_id(user.id)
+        self.assertIsNone(self.service.restore_user_by_id(user.id, gym_id=2))
+        restored = UserInDB(**{**user.to_dict(), "version": user.version + 1})
+        self.assertEqual(self.service.restore_user_by_id(user.id, 1), restored)
+        self.assertEqual(self.service.find_user_by_id(user.id), restored)
+
+    def test_should_audit_changes_of_users(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        audit = AuditLog(directory.name, fsync=False)
+        self.addCleanup(audit.close)
+        service = UserService(self.mock_repo, self.service.hashing, audit)
+        user = service.create_user(self.user_create_0, 1, actor="admin")
+        body = {
+            "username": user.username,
+            "name": "new name",
+            "date_of_birth": "1990-09-09",
+            "role": user.role,
+        }
+        service.update_user(user.id, body, actor="staff")
+        service.delete_user_by_id(user.id, actor="admin")
+        service.restore_user_by_id(user.id, actor="admin")
+        audit.flush(5)
+        restore, delete, update, create = service.user_audit_records(
+            user.id, 10
+        )
+        self.assertListEqual(
+            [r.op for r in (create, update, delete, restore)],
+            ["create", "update", "delete", "restore"],
+        )
+        self.assertIsNone(create.before)
+        self.assertNotIn("password_hash", create.after)  # type: ignore
+        self.assertEqual(update.actor, "staff")
+        self.assertDictEqual(
+            update.before,  # type: ignore
+            {"name": "name 0", "version": 1},
+        )
+        self.assertDictEqual(
+            update.after,  # type: ignore
+            {"name": "new name", "version": 2},
+        )
+        self.assertIsNone(delete.after)
+        self.assertListEqual(
+            service.user_audit_records(user.id, 10, None, 2), []
+        )
+
+    def test_should_warm_codecs(self):
+        self.assertEqual(self.service.warm(), 4)
+        self.assertListEqual(self.mock_repo.repo.find_all(), [])
+
     def test_should_raise_correct_error_on_delete(self):
         with self.assertRaises(UserServiceError):
             self.servce_exc.delete_user_by_id(0)
@@ -375,10 +575,26 @@ class TestUserService(unittest.TestCase):
             UserInDB(
                 id=self.users[0].id,
                 password_hash=self.users[0].password_hash,
+                version=2,
                 **user_update.to_dict(),
             ),
         )
 
+    def test_should_raise_conflict_on_stale_update(self):
+        user_update = UserUpdate(
+            name="updated_name",
+            role="student",
+            username="updated_username",
+            date_of_birth=date(2010, 10, 10),
+        )
+        self._create_users()
+        self.service.update_user(self.users[0].id, user_update, 1)
+        with self.assertRaises(UserServiceConflictError) as e:
+            self.service.update_user(self.users[0].id, user_update, 1)
+        self.assertEqual(e.exception.current_version, 2)
+        with self.assertRaises(UserServiceConflictError):
+            self.service.delete_user_by_id(self.users[0].id, 1)
+
     def test_should_raise_correct_error_on_update(self):
         user_update = UserUpdate(
             role="student",
@@ -0,0 +1,98 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.utils.audit import AuditLog
+
+
+class TestAuditLog(unittest.TestCase):
+    directory: tempfile.TemporaryDirectory
+    path: Path
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _log(self, **kwargs) -> AuditLog:
+        log = AuditLog(self.path, fsync=False, **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def _append(self, log: AuditLog, user_id: int, n: int) -> None:
+        for i in range(n):
+            log.append("update", user_id, 1, "admin", {"v": i}, {"v": i + 1})
+
+    def test_should_write_records_in_the_background(self):
+        log = self._log()
+        log.append("create", 1, 1, "admin", None, {"name": "a"})
+        self.assertTrue(log.flush(5))
+        [record] = log.history(1, 10)
+        self.assertEqual(record.seq, 1)
+        self.assertEqual(record.op, "create")
+        self.assertEqual(record.actor, "admin")
+        self.assertIsNone(record.before)
+        self.assertDictEqual(record.after, {"name": "a"})  # type: ignore
+
+    def test_should_drop_records_while_the_queue_is_full(self):
+        log = self._log(batch_size=1, max_queued=1)
+        # The writer waits for the lock with at most one record taken
+        with log._lock, self.assertLogs(log._logger, "WARNING"):
+            self._append(log, 1, 5)
+        self.assertGreaterEqual(log.dropped, 3)
+        self.assertTrue(log.flush(5))
+        self.assertEqual(len(log.history(1, 10)), 5 - log.dropped)
+
+    def test_should_page_history_newest_first(self):
+        log = self._log(batch_size=3)
+        self._append(log, 1, 5)
+        self._append(log, 2, 2)
+        log.flush(5)
+        page = log.history(1, 3)
+        self.assertListEqual([r.seq for r in page], [5, 4, 3])
+        page = log.history(1, 3, before_seq=page[-1].seq)
+        self.assertListEqual([r.seq for r in page], [2, 1])
+        self.assertListEqual([r.seq for r in log.history(2, 10)], [7, 6])
+        self.assertListEqual(log.history(3, 10), [])
+
+    def test_should_filter_history_by_gym_before_the_limit(self):
+        log = self._log()
+        self._append(log, 1, 2)
+        log.append("update", 1, 2, "admin", None, None)
+        self._append(log, 1, 1)
+        log.flush(5)
+        self.assertListEqual([r.seq for r in log.history(1, 1, gym_id=2)], [3])
+        self.assertListEqual(
+            [r.seq for r in log.history(1, 2, gym_id=1)], [4, 2]
+        )
+
+    def test_should_rotate_segments_and_index_them(self):
+        log = self._log(segment_size=200, batch_size=1)
+        self._append(log, 1, 6)
+        log.flush(5)
+        segments = sorted(self.path.glob("audit-*.jsonl"))
+        self.assertGreater(len(segments), 1)
+        for segment in segments[:-1]:
+            self.assertTrue(segment.with_suffix(".idx").exists())
+        self.assertListEqual(
+            [r.seq for r in log.history(1, 10)], [6, 5, 4, 3, 2, 1]
+        )
+
+    def test_should_continue_after_reopening(self):
+        log = self._log(segment_size=200, batch_size=1)
+        self._append(log, 1, 4)
+        log.close()
+        active = sorted(self.path.glob("audit-*.jsonl"))[-1]
+        with active.open("ab") as f:
+            f.write(b'{"seq": 99, "user_')
+        log = self._log(segment_size=200)
+        self._append(log, 1, 1)
+        log.flush(5)
+        self.assertListEqual(
+            [r.seq for r in log.history(1, 10)], [5, 4, 3, 2, 1]
+        )
+        lines = active.read_bytes().splitlines()
+        self.assertTrue(all(json.loads(line) for line in lines))
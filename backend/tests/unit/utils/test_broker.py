@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import unittest
+
+from src.utils.broker import Broker
+
+
+class TestBroker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.broker = Broker(buffer_size=3, history_size=4)
+
+    async def test_should_fan_out_events(self):
+        subscriptions = [self.broker.subscribe() for _ in range(3)]
+        self.broker.publish("create", "1")
+        self.broker.publish("update", "2")
+        for s in subscriptions:
+            events = await s.get()
+            self.assertListEqual(
+                [(e.id, e.type, e.data) for e in events],
+                [(1, "create", "1"), (2, "update", "2")],
+            )
+        self.assertEqual(events[0].frame, b"id: 1\nevent: create\ndata: 1\n\n")
+
+    async def test_should_wait_for_events(self):
+        s = self.broker.subscribe()
+        task = asyncio.create_task(s.get())
+        await asyncio.sleep(0)
+        self.assertFalse(task.done())
+        self.broker.publish("create", "1")
+        self.assertEqual([e.id for e in await task], [1])
+
+    async def test_should_wake_subscribers_from_other_threads(self):
+        s = self.broker.subscribe()
+        task = asyncio.create_task(s.get())
+        await asyncio.sleep(0)
+        thread = threading.Thread(target=self.broker.publish, args=("a", "1"))
+        thread.start()
+        thread.join()
+        events = await asyncio.wait_for(task, 1)
+        self.assertEqual([e.id for e in events], [1])
+
+    async def test_should_evict_slow_subscribers(self):
+        slow = self.broker.subscribe()
+        fast = self.broker.subscribe()
+        for i in range(4):
+            self.broker.publish("create", str(i))
+            if i < 3:
+                await fast.get()
+        self.assertTrue(slow.evicted)
+        self.assertListEqual(await slow.get(), [])
+        self.assertFalse(fast.evicted)
+        self.assertEqual(len(self.broker), 1)
+
+    async def test_should_resume_from_last_event_id(self):
+        for i in range(6):
+            self.broker.publish("create", str(i))
+        s = self.broker.subscribe(last_event_id=3)
+        self.assertEqual([e.id for e in await s.get()], [4, 5, 6])
+
+        s = self.broker.subscribe(last_event_id=6)
+        self.broker.publish("create", "7")
+        self.assertEqual([e.id for e in await s.get()], [7])
+
+    async def test_should_only_make_room_for_replayed_events_once(self):
+        for i in range(4):
+            self.broker.publish("create", str(i))
+        s = self.broker.subscribe(last_event_id=0)
+        self.broker.publish("create", "4")
+        self.assertEqual([e.id for e in await s.get()], [1, 2, 3, 4, 5])
+        for i in range(4):
+            self.broker.publish("create", str(i))
+        self.assertTrue(s.evicted)
+
+    async def test_should_reset_when_events_are_no_longer_kept(self):
+        for i in range(6):
+            self.broker.publish("create", str(i))
+        for last_event_id in (1, 99):
+            s = self.broker.subscribe(last_event_id=last_event_id)
+            events = await s.get()
+            self.assertEqual([e.type for e in events], [Broker.RESET])
+            self.assertEqual(events[0].id, 6)
+
+    async def test_should_stop_on_close(self):
+        s = self.broker.subscribe()
+        task = asyncio.create_task(s.get())
+        await asyncio.sleep(0)
+        s.close()
+        self.assertListEqual(await task, [])
+        self.assertEqual(len(self.broker), 0)
+
+    async def test_should_filter_events_by_topic(self):
+        every = self.broker.subscribe()
+        gym = self.broker.subscribe(topic="1")
+        self.broker.publish("create", "a", topic="1")
+        self.broker.publish("create", "b", topic="2")
+        self.broker.publish("create", "c")
+        self.assertListEqual(
+            [e.data for e in await every.get()], ["a", "b", "c"]
+        )
+        self.assertListEqual([e.data for e in await gym.get()], ["a", "c"])
+
+        s = self.broker.subscribe(last_event_id=0, topic="2")
+        self.assertListEqual([e.data for e in await s.get()], ["b", "c"])
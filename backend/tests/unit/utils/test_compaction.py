@@ -0,0 +1,84 @@
+import unittest
+from datetime import UTC, datetime, timedelta
+
+from src.utils.compaction import OffPeakWindow, TombstoneCompactor
+
+
+class TestOffPeakWindow(unittest.TestCase):
+    def test_should_parse_windows(self):
+        self.assertEqual(OffPeakWindow.parse("2-5"), OffPeakWindow(2, 5))
+        self.assertIsNone(OffPeakWindow.parse(" "))
+        for text in ("2", "a-b", "2-24", "0-0"):
+            with self.assertRaises(ValueError):
+                OffPeakWindow.parse(text)
+
+    def test_should_contain_hours_of_the_window(self):
+        def at(hour: int) -> datetime:
+            return datetime(2024, 1, 1, hour, 30, tzinfo=UTC)
+
+        window = OffPeakWindow(2, 5)
+        self.assertListEqual(
+            [h for h in range(24) if window.contains(at(h))], [2, 3, 4]
+        )
+        window = OffPeakWindow(22, 1)
+        self.assertListEqual(
+            [h for h in range(24) if window.contains(at(h))], [0, 22, 23]
+        )
+
+
+class TestTombstoneCompactor(unittest.IsolatedAsyncioTestCase):
+    now: datetime
+    tombstones: list[int]
+    calls: list[tuple[datetime, int]]
+
+    def setUp(self) -> None:
+        self.now = datetime(2024, 1, 1, 3, tzinfo=UTC)
+        self.tombstones = list(range(5))
+        self.calls = []
+
+    def _purge(self, before: datetime, limit: int) -> list[int]:
+        self.calls.append((before, limit))
+        purged = self.tombstones[:limit]
+        del self.tombstones[:limit]
+        return purged
+
+    def _compactor(self, **kwargs) -> TombstoneCompactor:
+        return TombstoneCompactor(
+            self._purge,
+            timedelta(days=1),
+            OffPeakWindow(2, 5),
+            batch_size=2,
+            pause=0,
+            clock=lambda: self.now,
+            **kwargs,
+        )
+
+    async def test_should_purge_in_batches(self):
+        compactor = self._compactor()
+        self.assertEqual(await compactor.compact(), 5)
+        self.assertListEqual(
+            self.calls, [(self.now - timedelta(days=1), 2)] * 3
+        )
+        self.assertEqual(compactor.purged, 5)
+        self.assertEqual(await compactor.compact(), 0)
+
+    async def test_should_only_purge_in_the_window(self):
+        self.now = self.now.replace(hour=12)
+        self.assertEqual(await self._compactor().compact(), 0)
+        self.assertListEqual(self.calls, [])
+
+    async def test_should_stop_when_the_window_ends(self):
+        def purge(before: datetime, limit: int) -> list[int]:
+            self.now = self.now.replace(hour=5)
+            return self._purge(before, limit)
+
+        compactor = self._compactor()
+        compactor._purge = purge
+        self.assertEqual(await compactor.compact(), 2)
+        self.assertListEqual(self.tombstones, [2, 3, 4])
+
+    async def test_should_run_in_the_background(self):
+        compactor = self._compactor()
+        compactor.start()
+        await compactor.stop()
+        self.assertIsNone(compactor._task)
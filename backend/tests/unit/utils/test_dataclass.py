@@ -8,6 +8,7 @@ from src.utils.dataclass import (
     FieldError,
     SerializeDataclass,
     ValidationError,
+    set_fail_fast,
     validate_dataclass,
 )
 
@@ -444,6 +445,38 @@ class TestValidateDataclass(unittest.TestCase):
         Boss("", 23)
 
 
+class TestFailFastValidation(unittest.TestCase):
+    def tearDown(self) -> None:
+        set_fail_fast(False)
+
+    def test_should_stop_at_first_error(self):
+        age_validation = MagicMock(return_value=False)
+
+        @validate_dataclass
+        @dataclass
+        class Person:
+            name: str
+            age: int
+
+            def __validate_name__(self, name: str, value: str) -> bool:
+                return False
+
+            def __validate_age__(*args, **kwargs):
+                return age_validation(*args, **kwargs)
+
+        with self.assertRaises(ValidationError) as e:
+            Person("", 23)
+        self.assertEqual(len(e.exception.errors), 2)
+
+        age_validation.reset_mock()
+        set_fail_fast(True)
+        with self.assertRaises(ValidationError) as e:
+            Person("", 23)
+        self.assertEqual(len(e.exception.errors), 1)
+        self.assertEqual(e.exception.errors[0].name, "name")
+        age_validation.assert_not_called()
+
+
 class TestSerializeDataclass(unittest.TestCase):
     def test_should_transform_to_dict(self):
         @dataclass
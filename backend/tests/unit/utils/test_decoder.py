@@ -0,0 +1,104 @@
+import unittest
+from dataclasses import dataclass, field
+from datetime import date
+
+from src.models.user import UserCreateBody, UserUpdate
+from src.utils.dataclass import (
+    FieldError,
+    ValidationError,
+    set_fail_fast,
+    validate_dataclass,
+)
+from src.utils.decoder import Decoder, compile_decoder
+
+
+@validate_dataclass
+@dataclass
+class Person:
+    name: str
+    age: int = 0
+    tags: list[str] = field(default_factory=list)
+
+    def __validate_name__(self, name: str, value: str) -> bool:
+        if not value:
+            raise FieldError(name, value, "name is required")
+        self.name = value.strip()
+        return True
+
+    def __validate_age__(self, name: str, value: int) -> bool:
+        return isinstance(value, int) and value >= 0
+
+
+class TestDecoder(unittest.TestCase):
+    def tearDown(self) -> None:
+        set_fail_fast(False)
+
+    def errors(self, data: bytes) -> list[tuple[str, str | None]]:
+        with self.assertRaises(ValidationError) as e:
+            Decoder(Person).decode(data)
+        self.assertEqual(e.exception.cls_name, "Person")
+        return [(f.name, f.reason) for f in e.exception.errors]
+
+    def test_should_decode_and_validate(self):
+        person = Decoder(Person).decode(b'{"name": " Ana ", "age": 23}')
+        self.assertEqual(person, Person("Ana", 23))
+
+    def test_should_fill_defaults(self):
+        decoder = Decoder(Person)
+        first = decoder.decode('{"name": "Ana"}')
+        second = decoder.decode('{"name": "Bia"}')
+        self.assertEqual(first, Person("Ana"))
+        self.assertIsNot(first.tags, second.tags)
+
+    def test_should_report_every_error_together(self):
+        self.assertListEqual(
+            self.errors(b'{"age": -1, "extra": 1, "other": 2}'),
+            [
+                ("name", "field is required"),
+                ("age", None),
+                ("extra", "unknown field"),
+                ("other", "unknown field"),
+            ],
+        )
+
+    def test_should_report_only_first_error_on_fail_fast(self):
+        set_fail_fast(True)
+        self.assertListEqual(
+            self.errors(b'{"age": -1, "extra": 1}'),
+            [("name", "field is required")],
+        )
+        self.assertListEqual(
+            self.errors(b'{"name": "Ana", "extra": 1}'),
+            [("extra", "unknown field")],
+        )
+
+    def test_should_reject_invalid_bodies(self):
+        for data in (b"", b"{", b"\xff", b"[]", b'"name"', b"null"):
+            with self.subTest(data=data):
+                errors = self.errors(data)
+                self.assertEqual(len(errors), 1)
+                self.assertEqual(errors[0][0], "body")
+
+    def test_should_reject_non_dataclasses(self):
+        with self.assertRaises(ValueError):
+            Decoder(int)
+
+    def test_should_decode_user_models(self):
+        body = {
+            "username": "username",
+            "name": "name",
+            "date_of_birth": "1990-09-09",
+            "role": "STAFF",
+        }
+        self.assertEqual(
+            compile_decoder(UserUpdate).decode_obj(body),
+            UserUpdate(**body),
+        )
+        user = compile_decoder(UserCreateBody).decode_obj(
+            {**body, "password": "password"}
+        )
+        self.assertEqual(user.date_of_birth, date(1990, 9, 9))
+        self.assertEqual(user.role, "staff")
+        self.assertIs(
+            compile_decoder(UserCreateBody), compile_decoder(UserCreateBody)
+        )
@@ -0,0 +1,21 @@
+import json
+import unittest
+from datetime import date
+
+from src.utils.encoding import dump_json, join_json_array
+
+
+class TestEncoding(unittest.TestCase):
+    def test_should_dump_compact_json(self):
+        self.assertEqual(
+            dump_json({"name": "João", "born": date(1999, 9, 9)}),
+            '{"name":"João","born":"1999-09-09"}',
+        )
+        with self.assertRaises(ValueError):
+            dump_json(float("nan"))
+
+    def test_should_join_fragments_as_dump_json(self):
+        values = [{"id": 1}, {"id": 2}]
+        fragments = [dump_json(v).encode() for v in values]
+        self.assertEqual(join_json_array(fragments), dump_json(values).encode())
+        self.assertEqual(json.loads(join_json_array([])), [])
@@ -0,0 +1,37 @@
+import unittest
+from datetime import date
+
+from src.utils.export import csv_cell, iter_csv
+
+
+class TestIterCsv(unittest.TestCase):
+    def test_should_encode_rows_in_chunks(self):
+        rows = [[1, "Ann, Doe", date(1999, 9, 9)], [2, 'Bo "B"', None]]
+        chunks = list(iter_csv(["id", "name", "born"], rows, rows_per_chunk=2))
+        self.assertListEqual(
+            chunks,
+            [
+                b'id,name,born\r\n1,"Ann, Doe",1999-09-09\r\n',
+                b'2,"Bo ""B""",\r\n',
+            ],
+        )
+
+    def test_should_only_hold_one_chunk(self):
+        consumed = 0
+
+        def rows():
+            nonlocal consumed
+            for i in range(10):
+                consumed += 1
+                yield [i]
+
+        chunks = iter_csv(["id"], rows(), rows_per_chunk=3)
+        next(chunks)
+        self.assertEqual(consumed, 2)
+        self.assertEqual(len(list(chunks)), 3)
+
+    def test_should_escape_formulas(self):
+        self.assertEqual(csv_cell("=1+1"), "'=1+1")
+        self.assertEqual(csv_cell("@cmd"), "'@cmd")
+        self.assertEqual(csv_cell("Ann"), "Ann")
+        self.assertEqual(csv_cell(-1), -1)
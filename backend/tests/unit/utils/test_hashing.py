@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import unittest
+
+from argon2 import PasswordHasher
+
+from src.utils.hashing import PasswordHashingPool
+
+
+class BlockedHasher(PasswordHasher):
+    # Hashes only once released, so pending passwords can be counted
+    released: threading.Event
+
+    def __init__(self) -> None:
+        super().__init__(time_cost=1, memory_cost=64)
+        self.released = threading.Event()
+
+    def hash(self, password: str | bytes, *, salt: bytes | None = None) -> str:
+        self.released.wait(5)
+        return super().hash(password, salt=salt)
+
+
+class TestPasswordHashingPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.pool = PasswordHashingPool(
+            PasswordHasher(time_cost=1, memory_cost=64), workers=2
+        )
+
+    def tearDown(self) -> None:
+        self.pool.close()
+
+    async def test_should_hash_off_the_event_loop(self):
+        hashes = await asyncio.gather(
+            *(self.pool.hash(f"password{i}") for i in range(4))
+        )
+        for i, h in enumerate(hashes):
+            self.assertTrue(self.pool.hasher.verify(h, f"password{i}"))
+        self.assertEqual(self.pool.pending, 0)
+
+    async def test_should_start_every_worker_on_warm_up(self):
+        self.assertEqual(await self.pool.warm(), 2)
+        self.assertEqual(len(self.pool._executor._threads), 2)
+        self.assertEqual(self.pool.pending, 0)
+
+    async def test_should_count_pending_passwords(self):
+        hasher = BlockedHasher()
+        self.pool.close()
+        self.pool = PasswordHashingPool(hasher, workers=2)
+        tasks = [asyncio.create_task(self.pool.hash("password")) for _ in "abc"]
+        await asyncio.sleep(0)
+        self.assertEqual(self.pool.pending, 3)
+        hasher.released.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.pool.pending, 0)
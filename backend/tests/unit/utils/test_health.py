@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from src.utils.health import HealthMonitor
+
+
+class TestHealthMonitor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.now = 100.0
+        self.monitor = HealthMonitor(
+            interval=1, timeout=0.05, clock=lambda: self.now
+        )
+
+    async def test_should_not_be_ready_before_checks_run(self):
+        async def ok() -> str:
+            return "fine"
+
+        self.monitor.add("ok", ok)
+        self.assertFalse(self.monitor.ready)
+        results = await self.monitor.run_checks()
+        self.assertTrue(results["ok"].ok)
+        self.assertEqual(results["ok"].detail, "fine")
+        self.assertTrue(self.monitor.ready)
+
+    async def test_should_report_failing_checks(self):
+        async def broken() -> None:
+            raise RuntimeError("down")
+
+        async def slow() -> None:
+            await asyncio.sleep(1)
+
+        self.monitor.add("broken", broken)
+        self.monitor.add("slow", slow)
+        results = await self.monitor.run_checks()
+        self.assertEqual(results["broken"].detail, "down")
+        self.assertFalse(results["slow"].ok)
+        self.assertIn("timed out", results["slow"].detail)  # type: ignore
+        self.assertFalse(self.monitor.ready)
+
+    async def test_should_not_be_ready_with_stale_results(self):
+        async def ok() -> None:
+            return None
+
+        self.monitor.add("ok", ok)
+        await self.monitor.run_checks()
+        self.now += 3.5
+        self.assertFalse(self.monitor.ready)
+
+    async def test_should_check_loop_lag(self):
+        check = self.monitor.loop_lag_check(0.5)
+        self.assertEqual(await check(), "0.000s")
+        self.monitor.loop_lag = 0.6
+        with self.assertRaises(RuntimeError):
+            await check()
+
+    async def test_should_run_checks_in_background(self):
+        monitor = HealthMonitor(interval=0.01)
+        runs = 0
+
+        async def count() -> None:
+            nonlocal runs
+            runs += 1
+
+        monitor.add("count", count)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        self.assertGreater(runs, 1)
+        self.assertTrue(monitor.ready)
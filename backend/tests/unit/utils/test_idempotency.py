@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from starlette.responses import JSONResponse, Response
+
+from src.utils.idempotency import (
+    REPLAYED_HEADER,
+    IdempotencyKeyReusedError,
+    IdempotencyStore,
+    fingerprint,
+)
+
+
+class TestIdempotencyStore(unittest.IsolatedAsyncioTestCase):
+    now: float
+
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.store = IdempotencyStore(2, 10, clock=lambda: self.now)
+        self.response = JSONResponse(
+            {"id": 1}, status_code=201, headers={"ETag": '"1"'}
+        )
+        self.handler = AsyncMock(return_value=self.response)
+
+    async def test_should_replay_response_byte_for_byte(self):
+        first = await self.store.run("key", "a", self.handler)
+        self.assertIs(first, self.response)
+        self.assertNotIn(REPLAYED_HEADER, first.headers)
+
+        replay = await self.store.run("key", "a", self.handler)
+        self.handler.assert_awaited_once()
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.body, self.response.body)
+        self.assertEqual(replay.headers[REPLAYED_HEADER], "true")
+        self.assertListEqual(
+            replay.raw_headers[:-1], list(self.response.raw_headers)
+        )
+
+    async def test_should_reject_key_reused_for_another_request(self):
+        await self.store.run("key", "a", self.handler)
+        with self.assertRaises(IdempotencyKeyReusedError):
+            await self.store.run("key", "b", self.handler)
+        self.handler.assert_awaited_once()
+
+    async def test_should_expire_and_evict_responses(self):
+        await self.store.run("k1", "a", self.handler)
+        self.now = 10
+        await self.store.run("k1", "a", self.handler)
+        self.assertEqual(self.handler.await_count, 2)
+
+        await self.store.run("k2", "a", self.handler)
+        await self.store.run("k3", "a", self.handler)
+        self.assertEqual(len(self.store), 2)
+        await self.store.run("k1", "a", self.handler)
+        self.assertEqual(self.handler.await_count, 5)
+
+    async def test_should_not_store_server_errors(self):
+        self.handler.return_value = Response(status_code=503)
+        await self.store.run("key", "a", self.handler)
+        await self.store.run("key", "a", self.handler)
+        self.assertEqual(self.handler.await_count, 2)
+        self.assertEqual(len(self.store), 0)
+
+    async def test_should_wait_for_request_in_flight(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def handler() -> Response:
+            started.set()
+            await release.wait()
+            return self.response
+
+        first = asyncio.create_task(self.store.run("key", "a", handler))
+        await started.wait()
+        retry = asyncio.create_task(self.store.run("key", "a", self.handler))
+        with self.assertRaises(IdempotencyKeyReusedError):
+            await self.store.run("key", "b", self.handler)
+        release.set()
+        await first
+        self.assertEqual((await retry).headers[REPLAYED_HEADER], "true")
+        self.handler.assert_not_awaited()
+
+    async def test_should_run_again_when_request_in_flight_fails(self):
+        started = asyncio.Event()
+
+        async def handler() -> Response:
+            started.set()
+            await asyncio.sleep(0)
+            raise RuntimeError
+
+        first = asyncio.create_task(self.store.run("key", "a", handler))
+        await started.wait()
+        retry = await self.store.run("key", "a", self.handler)
+        self.assertIs(retry, self.response)
+        with self.assertRaises(RuntimeError):
+            await first
+
+    def test_fingerprint_should_separate_parts(self):
+        self.assertNotEqual(fingerprint(b"ab", b"c"), fingerprint(b"a", b"bc"))
+        self.assertEqual(fingerprint(b"a"), fingerprint(b"a"))
@@ -0,0 +1,126 @@
+import json
+import logging
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.utils.log import (
+    BoundedQueueHandler,
+    ExceptionRateLimitFilter,
+    JsonFormatter,
+    RequestIdFilter,
+    request_id,
+    start_queue_listener,
+)
+
+
+def _record(msg: str = "error") -> logging.LogRecord:
+    try:
+        raise ValueError(msg)
+    except ValueError:
+        exc_info = sys.exc_info()
+    return logging.LogRecord(
+        "test", logging.ERROR, __file__, 0, msg, None, exc_info
+    )
+
+
+class TestExceptionRateLimitFilter(unittest.TestCase):
+    def test_should_let_records_without_traceback_through(self):
+        f = ExceptionRateLimitFilter(rate=0, burst=0)
+        record = logging.LogRecord(
+            "test", logging.INFO, __file__, 0, "info", None, None
+        )
+        self.assertTrue(f.filter(record))
+        self.assertEqual(f.suppressed, 0)
+
+    @patch("src.utils.log.time.monotonic", return_value=0.0)
+    def test_should_drop_tracebacks_over_the_limit(self, monotonic):
+        f = ExceptionRateLimitFilter(rate=1, burst=2)
+        records = [_record() for _ in range(4)]
+        for r in records:
+            self.assertTrue(f.filter(r))
+        self.assertListEqual(
+            [r.exc_info is not None for r in records],
+            [True, True, False, False],
+        )
+        self.assertEqual(f.suppressed, 2)
+
+        monotonic.return_value = 1.0
+        record = _record("again")
+        self.assertTrue(f.filter(record))
+        self.assertIsNotNone(record.exc_info)
+        self.assertEqual(record.getMessage(), "again [2 tracebacks suppressed]")
+        self.assertEqual(f.suppressed, 0)
+
+
+class TestBoundedQueueHandler(unittest.TestCase):
+    def test_should_drop_records_when_full(self):
+        handler = BoundedQueueHandler(maxsize=2)
+        for i in range(4):
+            handler.handle(_record(f"error {i}"))
+        self.assertEqual(handler.dropped, 2)
+
+        handler.queue.get_nowait()
+        handler.handle(_record("last"))
+        self.assertEqual(handler.dropped, 0)
+        handler.queue.get_nowait()
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "last [2 records dropped]")
+
+    def test_should_keep_traceback_and_merge_arguments(self):
+        handler = BoundedQueueHandler()
+        original = _record()
+        original.msg, original.args = "error %d", (23,)
+        handler.handle(original)
+
+        record = handler.queue.get_nowait()
+        self.assertIsNot(record, original)
+        self.assertEqual(record.msg, "error 23")
+        self.assertIsNone(record.args)
+        self.assertIs(record.exc_info, original.exc_info)
+
+    def test_should_block_until_there_is_room(self):
+        handler = BoundedQueueHandler(maxsize=1, policy="block")
+        target = MagicMock(spec=logging.Handler, level=logging.NOTSET)
+        for i in range(3):
+            handler.handle(_record(f"error {i}"))
+            if i == 0:
+                listener = start_queue_listener(handler, target)
+        listener.stop()
+        self.assertEqual(handler.dropped, 0)
+        self.assertListEqual(
+            [c.args[0].getMessage() for c in target.handle.call_args_list],
+            ["error 0", "error 1", "error 2"],
+        )
+
+    def test_should_reject_unknown_policies(self):
+        with self.assertRaises(ValueError):
+            BoundedQueueHandler(policy="wait")
+
+
+class TestRequestIdFilter(unittest.TestCase):
+    def test_should_tag_records_with_request_id(self):
+        f = RequestIdFilter()
+        record = _record()
+        self.assertTrue(f.filter(record))
+        self.assertEqual(record.request_id, "-")
+
+        token = request_id.set("abc")
+        try:
+            self.assertTrue(f.filter(record))
+        finally:
+            request_id.reset(token)
+        self.assertEqual(record.request_id, "abc")
+
+
+class TestJsonFormatter(unittest.TestCase):
+    def test_should_format_record_as_json(self):
+        record = _record("error %s")
+        record.args = ("here",)
+        record.request_id = "abc"
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "error here")
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["logger"], "test")
+        self.assertEqual(entry["request_id"], "abc")
+        self.assertIn("ValueError: error %s", entry["exc_info"])
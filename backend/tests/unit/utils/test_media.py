@@ -0,0 +1,79 @@
+import unittest
+from datetime import date
+
+from src.utils.media import (
+    JSON,
+    MSGPACK,
+    UnsupportedMediaTypeError,
+    body_media_type,
+    dump_msgpack,
+    load_msgpack,
+    msgpack_available,
+    negotiate,
+)
+
+
+@unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+class TestNegotiate(unittest.TestCase):
+    def test_should_pick_msgpack_when_preferred(self):
+        for accept in (
+            "application/msgpack",
+            "application/x-msgpack",
+            "application/vnd.msgpack",
+            "application/msgpack, */*",
+            "application/json;q=0.5, application/msgpack",
+            "application/*, application/MsgPack;q=1",
+        ):
+            with self.subTest(accept=accept):
+                self.assertEqual(negotiate(accept), MSGPACK)
+
+    def test_should_pick_json_otherwise(self):
+        for accept in (
+            None,
+            "",
+            "*/*",
+            "application/json",
+            "application/msgpack, application/json",
+            "application/msgpack;q=0.5, application/json",
+            "application/msgpack;q=0",
+            "application/msgpack;q=oops",
+            "text/html",
+        ):
+            with self.subTest(accept=accept):
+                self.assertEqual(negotiate(accept), JSON)
+
+
+@unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+class TestBodyMediaType(unittest.TestCase):
+    def test_should_read_msgpack_bodies(self):
+        for content_type in ("application/msgpack", "application/x-msgpack"):
+            with self.subTest(content_type=content_type):
+                self.assertEqual(body_media_type(content_type), MSGPACK)
+
+    def test_should_read_other_bodies_as_json(self):
+        for content_type in (None, "application/json", "text/plain"):
+            with self.subTest(content_type=content_type):
+                self.assertEqual(body_media_type(content_type), JSON)
+
+
+@unittest.skipIf(msgpack_available(), "msgpack is installed")
+class TestWithoutMsgpack(unittest.TestCase):
+    def test_should_only_speak_json(self):
+        self.assertEqual(negotiate("application/msgpack"), JSON)
+        with self.assertRaises(UnsupportedMediaTypeError):
+            body_media_type("application/msgpack")
+
+
+@unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+class TestMsgpack(unittest.TestCase):
+    def test_should_encode_dates_as_str(self):
+        content = {"date_of_birth": date(1990, 1, 2), "id": 1, "ok": None}
+        self.assertDictEqual(
+            load_msgpack(dump_msgpack(content)),
+            {"date_of_birth": "1990-01-02", "id": 1, "ok": None},
+        )
+
+    def test_should_reject_invalid_values(self):
+        for data in (b"", b"\xc1", dump_msgpack(1) + b"\x02"):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                load_msgpack(data)
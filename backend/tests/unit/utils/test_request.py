@@ -0,0 +1,156 @@
+import json
+import unittest
+from typing import Any
+
+from starlette.requests import Request
+
+from src.utils.media import dump_msgpack, msgpack_available
+from src.utils.request import (
+    BodyTooLargeError,
+    InvalidJsonArrayError,
+    iter_json_array,
+    iter_msgpack_array,
+    read_body,
+)
+
+
+def make_request(
+    chunks: list[bytes], content_length: int | None = None
+) -> tuple[Request, list[bytes]]:
+    """Returns a request streaming the chunks and the chunks not read."""
+    pending = list(chunks)
+
+    async def receive() -> dict[str, Any]:
+        body = pending.pop(0) if pending else b""
+        return {
+            "type": "http.request",
+            "body": body,
+            "more_body": bool(pending),
+        }
+
+    headers = []
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    scope = {"type": "http", "method": "POST", "headers": headers}
+    return Request(scope, receive), pending
+
+
+def split(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestReadBody(unittest.IsolatedAsyncioTestCase):
+    async def test_should_read_body(self):
+        req, _ = make_request([b"abc", b"def"])
+        self.assertEqual(await read_body(req, 6), b"abcdef")
+
+    async def test_should_stop_reading_when_too_large(self):
+        req, pending = make_request([b"abc", b"def", b"ghi", b"jkl"])
+        with self.assertRaises(BodyTooLargeError) as e:
+            await read_body(req, 5)
+        self.assertEqual(e.exception.limit, 5)
+        self.assertListEqual(pending, [b"ghi", b"jkl"])
+
+    async def test_should_reject_announced_size_before_reading(self):
+        req, pending = make_request([b"abc", b"def"], content_length=6)
+        with self.assertRaises(BodyTooLargeError):
+            await read_body(req, 5)
+        self.assertListEqual(pending, [b"abc", b"def"])
+
+
+class TestIterJsonArray(unittest.IsolatedAsyncioTestCase):
+    async def items(
+        self, chunks: list[bytes], max_size: int = 1024, max_item: int = 256
+    ) -> list[Any]:
+        req, _ = make_request(chunks)
+        return [i async for i in iter_json_array(req, max_size, max_item)]
+
+    async def test_should_parse_items_split_anywhere(self):
+        items = [{"name": "ação", "n": [1, 2]}, 12345, "a,b]", None, 1.5e3]
+        data = json.dumps(items, ensure_ascii=False, indent=1).encode()
+        for size in (1, 2, 3, 7, len(data)):
+            with self.subTest(size=size):
+                self.assertListEqual(await self.items(split(data, size)), items)
+
+    async def test_should_parse_empty_array(self):
+        self.assertListEqual(await self.items([b" [ ", b" ] "]), [])
+
+    async def test_should_reject_invalid_arrays(self):
+        tests = (
+            (b"", 0),
+            (b'{"a": 1}', 0),
+            (b"[1, 2", 2),
+            (b"[1, 2,]", 2),
+            (b"[1 2]", 1),
+            (b"[1, {]", 1),
+            (b"[1] 2", 1),
+            (b'["\xff"]', 0),
+        )
+        for data, index in tests:
+            with (
+                self.subTest(data=data),
+                self.assertRaises(InvalidJsonArrayError) as e,
+            ):
+                await self.items(split(data, 2))
+            self.assertEqual(e.exception.index, index)
+
+    async def test_should_limit_item_size(self):
+        data = json.dumps(["x" * 10, "y" * 100]).encode()
+        with self.assertRaises(InvalidJsonArrayError) as e:
+            await self.items(split(data, 8), max_item=50)
+        self.assertEqual(e.exception.index, 1)
+
+    async def test_should_limit_body_size(self):
+        data = json.dumps(list(range(100))).encode()
+        with self.assertRaises(BodyTooLargeError):
+            await self.items(split(data, 8), max_size=100)
+
+
+@unittest.skipUnless(msgpack_available(), "msgpack is not installed")
+class TestIterMsgpackArray(unittest.IsolatedAsyncioTestCase):
+    async def items(
+        self, chunks: list[bytes], max_size: int = 1024, max_item: int = 256
+    ) -> list[Any]:
+        req, _ = make_request(chunks)
+        return [i async for i in iter_msgpack_array(req, max_size, max_item)]
+
+    async def test_should_parse_items_split_anywhere(self):
+        items = [{"name": "ação", "n": [1, 2]}, 12345, "a,b]", None, 1.5e3]
+        data = dump_msgpack(items)
+        for size in (1, 2, 3, 7, len(data)):
+            with self.subTest(size=size):
+                self.assertListEqual(await self.items(split(data, size)), items)
+
+    async def test_should_parse_empty_array(self):
+        self.assertListEqual(await self.items([dump_msgpack([])]), [])
+
+    async def test_should_reject_invalid_arrays(self):
+        tests = (
+            (b"", 0),
+            (dump_msgpack({"a": 1}), 0),
+            (dump_msgpack([1, 2])[:-1], 1),
+            (b"\x92\x01\xc1", 1),
+            (dump_msgpack([1]) + b"\x02", 1),
+        )
+        for data, index in tests:
+            with (
+                self.subTest(data=data),
+                self.assertRaises(InvalidJsonArrayError) as e,
+            ):
+                await self.items(split(data, 2))
+            self.assertEqual(e.exception.index, index)
+
+    async def test_should_limit_item_size(self):
+        data = dump_msgpack(["x" * 10, "y" * 100])
+        for size in (8, len(data)):
+            with (
+                self.subTest(size=size),
+                self.assertRaises(InvalidJsonArrayError) as e,
+            ):
+                await self.items(split(data, size), max_item=50)
+            self.assertEqual(e.exception.index, 1)
+
+    async def test_should_limit_body_size(self):
+        data = dump_msgpack(list(range(100, 200)))
+        with self.assertRaises(BodyTooLargeError):
+            await self.items(split(data, 8), max_size=100)
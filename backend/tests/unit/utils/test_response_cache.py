@@ -0,0 +1,139 @@
+import gzip
+import unittest
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+
+from src.utils.response_cache import (
+    RenderedResponseCache,
+    accepts_gzip,
+    etag_matches,
+)
+
+
+class TestEtagMatches(unittest.TestCase):
+    def test_should_compare_weakly(self):
+        self.assertTrue(etag_matches('"1-a"', 'W/"1-a"'))
+        self.assertTrue(etag_matches('"0-b", W/"1-a"', 'W/"1-a"'))
+        self.assertTrue(etag_matches("*", 'W/"1-a"'))
+        self.assertFalse(etag_matches("*", 'W/"1-a"', wildcard=False))
+        self.assertFalse(etag_matches('W/"2-a"', 'W/"1-a"'))
+        self.assertFalse(etag_matches(None, 'W/"1-a"'))
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    def test_should_read_accept_encoding(self):
+        self.assertTrue(accepts_gzip(Headers({"accept-encoding": "br, gzip"})))
+        self.assertFalse(accepts_gzip(Headers({"accept-encoding": "gzip;q=0"})))
+        self.assertFalse(accepts_gzip(Headers({"accept-encoding": "br"})))
+        self.assertFalse(accepts_gzip(Headers()))
+
+
+class TestRenderedResponseCache(unittest.TestCase):
+    cache: RenderedResponseCache
+    renders: int
+
+    def setUp(self) -> None:
+        self.cache = RenderedResponseCache(max_entries=2, gzip_min_size=64)
+        self.renders = 0
+
+    def _render(self, content: object = None) -> Response:
+        self.renders += 1
+        return JSONResponse({"users": content or ["a"] * 50})
+
+    def _respond(
+        self, generation: int, key: str = "k", **headers: str
+    ) -> Response:
+        return self.cache.respond(
+            generation, key, Headers(headers), self._render
+        )
+
+    def test_should_render_once_per_generation(self):
+        first = self._respond(1)
+        second = self._respond(1)
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.headers["etag"], second.headers["etag"])
+        self.assertEqual(first.media_type, "application/json")
+        third = self._respond(2)
+        self.assertEqual(self.renders, 2)
+        self.assertNotEqual(first.headers["etag"], third.headers["etag"])
+
+    def test_should_keep_keys_apart(self):
+        a = self._respond(1, "a")
+        b = self._respond(1, "b")
+        self.assertEqual(self.renders, 2)
+        self.assertNotEqual(a.headers["etag"], b.headers["etag"])
+
+    def test_should_not_modify_for_current_etag(self):
+        etag = self._respond(1).headers["etag"]
+        response = self._respond(1, **{"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.body, b"")
+        self.assertEqual(self.renders, 1)
+        response = self._respond(2, **{"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_should_serve_gzip(self):
+        plain = self._respond(1)
+        response = self._respond(1, **{"accept-encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.media_type, "application/json")
+        self.assertEqual(gzip.decompress(response.body), plain.body)
+        self.assertEqual(self.renders, 1)
+
+    def test_should_not_compress_small_bodies(self):
+        response = self.cache.respond(
+            1, "k", Headers({"accept-encoding": "gzip"}), lambda: Response("")
+        )
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_should_not_cache_errors(self):
+        def render() -> Response:
+            self.renders += 1
+            return Response(status_code=400)
+
+        for _ in range(2):
+            response = self.cache.respond(1, "k", Headers(), render)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_should_only_match_etags_of_rendered_bodies(self):
+        def render() -> Response:
+            self.renders += 1
+            return Response(status_code=400)
+
+        response = self.cache.respond(
+            1, "k", Headers({"if-none-match": "*"}), render
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self._respond(1, **{"if-none-match": "*"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.renders, 2)
+
+    def test_should_turn_off_without_entries(self):
+        self.cache = RenderedResponseCache(max_entries=0)
+        etag = self.cache.etag(1, "k")
+        response = self._respond(1, **{"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("etag", response.headers)
+        self._respond(1)
+        self.assertEqual(self.renders, 2)
+
+    def test_should_drop_least_recently_used(self):
+        for key in ("a", "b", "a", "c"):
+            self._respond(1, key)
+        self.assertEqual(self.renders, 3)
+        self._respond(1, "a")
+        self.assertEqual(self.renders, 3)
+        self._respond(1, "b")
+        self.assertEqual(self.renders, 4)
+
+    def test_should_not_cache_older_generations(self):
+        self._respond(2)
+        self._respond(1)
+        self._respond(1)
+        self.assertEqual(self.renders, 3)
+        self._respond(2)
+        self.assertEqual(self.renders, 3)
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from src.utils.singleflight import SingleFlight, SingleFlightStats
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    flight: SingleFlight[int]
+    calls: int
+    released: asyncio.Event
+
+    def setUp(self) -> None:
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.released = asyncio.Event()
+
+    async def _call(self) -> int:
+        self.calls += 1
+        await self.released.wait()
+        return self.calls
+
+    async def test_should_coalesce_concurrent_calls(self):
+        tasks = [
+            asyncio.create_task(self.flight.do("a", self._call))
+            for _ in range(3)
+        ]
+        other = asyncio.create_task(self.flight.do("b", self._call))
+        await asyncio.sleep(0)
+        self.assertEqual(self.flight.stats, SingleFlightStats(4, 2, 2))
+        self.released.set()
+        self.assertEqual(len(set(await asyncio.gather(*tasks))), 1)
+        await other
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.stats.in_flight, 0)
+
+    async def test_should_call_again_after_landing(self):
+        self.released.set()
+        self.assertEqual(await self.flight.do("a", self._call), 1)
+        self.assertEqual(await self.flight.do("a", self._call), 2)
+        self.assertEqual(self.flight.stats.coalesced, 0)
+
+    async def test_should_share_exceptions(self):
+        async def fail() -> int:
+            await self.released.wait()
+            raise ValueError("failed")
+
+        tasks = [
+            asyncio.create_task(self.flight.do("a", fail)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        self.released.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    async def test_should_keep_flying_when_a_caller_is_cancelled(self):
+        first = asyncio.create_task(self.flight.do("a", self._call))
+        second = asyncio.create_task(self.flight.do("a", self._call))
+        await asyncio.sleep(0)
+        first.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.released.set()
+        self.assertEqual(await second, 1)
@@ -2,7 +2,7 @@ import unittest
 from typing import Any
 from unittest.mock import MagicMock
 
-from src.utils.try_except import TryExcept
+from src.utils.try_except import LazyMessage, TryExcept
 
 
 class MockError(Exception):
@@ -101,3 +101,38 @@ class TestTryExcept(unittest.TestCase):
                 "error", 99, error="name", error_code=23
             )
             mock.assert_called_once_with(*exc_args, **exc_kwargs)
+
+    def test_should_format_lazy_message_with_call_arguments(self):
+        @TryExcept(MockError, LazyMessage("Error on {user_id} ({name})"))
+        def f(user_id: int, name: str = "default"):
+            raise Exception
+
+        with self.assertRaises(MockError) as e:
+            f(23)
+        e.exception.mock.assert_called_once_with("Error on 23 (default)")
+        with self.assertRaises(MockError) as e:
+            f(user_id=23, name="name")
+        e.exception.mock.assert_called_once_with("Error on 23 (name)")
+
+    def test_should_format_lazy_message_kwargs(self):
+        t = TryExcept(
+            MockError, msg=LazyMessage("Error on {} {user}", 23, user="name")
+        )
+        with self.assertRaises(MockError) as e, t:
+            raise Exception
+        e.exception.mock.assert_called_once_with(msg="Error on 23 name")
+
+    def test_should_keep_unknown_lazy_placeholders(self):
+        with (
+            self.assertRaises(MockError) as e,
+            TryExcept(MockError, LazyMessage("Error on {user_id}")),
+        ):
+            raise Exception
+        e.exception.mock.assert_called_once_with("Error on {user_id}")
+
+    def test_should_not_format_lazy_message_without_errors(self):
+        message = MagicMock(spec=LazyMessage)
+        t = TryExcept(MockError, message)
+        self.assertEqual(t(lambda x: x)(23), 23)
+        self.assertEqual(t(lambda x: x)(24), 24)
+        message.format.assert_not_called()
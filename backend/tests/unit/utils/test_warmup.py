@@ -0,0 +1,57 @@
+import itertools
+import logging
+import unittest
+
+from src.utils.warmup import WarmUp
+
+
+class TestWarmUp(unittest.IsolatedAsyncioTestCase):
+    async def test_should_run_steps_in_order_and_time_them(self):
+        ran: list[str] = []
+
+        def step(name: str, count: int):
+            async def run() -> int:
+                ran.append(name)
+                return count
+
+            return run
+
+        ticks = itertools.count()
+        warm_up = WarmUp(clock=lambda: float(next(ticks)))
+        warm_up.add("users", step("users", 10))
+        warm_up.add("codecs", step("codecs", 3))
+        with self.assertRaises(RuntimeError):
+            await warm_up.check()
+        result = await warm_up.run()
+        self.assertListEqual(ran, ["users", "codecs"])
+        self.assertDictEqual(result.counts, {"users": 10, "codecs": 3})
+        self.assertEqual(result.duration, 1.0)
+        self.assertEqual(await warm_up.check(), "done in 1.000s")
+
+    async def test_should_finish_when_a_step_fails(self):
+        async def fail() -> int:
+            raise RuntimeError("cold")
+
+        async def succeed() -> int:
+            return 1
+
+        warm_up = WarmUp()
+        warm_up.add("fail", fail)
+        warm_up.add("succeed", succeed)
+        with self.assertLogs(level=logging.ERROR):
+            result = await warm_up.run()
+        self.assertTupleEqual(result.failed, ("fail",))
+        self.assertDictEqual(result.counts, {"succeed": 1})
+        self.assertIs(warm_up.result, result)
+
+    async def test_should_call_then_after_warming_up_in_background(self):
+        warmed: list[bool] = []
+        warm_up = WarmUp()
+
+        async def then() -> None:
+            warmed.append(warm_up.result is not None)
+
+        warm_up.start(then)
+        await warm_up._task  # type: ignore
+        self.assertListEqual(warmed, [True])
+        await warm_up.stop()